@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+"""Runs the benchmarks.
+
+.. code-block:: sh
+
+    # only the cpu bound benchmarks
+    $ python -m benchmarks --output baseline.json
+    # also the ones that need a mongod, comparing with a baseline
+    $ python -m benchmarks --db --baseline baseline.json
+
+Exits with status 1 if a benchmark is slower than the baseline by more
+than ``--threshold``.
+"""
+
+import argparse
+import asyncio
+import sys
+from mongomotor import connect, disconnect
+from benchmarks import cases  # noqa f401 registers the benchmarks
+from benchmarks.models import WideDoc
+from benchmarks.runner import (compare, get_benchmarks, load,
+                               run_benchmarks, save)
+
+DB_NAME = 'mongomotor-benchmarks'
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('names', nargs='*',
+                        help='Run only the benchmarks starting with these')
+    parser.add_argument('--db', action='store_true',
+                        help='Also run the benchmarks that need a mongod')
+    parser.add_argument('--host', default='mongodb://localhost:27017',
+                        help='The mongod used by the db benchmarks')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--output', help='Save the results to this file')
+    parser.add_argument('--baseline',
+                        help='Compare the results with this file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Slowdown considered a regression, ie: 0.1')
+    return parser
+
+
+def report(name, result):
+    print('{:<32} {:>12.3f}ms {:>14.1f} ops/s'.format(
+        name, result['median'] * 1000, result['ops_per_sec']))
+
+
+async def run(benchmarks, args):
+    try:
+        return await run_benchmarks(benchmarks, repeat=args.repeat,
+                                    warmup=args.warmup, report=report)
+    finally:
+        if args.db:
+            await WideDoc._get_db().client.drop_database(DB_NAME)
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    benchmarks = get_benchmarks(args.names, db=args.db)
+    if args.db:
+        connect(db=DB_NAME, host=args.host)
+
+    try:
+        results = asyncio.run(run(benchmarks, args))
+    finally:
+        if args.db:
+            disconnect()
+
+    if args.output:
+        save(results, args.output)
+
+    if not args.baseline:
+        return 0
+
+    regressions = 0
+    print()
+    for item in compare(results, load(args.baseline), args.threshold):
+        regressions += item['regression']
+        print('{:<32} {:>+8.1%}{}'.format(
+            item['name'], item['change'],
+            '  REGRESSION' if item['regression'] else ''))
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
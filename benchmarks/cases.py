@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+"""The benchmarks. The ones that don't need a mongod only measure the cpu
+bound parts: creating documents, ``to_mongo``, ``_from_son`` and attaching
+the dereferenced documents."""
+
+from mongomotor.dereference import MongoMotorDeReference
+from benchmarks.models import (DeepDoc, RefsDoc, Target, WideDoc,
+                               deep_values, targets, wide_values)
+from benchmarks.runner import benchmark
+
+# How many times each cpu bound operation is done in a run.
+N = 1000
+# How many documents are inserted or read in a run.
+DOCS = 1000
+
+
+class InMemoryDeReference(MongoMotorDeReference):
+    """Dereferences using documents already in memory instead of
+    fetching them from the database."""
+
+    def __init__(self, documents):
+        super().__init__()
+        self._documents = {(d._get_collection_name(), d.pk): d
+                           for d in documents}
+
+    async def _fetch_objects(self, doc_type=None):
+        return self._documents
+
+
+def _repeat(fn, *args, n=N):
+    def run():
+        for _ in range(n):
+            fn(*args)
+    return run
+
+
+@benchmark('init.wide', ops=N)
+async def init_wide():
+    return _repeat(lambda values: WideDoc(**values), wide_values())
+
+
+@benchmark('init.deep', ops=N // 10)
+async def init_deep():
+    # deep_values creates the embedded documents, DeepDoc only
+    # assigns them.
+    return _repeat(lambda: DeepDoc(**deep_values()), n=N // 10)
+
+
+@benchmark('to_mongo.wide', ops=N)
+async def to_mongo_wide():
+    return _repeat(WideDoc(**wide_values()).to_mongo)
+
+
+@benchmark('to_mongo.deep', ops=N // 10)
+async def to_mongo_deep():
+    return _repeat(DeepDoc(**deep_values()).to_mongo, n=N // 10)
+
+
+@benchmark('from_son.wide', ops=N)
+async def from_son_wide():
+    son = WideDoc(**wide_values()).to_mongo()
+    return _repeat(WideDoc._from_son, son)
+
+
+@benchmark('from_son.deep', ops=N // 10)
+async def from_son_deep():
+    son = DeepDoc(**deep_values()).to_mongo()
+    return _repeat(DeepDoc._from_son, son, n=N // 10)
+
+
+@benchmark('from_son.list_refs', ops=N)
+async def from_son_list_refs():
+    son = RefsDoc(name='refs', targets=targets()).to_mongo()
+    return _repeat(RefsDoc._from_son, son)
+
+
+@benchmark('dereference.list_refs', ops=N // 10)
+async def dereference_list_refs():
+    refs = targets()
+    son = RefsDoc(name='refs', targets=refs).to_mongo()
+    dereference = InMemoryDeReference(refs)
+
+    async def run():
+        for _ in range(N // 10):
+            doc = RefsDoc._from_son(son)
+            await dereference(doc._data['targets'], max_depth=1,
+                              instance=doc, name='targets')
+
+    return run
+
+
+async def _reset(*documents):
+    for document in documents:
+        await document.drop_collection()
+
+
+@benchmark('db.insert.wide', ops=DOCS, needs_db=True)
+async def insert_wide():
+    await _reset(WideDoc)
+
+    async def run():
+        docs = [WideDoc(**wide_values(i)) for i in range(DOCS)]
+        await WideDoc.objects.insert(docs, load_bulk=False)
+
+    return run
+
+
+@benchmark('db.insert.wide_load_bulk', ops=DOCS, needs_db=True)
+async def insert_wide_load_bulk():
+    await _reset(WideDoc)
+
+    async def run():
+        docs = [WideDoc(**wide_values(i)) for i in range(DOCS)]
+        await WideDoc.objects.insert(docs)
+
+    return run
+
+
+@benchmark('db.iterate.wide', ops=DOCS, needs_db=True)
+async def iterate_wide():
+    await _reset(WideDoc)
+    await WideDoc.objects.insert(
+        [WideDoc(**wide_values(i)) for i in range(DOCS)], load_bulk=False)
+
+    async def run():
+        async for doc in WideDoc.objects:
+            pass
+
+    return run
+
+
+@benchmark('db.to_list.wide', ops=DOCS, needs_db=True)
+async def to_list_wide():
+    await _reset(WideDoc)
+    await WideDoc.objects.insert(
+        [WideDoc(**wide_values(i)) for i in range(DOCS)], load_bulk=False)
+
+    async def run():
+        await WideDoc.objects.to_list(length=None)
+
+    return run
+
+
+@benchmark('db.to_list.deep', ops=DOCS // 10, needs_db=True)
+async def to_list_deep():
+    await _reset(DeepDoc)
+    await DeepDoc.objects.insert(
+        [DeepDoc(**deep_values(i)) for i in range(DOCS // 10)],
+        load_bulk=False)
+
+    async def run():
+        await DeepDoc.objects.to_list(length=None)
+
+    return run
+
+
+@benchmark('db.dereference.list_refs', ops=DOCS // 10, needs_db=True)
+async def db_dereference_list_refs():
+    await _reset(Target, RefsDoc)
+    refs = targets()
+    await Target.objects.insert(refs, load_bulk=False)
+    await RefsDoc.objects.insert(
+        [RefsDoc(name='refs %d' % i, targets=refs)
+         for i in range(DOCS // 10)], load_bulk=False)
+
+    async def run():
+        for doc in await RefsDoc.objects.to_list(length=None):
+            await doc.targets
+
+    return run
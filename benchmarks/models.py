@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+"""The documents used by the benchmarks and the functions that create
+their data. The data is deterministic so the runs are comparable."""
+
+import datetime
+from bson import ObjectId
+from mongomotor import Document, EmbeddedDocument
+from mongomotor.fields import (DateTimeField, EmbeddedDocumentField,
+                               FloatField, IntField, ListField,
+                               ReferenceField, StringField)
+
+# How many fields of each type a wide document has.
+WIDE_GROUPS = 10
+# How many children each level of a deep document has.
+DEEP_BRANCHES = 4
+# How many references a document with a list of references has.
+REFS = 100
+
+_wide_fields = {'meta': {'collection': 'bench_wide'}}
+for i in range(WIDE_GROUPS):
+    _wide_fields['s%d' % i] = StringField()
+    _wide_fields['i%d' % i] = IntField()
+    _wide_fields['f%d' % i] = FloatField()
+    _wide_fields['d%d' % i] = DateTimeField()
+    _wide_fields['l%d' % i] = ListField(IntField())
+
+# A document with WIDE_GROUPS * 5 fields.
+WideDoc = type('WideDoc', (Document,), _wide_fields)
+
+
+class Leaf(EmbeddedDocument):
+    name = StringField()
+    value = IntField()
+    tags = ListField(StringField())
+
+
+class Branch(EmbeddedDocument):
+    name = StringField()
+    leaves = ListField(EmbeddedDocumentField(Leaf))
+
+
+class Trunk(EmbeddedDocument):
+    name = StringField()
+    branches = ListField(EmbeddedDocumentField(Branch))
+
+
+class DeepDoc(Document):
+    """A document with DEEP_BRANCHES ** 3 embedded leaves."""
+
+    name = StringField()
+    trunks = ListField(EmbeddedDocumentField(Trunk))
+
+    meta = {'collection': 'bench_deep'}
+
+
+class Target(Document):
+    name = StringField()
+    value = IntField()
+
+    meta = {'collection': 'bench_target'}
+
+
+class RefsDoc(Document):
+    name = StringField()
+    targets = ListField(ReferenceField(Target))
+
+    meta = {'collection': 'bench_refs'}
+
+
+def wide_values(n=0):
+    """Returns the values of the fields of a wide document."""
+    date = datetime.datetime(2025, 1, 1) + datetime.timedelta(seconds=n)
+    values = {}
+    for i in range(WIDE_GROUPS):
+        values['s%d' % i] = 'value %d %d' % (n, i)
+        values['i%d' % i] = n * i
+        values['f%d' % i] = n * i / 3
+        values['d%d' % i] = date
+        values['l%d' % i] = list(range(i))
+    return values
+
+
+def deep_values(n=0):
+    """Returns the values of the fields of a deep document."""
+    def leaf(i):
+        return Leaf(name='leaf %d' % i, value=i, tags=['a', 'b'])
+
+    def branch(i):
+        return Branch(name='branch %d' % i,
+                      leaves=[leaf(j) for j in range(DEEP_BRANCHES)])
+
+    def trunk(i):
+        return Trunk(name='trunk %d' % i,
+                     branches=[branch(j) for j in range(DEEP_BRANCHES)])
+
+    return {'name': 'deep %d' % n,
+            'trunks': [trunk(i) for i in range(DEEP_BRANCHES)]}
+
+
+def targets(n=REFS):
+    """Returns ``n`` unsaved targets with ids."""
+    return [Target(id=ObjectId(), name='target %d' % i, value=i)
+            for i in range(n)]
+
+
+ALL_DOCUMENTS = (WideDoc, DeepDoc, Target, RefsDoc)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+"""Registry, timing and comparison of the benchmarks."""
+
+import datetime
+import gc
+import inspect
+import json
+import platform
+import statistics
+import time
+
+_benchmarks = {}
+
+
+class Benchmark:
+    """A registered benchmark.
+
+    :param name: The name of the benchmark, ie: ``from_son.wide``.
+    :param setup: A coroutine function that prepares the data and returns
+      the callable, a function or a coroutine function, that is timed.
+    :param ops: How many operations each call of the timed callable does.
+    :param needs_db: Indicates if the benchmark needs a mongod.
+    """
+
+    def __init__(self, name, setup, ops=1, needs_db=False):
+        self.name = name
+        self.setup = setup
+        self.ops = ops
+        self.needs_db = needs_db
+
+    async def run(self, repeat=5, warmup=1):
+        """Times the benchmark ``repeat`` times, after ``warmup`` untimed
+        calls, and returns a dict with the timings in seconds."""
+
+        fn = await self.setup()
+        is_coro = inspect.iscoroutinefunction(fn)
+
+        for _ in range(warmup):
+            await fn() if is_coro else fn()
+
+        timings = []
+        # the garbage collector is disabled while timing so its pauses
+        # don't end up in random runs.
+        gc.collect()
+        gc.disable()
+        try:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                await fn() if is_coro else fn()
+                timings.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+
+        median = statistics.median(timings)
+        return {'ops': self.ops,
+                'repeat': repeat,
+                'min': min(timings),
+                'max': max(timings),
+                'median': median,
+                'mean': statistics.mean(timings),
+                'stdev': statistics.stdev(timings) if repeat > 1 else 0.0,
+                'ops_per_sec': self.ops / median if median else None}
+
+
+def benchmark(name, ops=1, needs_db=False):
+    """Decorator that registers a benchmark setup coroutine function.
+
+    .. code-block:: python
+
+        @benchmark('to_mongo.wide', ops=1000)
+        async def to_mongo_wide():
+            doc = WideDoc(**values)
+
+            def run():
+                for _ in range(1000):
+                    doc.to_mongo()
+            return run
+    """
+    def decorator(setup):
+        _benchmarks[name] = Benchmark(name, setup, ops=ops,
+                                      needs_db=needs_db)
+        return setup
+
+    return decorator
+
+
+def get_benchmarks(names=None, db=False):
+    """Returns the registered benchmarks.
+
+    :param names: If not None only the benchmarks whose names start with
+      one of these are returned.
+    :param db: Indicates if the benchmarks that need a mongod are
+      returned.
+    """
+    return [b for name, b in sorted(_benchmarks.items())
+            if (db or not b.needs_db) and
+            (not names or any(name.startswith(n) for n in names))]
+
+
+def get_meta():
+    """Returns a dict describing the environment the benchmarks run in."""
+    import mongoengine
+    import pymongo
+    import mongomotor
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return {'date': now.isoformat(),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'mongomotor': mongomotor.__version__,
+            'mongoengine': mongoengine.get_version(),
+            'pymongo': pymongo.version}
+
+
+async def run_benchmarks(benchmarks, repeat=5, warmup=1, report=None):
+    """Runs ``benchmarks`` and returns a dict with the environment under
+    ``meta`` and the timings of each benchmark under ``results``.
+
+    :param report: A callable called with the name and the timings of
+      each benchmark as soon as it is done.
+    """
+    results = {}
+    for bench in benchmarks:
+        results[bench.name] = await bench.run(repeat=repeat, warmup=warmup)
+        if report is not None:
+            report(bench.name, results[bench.name])
+
+    return {'meta': get_meta(), 'results': results}
+
+
+def compare(results, baseline, threshold=0.1):
+    """Compares the median of the benchmarks in ``results`` with the
+    ones in ``baseline``. Returns a list of dicts with ``name``,
+    ``baseline``, ``current``, ``change`` and ``regression`` for the
+    benchmarks present in both.
+
+    :param threshold: How much slower, ie: 0.1 for 10%, a benchmark
+      must be to be considered a regression.
+    """
+    comparison = []
+    base_results = baseline['results']
+    for name, current in sorted(results['results'].items()):
+        base = base_results.get(name)
+        if base is None:
+            continue
+
+        change = (current['median'] - base['median']) / base['median']
+        comparison.append({'name': name,
+                           'baseline': base['median'],
+                           'current': current['median'],
+                           'change': change,
+                           'regression': change > threshold})
+    return comparison
+
+
+def save(results, path):
+    with open(path, 'w') as fd:
+        json.dump(results, fd, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as fd:
+        return json.load(fd)
@@ -0,0 +1,13 @@
+#!/bin/bash
+
+# Runs the benchmarks comparing them with a baseline. If the baseline
+# does not exist it is created.
+
+BASELINE=${BASELINE:-benchmarks-baseline.json}
+
+if [ -f "$BASELINE" ]
+then
+    python -m benchmarks --db --baseline "$BASELINE" --output benchmarks-results.json "$@"
+else
+    python -m benchmarks --db --output "$BASELINE" "$@"
+fi
@@ -3,11 +3,13 @@
 # flake8: noqa
 
 from mongomotor.document import (Document, EmbeddedDocument,
-                                 DynamicDocument)
+                                 DynamicDocument, ensure_all_indexes)
 from mongoengine.document import (MapReduceDocument,
                                   DynamicEmbeddedDocument)
 from mongomotor.connection import connect, disconnect
 from mongomotor.monkey import MonkeyPatcher
+from mongomotor.tenancy import router, tenant
+from mongomotor.budget import query_budget
 
 
 patcher = MonkeyPatcher()
@@ -20,4 +22,5 @@ patcher.patch_no_dereferencing_active_for_class()
 __version__ = '0.17.0'
 
 __all__ = ['connect', 'disconnect', 'Document', 'DynamicDocument',
-           'EmbeddedDocument', 'DynamicEmbeddedDocument', 'MapReduceDocument']
+           'EmbeddedDocument', 'DynamicEmbeddedDocument', 'MapReduceDocument',
+           'router', 'tenant', 'ensure_all_indexes', 'query_budget']
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+"""Finds missing and unused indexes looking at the queries done by the
+querysets.
+
+.. code-block:: python
+
+    advisor = IndexAdvisor()
+    with advisor.recording():
+        # the queries done here are recorded.
+        await run_the_app()
+
+    report = await advisor.analyze()
+    advisor.print_report(report)
+"""
+
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+import random
+from mongoengine.connection import DEFAULT_CONNECTION_NAME
+from mongomotor.connection import admission
+
+# The advisors recording queries.
+_advisors = []
+
+
+# A query shape. ``equality`` and ``range`` are the db fields used in
+# the filter, ``sort`` is a tuple of (field, direction) and ``projection``
+# the projected fields.
+QueryShape = namedtuple('QueryShape', ['document', 'equality', 'range',
+                                       'sort', 'projection'])
+
+# The result of the analysis of a query shape.
+ShapeReport = namedtuple('ShapeReport', ['shape', 'count', 'collscan',
+                                         'in_memory_sort', 'index',
+                                         'suggestion'])
+
+# The result of the analysis of all the shapes recorded.
+AdvisorReport = namedtuple('AdvisorReport', ['shapes', 'unused_indexes'])
+
+_EQUALITY_OPERATORS = {'$eq', '$in'}
+
+
+def get_query_shape(document, query, sort=None, projection=None):
+    """Returns a :class:`~mongomotor.advisor.QueryShape` for a raw query.
+
+    :param document: The document class queried.
+    :param query: The raw query.
+    :param sort: A list of (field, direction).
+    :param projection: A dict with the projected fields.
+    """
+    equality, range_ = set(), set()
+    _collect_fields(query, equality, range_)
+    range_ -= equality
+    return QueryShape(document, tuple(sorted(equality)),
+                      tuple(sorted(range_)), tuple(sort or ()),
+                      tuple(sorted(projection or ())))
+
+
+def _collect_fields(query, equality, range_):
+    for key, value in query.items():
+        if key == '$and':
+            for sub_query in value:
+                _collect_fields(sub_query, equality, range_)
+        elif key.startswith('$'):
+            # $or, $text, $where... can't use a single index.
+            continue
+        elif isinstance(value, dict) and value and all(
+                k.startswith('$') for k in value):
+            if set(value) <= _EQUALITY_OPERATORS:
+                equality.add(key)
+            else:
+                range_.add(key)
+        else:
+            equality.add(key)
+
+
+def suggest_index(shape):
+    """Returns a index specification, as used in ``meta['indexes']``,
+    for a query shape. The fields are ordered as equality, sort and
+    range fields."""
+    db_fields = shape.document._reverse_db_field_map
+    fields = []
+    for db_field in shape.equality:
+        fields.append(db_fields.get(db_field, db_field))
+
+    for db_field, direction in shape.sort:
+        name = db_fields.get(db_field, db_field)
+        if name in fields:
+            continue
+        fields.append('-' + name if direction < 0 else name)
+
+    for db_field in shape.range:
+        name = db_fields.get(db_field, db_field)
+        if name not in fields:
+            fields.append(name)
+
+    # mongoengine adds _cls to the indexes by itself.
+    fields = [f for f in fields if f != '_cls']
+    return {'fields': fields} if fields else None
+
+
+def record(queryset):
+    """Records the query of a queryset in the advisors that are
+    recording. Called by :class:`~mongomotor.queryset.QuerySet`."""
+    for advisor in _advisors:
+        advisor.add(queryset)
+
+
+class IndexAdvisor:
+    """Records the shapes of the queries done while recording and
+    uses ``explain`` to find queries that do collection scans, sort
+    documents in memory and declared indexes that are not used.
+
+    :param sample_rate: The fraction of the queries that are recorded.
+    :param max_shapes: The maximum number of query shapes recorded.
+    """
+
+    def __init__(self, sample_rate=1.0, max_shapes=1000):
+        self.sample_rate = sample_rate
+        self.max_shapes = max_shapes
+        # shape -> [count, query]
+        self.shapes = OrderedDict()
+
+    def start(self):
+        """Starts recording the queries."""
+        if self not in _advisors:
+            _advisors.append(self)
+
+    def stop(self):
+        """Stops recording the queries."""
+        if self in _advisors:
+            _advisors.remove(self)
+
+    @contextmanager
+    def recording(self):
+        """Records the queries while inside the context manager."""
+        self.start()
+        try:
+            yield self
+        finally:
+            self.stop()
+
+    def add(self, queryset):
+        """Records the query of a queryset.
+
+        :param queryset: A :class:`~mongomotor.queryset.QuerySet`."""
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+
+        query = queryset._query
+        sort = queryset._ordering
+        if sort is None and queryset._document._meta.get('ordering'):
+            sort = queryset._get_order_by(
+                queryset._document._meta['ordering'])
+        projection = queryset._loaded_fields.as_dict()
+        shape = get_query_shape(queryset._document, query, sort, projection)
+
+        try:
+            self.shapes[shape][0] += 1
+        except KeyError:
+            if len(self.shapes) >= self.max_shapes:
+                return
+            self.shapes[shape] = [1, query]
+
+    async def analyze(self):
+        """Runs explain for each query shape recorded and returns an
+        :class:`~mongomotor.advisor.AdvisorReport`."""
+        reports = []
+        used_indexes = {}
+        for shape, (count, query) in self.shapes.items():
+            plan = await self._explain(shape, query)
+            stages = list(_iter_stages(plan))
+            names = [s.get('stage') for s in stages]
+            key_patterns = [list(s['keyPattern'].items()) for s in stages
+                            if s.get('stage') == 'IXSCAN' and
+                            'keyPattern' in s]
+            used_indexes.setdefault(shape.document, []).extend(key_patterns)
+
+            collscan = 'COLLSCAN' in names
+            in_memory_sort = 'SORT' in names
+            suggestion = None
+            if collscan or in_memory_sort:
+                suggestion = suggest_index(shape)
+
+            index = key_patterns[0] if key_patterns else None
+            reports.append(ShapeReport(shape, count, collscan,
+                                       in_memory_sort, index, suggestion))
+
+        unused = {}
+        for document, used in used_indexes.items():
+            declared = [i for i in document.list_indexes()
+                        if i != [('_id', 1)]]
+            not_used = [i for i in declared if i not in used]
+            if not_used:
+                unused[document] = not_used
+
+        return AdvisorReport(reports, unused)
+
+    def format_report(self, report):
+        """Returns a text with the problems found in a report and the
+        suggested indexes.
+
+        :param report: A :class:`~mongomotor.advisor.AdvisorReport`."""
+        lines = []
+        suggestions = OrderedDict()
+        for shape_report in report.shapes:
+            problems = []
+            if shape_report.collscan:
+                problems.append('COLLSCAN')
+            if shape_report.in_memory_sort:
+                problems.append('in-memory SORT')
+            if not problems:
+                continue
+
+            shape = shape_report.shape
+            lines.append('{}: {} (filter: {}, sort: {}, {} queries)'.format(
+                shape.document.__name__, ', '.join(problems),
+                list(shape.equality + shape.range), list(shape.sort),
+                shape_report.count))
+            if shape_report.suggestion:
+                doc_suggestions = suggestions.setdefault(shape.document, [])
+                if shape_report.suggestion not in doc_suggestions:
+                    doc_suggestions.append(shape_report.suggestion)
+
+        for document, indexes in report.unused_indexes.items():
+            for index in indexes:
+                lines.append('{}: index {} not used'.format(
+                    document.__name__, index))
+
+        for document, indexes in suggestions.items():
+            lines.append("{}: meta['indexes'] += {!r}".format(
+                document.__name__, indexes))
+
+        return '\n'.join(lines)
+
+    def print_report(self, report):
+        """Prints the text returned by
+        :meth:`~mongomotor.advisor.IndexAdvisor.format_report`."""
+        print(self.format_report(report))
+
+    async def _explain(self, shape, query):
+        document = shape.document
+        collection = document._get_collection()
+        kw = {}
+        if shape.projection:
+            kw['projection'] = list(shape.projection)
+        if shape.sort:
+            kw['sort'] = list(shape.sort)
+
+        alias = document._meta.get('db_alias', DEFAULT_CONNECTION_NAME)
+        async with admission(alias):
+            explain = await collection.find(query, **kw).explain()
+        planner = explain.get('queryPlanner', {})
+        return planner.get('winningPlan', {})
+
+
+def _iter_stages(plan):
+    """Yields all the stages of a query plan."""
+    if not plan:
+        return
+
+    # newer servers put the plan inside queryPlan
+    if 'queryPlan' in plan:
+        plan = plan['queryPlan']
+
+    yield plan
+    for key in ('inputStage', 'outerStage', 'innerStage'):
+        if key in plan:
+            yield from _iter_stages(plan[key])
+
+    for stage in plan.get('inputStages', []):
+        yield from _iter_stages(stage)
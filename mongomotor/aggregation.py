@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+"""Declarative grouping of the documents of a queryset, done by the
+server with a ``$group`` stage.
+
+.. code-block:: python
+
+    from mongomotor.aggregation import Count, Sum
+
+    groups = Sale.objects(year=2025).group_by('city').annotate(
+        total=Sum('amount'), n=Count()).order_by('-total').limit(10)
+    async for row in groups:
+        print(row.city, row.total, row.n)
+"""
+
+from collections import namedtuple
+import copy
+import keyword
+from mongoengine.errors import LookUpError
+
+
+class Accumulator:
+    """Base class for the accumulators used in :meth:`GroupBy.annotate`.
+
+    :param field: The field whose values are accumulated.
+    """
+
+    operator = None
+
+    def __init__(self, field):
+        self.field = field
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.field)
+
+    def to_mongo(self, db_field):
+        """Returns the accumulator expression for the ``$group`` stage.
+
+        :param db_field: The name of the field in the database.
+        """
+        return {self.operator: '$' + db_field}
+
+
+class Sum(Accumulator):
+    """The sum of the values of a field."""
+    operator = '$sum'
+
+
+class Avg(Accumulator):
+    """The average of the values of a field."""
+    operator = '$avg'
+
+
+class Min(Accumulator):
+    """The minimum value of a field."""
+    operator = '$min'
+
+
+class Max(Accumulator):
+    """The maximum value of a field."""
+    operator = '$max'
+
+
+class First(Accumulator):
+    """The value of a field in the first document of the group, in the
+    order of the queryset."""
+    operator = '$first'
+
+
+class Last(Accumulator):
+    """The value of a field in the last document of the group, in the
+    order of the queryset."""
+    operator = '$last'
+
+
+class Push(Accumulator):
+    """A list with the values of a field in the group."""
+    operator = '$push'
+
+
+class AddToSet(Accumulator):
+    """A list with the distinct values of a field in the group."""
+    operator = '$addToSet'
+
+
+class Count(Accumulator):
+    """The number of documents in the group."""
+
+    def __init__(self):
+        super().__init__(None)
+
+    def __repr__(self):
+        return 'Count()'
+
+    def to_mongo(self, db_field):
+        return {'$sum': 1}
+
+
+def _check_name(name):
+    # the groups are namedtuples, so the names must be valid field names.
+    if not name.isidentifier() or keyword.iskeyword(name) or \
+       name.startswith('_'):
+        raise ValueError(
+            '{!r} is not a valid name for the groups, names must be '
+            'identifiers not starting with an underscore'.format(name))
+
+
+class GroupBy:
+    """The documents of a queryset grouped by some fields. Use
+    :meth:`~mongomotor.queryset.QuerySet.group_by` to create it.
+
+    Like querysets, :meth:`annotate`, :meth:`order_by` and :meth:`limit`
+    return a new object. The groups are computed when the object is
+    iterated and are returned as namedtuples with the fields of the group
+    and the annotations, a batch at a time.
+
+    :param queryset: The queryset whose documents are grouped.
+    :param fields: The names of the fields the documents are grouped by.
+      Nested fields are separated by ``__`` or ``.`` and are named with
+      ``__`` in the results. Fields starting with an underscore, like
+      ``_cls``, can't be used.
+    :param allow_disk_use: Lets the server use temporary files for
+      groupings that don't fit in its memory.
+    :param batch_size: The number of groups fetched at a time.
+    """
+
+    def __init__(self, queryset, fields, allow_disk_use=True,
+                 batch_size=None):
+        if not fields:
+            raise TypeError('group_by() needs at least one field')
+
+        self._queryset = queryset
+        self._fields = [f.replace('.', '__') for f in fields]
+        for name in self._fields:
+            _check_name(name)
+        self._annotations = {}
+        self._ordering = []
+        self._limit = None
+        self.allow_disk_use = allow_disk_use
+        self.batch_size = batch_size
+
+    def __aiter__(self):
+        return self._iter_groups()
+
+    def annotate(self, **accumulators):
+        """Adds accumulated values to the groups.
+
+        .. code-block:: python
+
+            qs.group_by('city').annotate(total=Sum('amount'), n=Count())
+
+        :param accumulators: The names of the values and their
+          :class:`Accumulator`.
+        """
+        for name in accumulators:
+            _check_name(name)
+            if name in self._fields:
+                raise ValueError(
+                    '{!r} is already a field of the group'.format(name))
+
+        new = self._clone()
+        new._annotations.update(accumulators)
+        return new
+
+    def order_by(self, *keys):
+        """Sorts the groups by fields of the group or annotations. Use
+        ``-`` before the name for descending order.
+        """
+        new = self._clone()
+        new._ordering = []
+        for key in keys:
+            direction = -1 if key.startswith('-') else 1
+            name = key.lstrip('+-')
+            if name not in self._fields and name not in self._annotations:
+                raise ValueError('Unknown field or annotation {!r}'.format(
+                    name))
+            new._ordering.append((name, direction))
+        return new
+
+    def limit(self, n):
+        """Returns only the first ``n`` groups."""
+        new = self._clone()
+        new._limit = n
+        return new
+
+    async def to_list(self, length=None):
+        """Returns a list with the groups.
+
+        :param length: The maximum number of groups returned. If None all
+          of them are returned.
+        """
+        results = await self._aggregate()
+        try:
+            return await results.to_list(length)
+        finally:
+            await results.close()
+
+    def to_pipeline(self):
+        """Returns the stages of the aggregation, after the ones that
+        select the documents of the queryset."""
+
+        group_id = {name: '$' + self._get_db_field(name)
+                    for name in self._fields}
+        group = {'_id': group_id}
+        for name, accumulator in self._annotations.items():
+            db_field = None if accumulator.field is None \
+                else self._get_db_field(accumulator.field)
+            group[name] = accumulator.to_mongo(db_field)
+
+        project = {'_id': 0}
+        project.update({name: '$_id.' + name for name in self._fields})
+        project.update({name: '$' + name for name in self._annotations})
+
+        pipeline = [{'$group': group}]
+        if self._ordering:
+            # sorted before the $project, so $sort and $limit are merged.
+            pipeline.append({'$sort': {
+                '_id.' + name if name in self._fields else name: direction
+                for name, direction in self._ordering}})
+        if self._limit is not None:
+            pipeline.append({'$limit': self._limit})
+        pipeline.append({'$project': project})
+        return pipeline
+
+    async def _iter_groups(self):
+        results = await self._aggregate()
+        try:
+            async for row in results:
+                yield row
+        finally:
+            await results.close()
+
+    async def _aggregate(self):
+        kwargs = {}
+        if self.allow_disk_use:
+            kwargs['allowDiskUse'] = True
+        # the server omits the missing values, so all the rows are built
+        # with the same class and the missing values are None.
+        row_class = namedtuple('Row', self._fields + list(self._annotations))
+        return await self._queryset.aggregate(
+            self.to_pipeline(), as_namedtuple=row_class,
+            batch_size=self.batch_size, **kwargs)
+
+    def _get_db_field(self, name):
+        field = name.replace('__', '.')
+        try:
+            return self._queryset._fields_to_dbfields([field]).pop()
+        except LookUpError:
+            return field
+
+    def _clone(self):
+        new = copy.copy(self)
+        new._annotations = dict(self._annotations)
+        new._ordering = list(self._ordering)
+        return new
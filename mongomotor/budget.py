@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+"""Accounting of the round trips to the server.
+
+.. code-block:: python
+
+    async with mongomotor.query_budget(max_queries=20, max_docs=5000) as b:
+        await handle_request()
+
+    logger.info('queries: %(queries)d docs: %(docs)d', b.as_dict())
+"""
+
+from collections import Counter
+import contextvars
+import logging
+import bson
+from pymongo import monitoring
+from mongomotor.exceptions import QueryBudgetExceeded
+
+logger = logging.getLogger('mongomotor.budget')
+
+_budget = contextvars.ContextVar('mongomotor_budget', default=None)
+
+
+class QueryBudget:
+    """Counts the commands sent to the server, the documents and the
+    bytes received inside the context manager, including the tasks
+    created inside it.
+
+    :param max_queries: Maximum number of commands, including getMores.
+    :param max_docs: Maximum number of documents received.
+    :param max_bytes: Maximum number of bytes received. pymongo does not
+      give the size of the replies, so they are encoded again to be
+      measured. To avoid this cost the bytes are only counted when this
+      budget or an outer one has ``max_bytes``.
+    :param raise_error: If True, when leaving the context manager,
+      :class:`~mongomotor.exceptions.QueryBudgetExceeded` is raised if
+      a limit was exceeded. Otherwise a warning is logged.
+    """
+
+    def __init__(self, max_queries=None, max_docs=None, max_bytes=None,
+                 raise_error=True):
+        self.max_queries = max_queries
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.raise_error = raise_error
+        self.queries = 0
+        self.docs = 0
+        self.bytes = 0
+        self.commands = Counter()
+        self.parent = None
+        self.counts_bytes = max_bytes is not None
+        self._token = None
+        self._logged = False
+
+    async def __aenter__(self):
+        self.parent = _budget.get()
+        if self.parent is not None and self.parent.counts_bytes:
+            self.counts_bytes = True
+        self._token = _budget.set(self)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        _budget.reset(self._token)
+        exceeded = self.exceeded
+        if exc_type is None and exceeded and self.raise_error:
+            raise QueryBudgetExceeded('; '.join(exceeded))
+
+    @property
+    def exceeded(self):
+        """A list with the limits exceeded."""
+        exceeded = []
+        for name in ('queries', 'docs', 'bytes'):
+            limit = getattr(self, 'max_' + name)
+            value = getattr(self, name)
+            if limit is not None and value > limit:
+                exceeded.append('{} {} > {}'.format(value, name, limit))
+        return exceeded
+
+    def as_dict(self):
+        """Returns a dict with the totals."""
+        return {'queries': self.queries, 'docs': self.docs,
+                'bytes': self.bytes, 'commands': dict(self.commands)}
+
+    def add_command(self, command_name):
+        budget = self
+        while budget is not None:
+            budget.queries += 1
+            budget.commands[command_name] += 1
+            budget._check()
+            budget = budget.parent
+
+    def add_reply(self, docs, nbytes):
+        budget = self
+        while budget is not None:
+            budget.docs += docs
+            budget.bytes += nbytes
+            budget._check()
+            budget = budget.parent
+
+    def _check(self):
+        if self._logged or self.raise_error:
+            return
+
+        exceeded = self.exceeded
+        if exceeded:
+            self._logged = True
+            logger.warning('Query budget exceeded: %s', '; '.join(exceeded))
+
+
+def query_budget(max_queries=None, max_docs=None, max_bytes=None,
+                 raise_error=True):
+    """Returns a :class:`~mongomotor.budget.QueryBudget` to be used
+    as an async context manager.
+
+    :param max_queries: Maximum number of commands, including getMores.
+    :param max_docs: Maximum number of documents received.
+    :param max_bytes: Maximum number of bytes received.
+    :param raise_error: Raises
+      :class:`~mongomotor.exceptions.QueryBudgetExceeded` if True,
+      otherwise logs a warning.
+    """
+    return QueryBudget(max_queries=max_queries, max_docs=max_docs,
+                       max_bytes=max_bytes, raise_error=raise_error)
+
+
+def get_budget():
+    """Returns the current :class:`~mongomotor.budget.QueryBudget`
+    or None."""
+    return _budget.get()
+
+
+class BudgetListener(monitoring.CommandListener):
+    """Command listener that counts the commands in the current budget.
+    It is registered in the clients created by
+    :func:`~mongomotor.connection.connect`."""
+
+    def started(self, event):
+        budget = _budget.get()
+        if budget is not None:
+            budget.add_command(event.command_name)
+
+    def succeeded(self, event):
+        budget = _budget.get()
+        if budget is None:
+            return
+
+        reply = event.reply
+        docs = 0
+        cursor = reply.get('cursor')
+        if isinstance(cursor, dict):
+            docs = len(cursor.get('firstBatch', cursor.get('nextBatch', ())))
+        nbytes = _reply_size(reply) if budget.counts_bytes else 0
+        budget.add_reply(docs, nbytes)
+
+    def failed(self, event):
+        pass
+
+
+def _reply_size(reply):
+    raw = getattr(reply, 'raw', None)
+    if raw is not None:
+        # a RawBSONDocument
+        return len(raw)
+    return len(bson.encode(reply))
+
+
+listener = BudgetListener()
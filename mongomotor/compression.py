@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+"""Codecs used to compress the contents of a
+:class:`~mongomotor.fields.FileField`.
+
+A codec is registered with a name that is stored with the file, so the
+file can be decompressed later. ``zlib`` and ``lzma`` are registered by
+default. Other codecs must subclass :class:`Codec`:
+
+.. code-block:: python
+
+    class Bz2Codec(Codec):
+        name = 'bz2'
+
+        def compressobj(self):
+            return bz2.BZ2Compressor()
+
+        def decompressobj(self):
+            return StreamDecompressor(bz2.BZ2Decompressor())
+
+    register_codec(Bz2Codec())
+"""
+
+import lzma
+import zlib
+
+_codecs = {}
+
+
+class Codec:
+    """Base class for the codecs. Subclasses must set ``name`` and
+    implement :meth:`compressobj` and :meth:`decompressobj`."""
+
+    name = None
+
+    def compressobj(self):
+        """Returns an object that compresses a stream, with the methods
+        ``compress(data)`` and ``flush()``, both returning bytes, like
+        the one returned by :func:`zlib.compressobj`."""
+        raise NotImplementedError
+
+    def decompressobj(self):
+        """Returns an object that decompresses a stream, with the methods
+        ``decompress(data)`` and ``flush()``, both returning bytes, like
+        the one returned by :func:`zlib.decompressobj`."""
+        raise NotImplementedError
+
+
+class StreamDecompressor:
+    """Adds the ``flush`` method to decompressors that don't have it, like
+    :class:`lzma.LZMADecompressor`."""
+
+    def __init__(self, decompressor):
+        self._decompressor = decompressor
+
+    def decompress(self, data):
+        return self._decompressor.decompress(data)
+
+    def flush(self):
+        return b''
+
+
+class ZlibCodec(Codec):
+    """Compresses with :mod:`zlib`.
+
+    :param level: The compression level, from 0 to 9.
+    """
+
+    name = 'zlib'
+
+    def __init__(self, level=zlib.Z_DEFAULT_COMPRESSION):
+        self.level = level
+
+    def compressobj(self):
+        return zlib.compressobj(self.level)
+
+    def decompressobj(self):
+        return zlib.decompressobj()
+
+
+class LzmaCodec(Codec):
+    """Compresses with :mod:`lzma`. Slower than zlib, but compresses
+    more.
+
+    :param preset: The compression preset, from 0 to 9.
+    """
+
+    name = 'lzma'
+
+    def __init__(self, preset=None):
+        self.preset = preset
+
+    def compressobj(self):
+        return lzma.LZMACompressor(preset=self.preset)
+
+    def decompressobj(self):
+        return StreamDecompressor(lzma.LZMADecompressor())
+
+
+def register_codec(codec):
+    """Registers a codec by its name. A codec registered with the name of
+    an existing one replaces it.
+
+    :param codec: A :class:`Codec` instance.
+    """
+    if not codec.name:
+        raise ValueError('A codec must have a name')
+    _codecs[codec.name] = codec
+
+
+def get_codec(codec):
+    """Returns a registered codec.
+
+    :param codec: The name of the codec or a :class:`Codec` instance,
+      that is returned as is.
+    """
+    if isinstance(codec, Codec):
+        return codec
+
+    try:
+        return _codecs[codec]
+    except KeyError:
+        raise ValueError('Unknown codec {!r}'.format(codec))
+
+
+register_codec(ZlibCodec())
+register_codec(LzmaCodec())
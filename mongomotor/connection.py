@@ -19,6 +19,8 @@
 
 
 import asyncio
+from collections import deque
+import time
 from mongoengine import connection
 from mongoengine.connection import (connect as me_connect,
                                     DEFAULT_CONNECTION_NAME,
@@ -29,10 +31,189 @@ from mongoengine.connection import (connect as me_connect,
                                     _dbs)
 from pymongo import AsyncMongoClient
 
-from mongomotor import utils
+from mongomotor import budget, memory, utils
+from mongomotor.exceptions import ConcurrencyLimitError
 from mongomotor.monkey import MonkeyPatcher
 
 _db_version = {}
+_limiters = {}
+
+
+class ConcurrencyLimiter:
+    """Admission control for the operations sent through a connection.
+
+    At most ``max_in_flight`` operations run at the same time. The other
+    ones wait in a FIFO queue. If the queue already has ``max_queue``
+    operations waiting, new ones are rejected right away, and operations
+    that wait more than ``timeout`` seconds give up. In both cases a
+    :class:`~mongomotor.exceptions.ConcurrencyLimitError` is raised.
+
+    :param max_in_flight: Maximum number of concurrent operations.
+    :param max_queue: Maximum number of operations waiting for a slot.
+      If None the queue is unbounded.
+    :param timeout: How many seconds an operation may wait for a slot.
+      If None it waits forever.
+    """
+
+    def __init__(self, max_in_flight, max_queue=None, timeout=None):
+        if max_in_flight < 1:
+            raise ValueError('max_in_flight must be at least 1')
+
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self._waiters = deque()
+        self.reset_stats()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    @property
+    def queued(self):
+        """The number of operations waiting for a slot."""
+        return len(self._waiters)
+
+    def reset_stats(self):
+        """Zeroes the counters returned by :meth:`stats`."""
+        self._acquired = 0
+        self._waited = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._max_queued = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def stats(self):
+        """Returns a dict with the current state and the counters of the
+        limiter. Wait times are in seconds."""
+
+        return {'in_flight': self.in_flight,
+                'queued': self.queued,
+                'max_queued': self._max_queued,
+                'acquired': self._acquired,
+                'waited': self._waited,
+                'rejected': self._rejected,
+                'timed_out': self._timed_out,
+                'total_wait_time': self._total_wait,
+                'max_wait_time': self._max_wait,
+                'avg_wait_time': (self._total_wait / self._waited
+                                  if self._waited else 0.0)}
+
+    async def acquire(self):
+        """Waits for a free slot."""
+
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self._acquired += 1
+            return
+
+        if self.max_queue is not None and self.queued >= self.max_queue:
+            self._rejected += 1
+            raise ConcurrencyLimitError(
+                'Too many operations waiting ({} queued)'.format(self.queued))
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._max_queued = max(self._max_queued, self.queued)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed to us just before we gave up, so
+                # we pass it on to the next in line.
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                self._timed_out += 1
+                raise ConcurrencyLimitError(
+                    'Timeout waiting for a free slot after {}s'.format(
+                        self.timeout))
+            raise
+        finally:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+            wait = time.monotonic() - start
+            self._waited += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+
+        self._acquired += 1
+
+    def release(self):
+        """Frees a slot. If there is someone waiting the slot is handed
+        to the first operation in the queue."""
+
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+        self.in_flight -= 1
+
+
+class _NoLimit:
+    """Used when there is no limiter for an alias."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_no_limit = _NoLimit()
+
+
+def set_concurrency_limit(alias=DEFAULT_CONNECTION_NAME, max_in_flight=None,
+                          max_queue=None, timeout=None):
+    """Sets a :class:`~mongomotor.connection.ConcurrencyLimiter` for the
+    operations using a connection alias. If ``max_in_flight`` is None the
+    limiter for the alias is removed.
+
+    :param alias: The alias identifying the connection.
+    :param max_in_flight: Maximum number of concurrent operations.
+    :param max_queue: Maximum number of operations waiting for a slot.
+    :param timeout: How many seconds an operation may wait for a slot.
+    """
+    if max_in_flight is None:
+        return _limiters.pop(alias, None)
+
+    limiter = ConcurrencyLimiter(max_in_flight, max_queue=max_queue,
+                                 timeout=timeout)
+    _limiters[alias] = limiter
+    return limiter
+
+
+def get_concurrency_stats(alias=DEFAULT_CONNECTION_NAME):
+    """Returns the stats of the limiter for a connection alias or None
+    if there is no limiter for the alias."""
+
+    limiter = _limiters.get(alias)
+    if limiter is None:
+        return None
+    return limiter.stats()
+
+
+def admission(alias=DEFAULT_CONNECTION_NAME):
+    """Returns an async context manager that holds a slot of the limiter
+    for the connection alias while an operation is running.
+
+    .. code-block:: python
+
+        async with admission(alias):
+            await collection.find_one(query)
+
+    :param alias: The alias identifying the connection.
+    """
+    return _limiters.get(alias, _no_limit)
 
 
 def get_mongodb_version(alias=DEFAULT_CONNECTION_NAME):
@@ -56,6 +237,15 @@ def get_db_version(alias=DEFAULT_CONNECTION_NAME):
     return _db_version[alias]
 
 
+def get_event_listeners(listeners=None):
+    """Returns the event listeners for a client, adding the listener used by
+    :func:`~mongomotor.budget.query_budget` to ``listeners``."""
+    listeners = list(listeners or [])
+    if budget.listener not in listeners:
+        listeners.append(budget.listener)
+    return listeners
+
+
 def connect(db=None, alias=DEFAULT_CONNECTION_NAME, **kwargs):
     """Connect to the database specified by the 'db' argument.
 
@@ -67,17 +257,51 @@ def connect(db=None, alias=DEFAULT_CONNECTION_NAME, **kwargs):
     `alias` to connect to a different instance of :program:`mongod`.
 
     Parameters are the same as for :func:`mongoengine.connection.connect`
-    plus one:
+    plus:
 
     :param async_framework: Which asynchronous framework should be used.
       It can be `tornado` or `asyncio`. Defaults to `asyncio`.
+    :param backend: Where the data is. ``'mongodb'``, the default, for a
+      mongod or ``'memory'`` for the in-memory backend in
+      :mod:`mongomotor.memory`.
+    :param max_in_flight: Maximum number of concurrent operations for the
+      connection. See :func:`~mongomotor.connection.set_concurrency_limit`.
+    :param max_queue: Maximum number of operations waiting for a slot.
+    :param queue_timeout: How many seconds an operation may wait for a slot.
+      If none of ``max_in_flight``, ``max_queue`` and ``queue_timeout`` is
+      passed the limiter of the alias is kept as it is.
 
     """
+    set_limit = any(k in kwargs for k in (
+        'max_in_flight', 'max_queue', 'queue_timeout'))
+    max_in_flight = kwargs.pop('max_in_flight', None)
+    max_queue = kwargs.pop('max_queue', None)
+    queue_timeout = kwargs.pop('queue_timeout', None)
+    backend = kwargs.pop('backend', 'mongodb')
+    if backend not in ('mongodb', 'memory'):
+        raise ValueError('Invalid backend {!r}'.format(backend))
+
+    if set_limit:
+        set_concurrency_limit(alias, max_in_flight, max_queue=max_queue,
+                              timeout=queue_timeout)
+
     kwargs['uuidrepresentation'] = 'standard'
+    if backend == 'memory':
+        # there is no server, so no sync connection to ask its version.
+        ret = me_connect(db=db, alias=alias,
+                         mongo_client_class=memory.MemoryClient, **kwargs)
+        _db_version[alias] = memory.SERVER_VERSION
+        return ret
+
+    # the listener used by the query budgets is only needed by the
+    # async client.
+    async_kwargs = kwargs.copy()
+    async_kwargs['event_listeners'] = get_event_listeners(
+        kwargs.get('event_listeners'))
     with MonkeyPatcher() as patcher:
         patcher.patch_db_clients(AsyncMongoClient)
         patcher.patch_sync_connections()
-        ret = me_connect(db=db, alias=alias, **kwargs)
+        ret = me_connect(db=db, alias=alias, **async_kwargs)
 
     # here we register a connection that will use the original pymongo
     # client and if used will block the process.
@@ -119,3 +343,5 @@ def disconnect(alias=DEFAULT_CONNECTION_NAME):
 
     if alias in _connection_settings:
         del _connection_settings[alias]
+
+    _limiters.pop(alias, None)
@@ -6,12 +6,15 @@ from mongoengine.connection import get_db
 from mongoengine.dereference import DeReference
 from .document import Document, EmbeddedDocument, TopLevelDocumentMetaclass
 from .fields import ReferenceField, ListField, DictField, MapField
+from . import profiler
 from .queryset import QuerySet
 
 
 class MongoMotorDeReference(DeReference):
 
-    async def __call__(self, items, max_depth=1, instance=None, name=None):
+    @profiler.profiled('dereference')
+    async def __call__(self, items, max_depth=1, instance=None, name=None,
+                       read_preference=None):
         """
         Cheaply dereferences the items to a set depth.
         Also handles the conversion of complex data types.
@@ -23,6 +26,9 @@ class MongoMotorDeReference(DeReference):
         :param name: The name of the field, used for tracking changes by
             :class:`~mongomotor.ComplexBaseField`
         :param get: A boolean determining if being called by __get__
+        :param read_preference: The read preference used to fetch the
+            references. If None the default read preference of the referenced
+            documents is used.
         """
         if items is None or isinstance(items, str):
             return items
@@ -31,6 +37,7 @@ class MongoMotorDeReference(DeReference):
             items = await items.to_list()
 
         self.max_depth = max_depth
+        self.read_preference = read_preference
         doc_type = None
 
         if instance and isinstance(
@@ -60,7 +67,10 @@ class MongoMotorDeReference(DeReference):
                     dbref for dbref in dbrefs if (col_name, dbref)
                     not in object_map
                 ]
-                references = await collection.objects.in_bulk(refs)
+                qs = collection.objects
+                if self.read_preference is not None:
+                    qs = qs.read_preference(self.read_preference)
+                references = await qs.in_bulk(refs)
                 for key, doc in references.items():
                     object_map[(col_name, key)] = doc
             else:
@@ -74,15 +84,15 @@ class MongoMotorDeReference(DeReference):
                 ]
 
                 if doc_type:
-                    references = doc_type._get_db()[collection].find(
-                        {"_id": {"$in": refs}}
-                    )
+                    references = self._get_collection(
+                        doc_type._get_db(), collection).find(
+                            {"_id": {"$in": refs}})
                     async for ref in references:
                         doc = doc_type._from_son(ref)
                         object_map[(collection, doc.id)] = doc
                 else:
-                    references = get_db()[collection].find(
-                        {"_id": {"$in": refs}})
+                    references = self._get_collection(
+                        get_db(), collection).find({"_id": {"$in": refs}})
                     async for ref in references:
                         if "_cls" in ref:
                             doc = get_document(ref["_cls"])._from_son(ref)
@@ -96,6 +106,13 @@ class MongoMotorDeReference(DeReference):
                         object_map[(collection, doc.id)] = doc
         return object_map
 
+    def _get_collection(self, db, name):
+        collection = db[name]
+        if self.read_preference is not None:
+            collection = collection.with_options(
+                read_preference=self.read_preference)
+        return collection
+
     def _get_deref_items_for_instance(self, instance, items, name):
 
         doc_type = instance._fields.get(name)
@@ -17,7 +17,9 @@
 # You should have received a copy of the GNU General Public License
 # along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 import re
+import time
 from mongoengine import (Document as DocumentBase,
                          DynamicDocument as DynamicDocumentBase)
 from mongoengine.document import (
@@ -26,18 +28,22 @@ from mongoengine.document import (
     includes_cls,
 )
 from mongoengine.common import _import_class
+from mongoengine.connection import DEFAULT_CONNECTION_NAME
 from mongoengine.context_managers import set_write_concern
 from mongoengine.errors import (
     InvalidDocumentError,
     InvalidQueryError,
     SaveConditionError
 )
+from mongoengine.base.common import _document_registry
 from mongoengine.base.metaclasses import TopLevelDocumentMetaclass
 from mongoengine.queryset import OperationError, NotUniqueError, transform
-from mongomotor import signals
+from mongomotor import profiler, signals, tenancy
+from mongomotor.connection import admission
 
 from mongomotor.queryset import QuerySet
 import pymongo
+from pymongo import IndexModel
 from pymongo.read_preferences import ReadPreference
 
 
@@ -117,6 +123,17 @@ class Document(NoDerefInitMixin, DocumentBase,
     in your model will raise a :class:`mongoengine.FieldDoesNotExist` error.
     This can be disabled by setting :attr:`strict` to ``False``
     in the :attr:`meta` dictionary.
+
+    The read preference used by default when querying the documents may be
+    set with :attr:`read_preference` in the :attr:`meta` dictionary. It may
+    be a pymongo read preference, the name of a read preference mode or
+    a dict like ``{'mode': 'secondary', 'tag_sets': [{'dc': 'ny'}],
+    'max_staleness': 120}``.
+
+    When a router is set with :func:`mongomotor.router` the documents are
+    stored in the database of the current tenant. To keep a document in its
+    own database set :attr:`tenant_routing` to ``False`` in the :attr:`meta`
+    dictionary.
     """
 
     # setting it here so mongoengine will be happy even if I don't
@@ -135,6 +152,7 @@ class Document(NoDerefInitMixin, DocumentBase,
             'auto_create_index': False,
             'queryset_class': QuerySet}
 
+    @profiler.profiled('save')
     async def save(
         self,
         force_insert=False,
@@ -262,6 +280,7 @@ class Document(NoDerefInitMixin, DocumentBase,
 
         return self
 
+    @profiler.profiled('delete')
     async def delete(self, signal_kwargs=None, **write_concern):
         """Delete the :class:`~mongomotor.Document` from the database. This
         will only take effect if the document has been previously saved.
@@ -283,7 +302,9 @@ class Document(NoDerefInitMixin, DocumentBase,
         FileField = _import_class('FileField')
         for name, field in self._fields.items():
             if isinstance(field, FileField):
-                getattr(self, name).delete()
+                proxy = getattr(self, name)
+                if proxy.grid_id is not None:
+                    await proxy.delete()
 
         try:
             r = await self._qs.filter(
@@ -327,6 +348,11 @@ class Document(NoDerefInitMixin, DocumentBase,
             msg += "it must modify only this document."
             raise InvalidQueryError(msg)
 
+        # the shard key makes the query go only to the right shard
+        for key, value in self._object_key.items():
+            if key != 'pk':
+                query.setdefault(key, value)
+
         updated = await self._qs(**query).modify(new=True, **update)
         if updated is None:
             return False
@@ -345,6 +371,7 @@ class Document(NoDerefInitMixin, DocumentBase,
         self._created = False
         return True
 
+    @profiler.profiled('reload')
     async def reload(self, *fields, **kwargs):
         """Reloads all attributes from the database.
 
@@ -415,6 +442,20 @@ class Document(NoDerefInitMixin, DocumentBase,
             return
         return super().register_delete_rule(document_cls, field_name, rule)
 
+    @classmethod
+    def _get_db(cls):
+        db = tenancy.get_tenant_db(cls)
+        if db is not None:
+            return db
+        return super()._get_db()
+
+    @classmethod
+    def _get_collection(cls):
+        db = tenancy.get_tenant_db(cls)
+        if db is not None:
+            return db[cls._get_collection_name()]
+        return super()._get_collection()
+
     @classmethod
     def drop_collection(cls):
         """Drops the entire collection associated with this
@@ -490,6 +531,10 @@ class Document(NoDerefInitMixin, DocumentBase,
         # index to service queries against _cls
         cls_indexed = False
 
+        # All the indexes are sent to the server in a single
+        # createIndexes command so they are built together.
+        indexes = []
+
         # Ensure document-defined indexes are created
         if cls._meta["index_specs"]:
             index_spec = cls._meta["index_specs"]
@@ -505,8 +550,8 @@ class Document(NoDerefInitMixin, DocumentBase,
                 if "cls" in opts:
                     del opts["cls"]
 
-                await collection.create_index(
-                    fields, background=background, **opts)
+                indexes.append(
+                    IndexModel(fields, background=background, **opts))
 
         # If _cls is being used (for polymorphism), it needs an index,
         # only if another index doesn't begin with _cls
@@ -517,8 +562,15 @@ class Document(NoDerefInitMixin, DocumentBase,
             if "cls" in index_opts:
                 del index_opts["cls"]
 
-            await collection.create_index(
-                "_cls", background=background, **index_opts)
+            indexes.append(
+                IndexModel("_cls", background=background, **index_opts))
+
+        if not indexes:
+            return
+
+        alias = cls._meta.get('db_alias', DEFAULT_CONNECTION_NAME)
+        async with admission(alias):
+            await collection.create_indexes(indexes)
 
     @property
     def _qs(self):
@@ -535,21 +587,25 @@ class Document(NoDerefInitMixin, DocumentBase,
         Helper method, should only be used inside save().
         """
         collection = self._get_collection()
+        alias = self._meta.get('db_alias', DEFAULT_CONNECTION_NAME)
         with set_write_concern(collection, write_concern) as wc_collection:
             if force_insert:
-                r = await wc_collection.insert_one(doc)
+                async with admission(alias):
+                    r = await wc_collection.insert_one(doc)
                 return r.inserted_id
             # insert_one will provoke UniqueError alongside save does not
             # therefore, it need to catch and call replace_one.
             if "_id" in doc:
                 select_dict = {"_id": doc["_id"]}
                 select_dict = self._integrate_shard_key(doc, select_dict)
-                raw_object = wc_collection.find_one_and_replace(
-                    select_dict, doc)
+                async with admission(alias):
+                    raw_object = await wc_collection.find_one_and_replace(
+                        select_dict, doc)
                 if raw_object:
                     return doc["_id"]
 
-            r = await wc_collection.insert_one(doc)
+            async with admission(alias):
+                r = await wc_collection.insert_one(doc)
             object_id = r.inserted_id
 
         return object_id
@@ -574,10 +630,12 @@ class Document(NoDerefInitMixin, DocumentBase,
         update_doc = self._get_update_doc()
         if update_doc:
             upsert = save_condition is None
+            alias = self._meta.get('db_alias', DEFAULT_CONNECTION_NAME)
             with set_write_concern(collection, write_concern) as wc_collection:
-                r = await wc_collection.update_one(
-                    select_dict, update_doc, upsert=upsert
-                )
+                async with admission(alias):
+                    r = await wc_collection.update_one(
+                        select_dict, update_doc, upsert=upsert
+                    )
                 last_error = r.raw_result
             if not upsert and last_error["n"] == 0:
                 raise SaveConditionError(
@@ -642,3 +700,40 @@ class DynamicEmbeddedDocument(NoDerefInitMixin, DynamicEmbeddedDocumentBase):
             'index_opts': None,
             'delete_rules': None,
             'allow_inheritance': None}
+
+
+async def ensure_all_indexes(concurrency=4):
+    """Ensures the indexes of all the :class:`~mongomotor.Document`
+    subclasses. Indexes of different collections are created concurrently.
+
+    Returns a dict with the full name of the collections as keys and
+    the seconds spent creating their indexes as values.
+
+    :param concurrency: How many collections have their indexes created
+      at the same time.
+    """
+    # The documents that share a collection, ie: the subclasses of
+    # a document with allow_inheritance, are handled together.
+    collections = {}
+    for doc_cls in list(_document_registry.values()):
+        if not issubclass(doc_cls, Document) or \
+           doc_cls._meta.get('abstract') or \
+           doc_cls.__name__.startswith('Patched'):
+            continue
+
+        collection = doc_cls._get_collection()
+        collections.setdefault(collection.full_name, []).append(doc_cls)
+
+    sem = asyncio.Semaphore(concurrency)
+    timings = {}
+
+    async def ensure(name, doc_classes):
+        async with sem:
+            start = time.monotonic()
+            for doc_cls in doc_classes:
+                await doc_cls.ensure_indexes()
+            timings[name] = time.monotonic() - start
+
+    await asyncio.gather(*[ensure(name, doc_classes)
+                           for name, doc_classes in collections.items()])
+    return timings
@@ -17,6 +17,8 @@
 # You should have received a copy of the GNU General Public License
 # along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
 
+from mongoengine.errors import OperationError
+
 
 class BadAsyncFrameworkError(Exception):
     pass
@@ -28,3 +30,39 @@ class ConfusionError(Exception):
 
 class MissingFramework(Exception):
     pass
+
+
+class ConcurrencyLimitError(Exception):
+    """Raised when an operation can't get a slot from a
+    :class:`~mongomotor.connection.ConcurrencyLimiter`."""
+
+
+class ScatterGatherWarning(UserWarning):
+    """Warns that a query on a sharded collection doesn't have the shard
+    key so it will be sent to all the shards."""
+
+
+class ChunkedWriteError(OperationError):
+    """Raised when a chunked update or delete fails. ``n`` is how many
+    documents were written before the error and ``checkpoint`` is the
+    id to be passed as ``resume_after`` to continue the write."""
+
+    def __init__(self, message, n=0, checkpoint=None):
+        super().__init__(message)
+        self.n = n
+        self.checkpoint = checkpoint
+
+
+class NPlusOneWarning(UserWarning):
+    """Warns that the same reference field is being loaded one document
+    at a time."""
+
+
+class NPlusOneError(Exception):
+    """Raised instead of :class:`~mongomotor.exceptions.NPlusOneWarning`
+    when the N+1 detector is set to raise."""
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a :class:`~mongomotor.budget.QueryBudget` limit is
+    exceeded."""
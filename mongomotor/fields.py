@@ -17,8 +17,17 @@
 # You should have received a copy of the GNU General Public License
 # along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
 
-from bson import DBRef
+import asyncio
+from collections import OrderedDict
+import datetime
+import hashlib
+import inspect
+import math
+import os
+from bson import DBRef, Int64, ObjectId
 import gridfs
+from gridfs.errors import CorruptGridFile, FileExists, NoFile
+from gridfs.grid_file_shared import DEFAULT_CHUNK_SIZE
 from mongoengine import fields
 from mongoengine.base import get_document
 from mongoengine.base.datastructures import (
@@ -27,6 +36,11 @@ from mongoengine.common import _import_class
 from mongoengine.connection import get_db
 from mongoengine.errors import DoesNotExist
 from mongoengine.fields import GridFSError
+from pymongo.errors import DuplicateKeyError
+from mongomotor import nplusone
+from mongomotor.compression import get_codec
+from mongomotor.filecache import file_version
+from mongomotor.utils import get_read_preference
 
 
 from mongoengine.fields import *  # noqa f403 for the sake of the api
@@ -48,6 +62,9 @@ class BaseAsyncReferenceField:
                 return instance._data.get(self.name)
 
             ref_value = instance._data.get(self.name)
+            if isinstance(ref_value, (dict, DBRef)):
+                nplusone.record_load(instance, self.name)
+
             if isinstance(ref_value, dict) and '_ref' in ref_value.keys():
                 ref = ref_value['_ref']
                 cls = get_document(ref_value['_cls'])
@@ -72,7 +89,12 @@ class BaseAsyncReferenceField:
 
     @staticmethod
     async def _lazy_load_ref(ref_cls, dbref):
-        dereferenced_son = await ref_cls._get_db().dereference(dbref)
+        db = ref_cls._get_db()
+        read_preference = get_read_preference(
+            ref_cls._meta.get('read_preference'))
+        if read_preference is not None:
+            db = db.with_options(read_preference=read_preference)
+        dereferenced_son = await db.dereference(dbref)
         if dereferenced_son is None:
             raise DoesNotExist(
                 f"Trying to dereference unknown document {dbref}")
@@ -139,6 +161,8 @@ class ComplexBaseField(fields.ComplexBaseField):
                 return instance._data.get(self.name)
 
             ref_values = instance._data.get(self.name)
+            if ref_values:
+                nplusone.record_load(instance, self.name)
             instance._data[self.name] = await self._lazy_load_refs(
                 ref_values=ref_values, instance=instance, name=self.name,
                 max_depth=1
@@ -200,10 +224,426 @@ class DictField(ComplexBaseField, fields.DictField):
     pass
 
 
+# How many chunks are fetched from the server at once when streaming a
+# file. With the default chunk size it is about 1MB.
+CHUNKS_BATCH_SIZE = 4
+
+# Data at least this big is compressed and decompressed in a thread, so
+# the codec doesn't block the event loop.
+CODEC_EXECUTOR_SIZE = 64 * 1024
+
+
+async def _run_codec(func, data):
+    if len(data) < CODEC_EXECUTOR_SIZE:
+        return func(data)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, func, data)
+
+
+class GridFSReader:
+    """An async seekable reader for a gridfs file. Only the chunks
+    covering the bytes read are fetched from the server.
+
+    Use :meth:`GridFSProxy.open_reader` to create one.
+
+    :param proxy: The :class:`GridFSProxy` of the file.
+    :param file_doc: The files document of the file.
+    :param cache_chunks: How many of the last chunks read are kept in
+      memory. 0 means no cache.
+    """
+
+    def __init__(self, proxy, file_doc, cache_chunks=0):
+        self._proxy = proxy
+        self._file_doc = file_doc
+        self._compressed = file_doc.get('compression') is not None
+        self.length = file_doc.get('originalLength', file_doc['length'])
+        self.chunk_size = file_doc['chunkSize']
+        self.cache_chunks = cache_chunks
+        self._cache = OrderedDict()
+        self._position = 0
+        # the contents of a compressed file being read, kept open for the
+        # sequential reads, and the position and data not read yet.
+        self._stream = None
+        self._stream_position = 0
+        self._pending = b''
+
+    def tell(self):
+        return self._position
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """Changes the position of the reader. Returns the new position.
+
+        :param offset: The position relative to ``whence``.
+        :param whence: One of ``os.SEEK_SET``, ``os.SEEK_CUR`` or
+          ``os.SEEK_END``.
+        """
+        if whence == os.SEEK_SET:
+            position = offset
+        elif whence == os.SEEK_CUR:
+            position = self._position + offset
+        elif whence == os.SEEK_END:
+            position = self.length + offset
+        else:
+            raise ValueError('Invalid whence {!r}'.format(whence))
+
+        if position < 0:
+            raise ValueError('Invalid position {}'.format(position))
+        self._position = position
+        return position
+
+    async def read(self, size=-1):
+        """Reads at most ``size`` bytes from the current position. If
+        ``size`` is negative reads until the end of the file."""
+
+        start = min(self._position, self.length)
+        end = self.length if size < 0 else min(self.length, start + size)
+        data = await self._read(start, end)
+        self._position = end
+        return data
+
+    async def close(self):
+        """Closes the contents of a compressed file being read."""
+        if self._stream is not None:
+            await self._stream.aclose()
+            self._stream = None
+
+    async def _read(self, start, end):
+        if start >= end:
+            return b''
+
+        if self._compressed:
+            return await self._read_compressed(start, end)
+
+        first = start // self.chunk_size
+        last = (end - 1) // self.chunk_size
+        chunks = await self._get_chunks(first, last)
+        # only the first and the last chunks may be partially read.
+        offset = start - first * self.chunk_size
+        if first == last:
+            return chunks[0][offset:offset + end - start]
+
+        tail = end - last * self.chunk_size
+        return b''.join([chunks[0][offset:], *chunks[1:-1],
+                         chunks[-1][:tail]])
+
+    async def _read_compressed(self, start, end):
+        # compressed files can't be read from the middle, so they are
+        # decompressed from the start, and the contents are kept open
+        # so the next sequential read continues from where this one
+        # stopped.
+        if self._stream is None or start < self._stream_position:
+            await self.close()
+            self._stream = self._proxy._iter_contents(self._file_doc)
+            self._stream_position = 0
+            self._pending = b''
+
+        buf = bytearray()
+        position = self._stream_position
+        data = self._pending
+        try:
+            while position + len(data) < end:
+                if position + len(data) > start:
+                    buf += data[max(start - position, 0):]
+                position += len(data)
+                try:
+                    data = await self._stream.__anext__()
+                except StopAsyncIteration:
+                    data = b''
+                    break
+        except BaseException:
+            await self.close()
+            raise
+
+        if position + len(data) > start:
+            buf += data[max(start - position, 0):end - position]
+        self._stream_position = position
+        self._pending = data
+        return bytes(buf)
+
+    async def _get_chunks(self, first, last):
+        """Returns the data of the chunks ``first`` to ``last``, fetching
+        the ones not in the cache with a query for each contiguous run."""
+
+        chunks = {}
+        n = first
+        while n <= last:
+            if n in self._cache:
+                self._cache.move_to_end(n)
+                chunks[n] = self._cache[n]
+                n += 1
+                continue
+
+            run_end = n
+            while run_end < last and run_end + 1 not in self._cache:
+                run_end += 1
+
+            i = n
+            async for data in self._proxy._iter_stored_chunks(
+                    self._file_doc, n, run_end):
+                chunks[i] = data
+                self._cache_chunk(i, data)
+                i += 1
+            n = run_end + 1
+
+        return [chunks[i] for i in range(first, last + 1)]
+
+    def _cache_chunk(self, n, data):
+        if not self.cache_chunks:
+            return
+
+        self._cache[n] = data
+        while len(self._cache) > self.cache_chunks:
+            self._cache.popitem(last=False)
+
+
+class GridFSWriter:
+    """Writes a file to gridfs inserting up to ``concurrency`` chunks at
+    the same time. The files document is inserted by :meth:`close`, after
+    all the chunks, so readers never see a partial file.
+
+    Use :meth:`GridFSProxy.put` or :meth:`GridFSProxy.new_file` with the
+    ``concurrency`` argument to create one.
+
+    :param proxy: The :class:`GridFSProxy` of the file.
+    :param concurrency: Maximum number of chunks being inserted at the
+      same time.
+    :param dedupe: If True and there is already a file with the same
+      contents the chunks written are removed and the existing file is
+      used. See :class:`FileField`.
+    :param compression: The name of a codec or a
+      :class:`~mongomotor.compression.Codec` used to compress the
+      contents. See :class:`FileField`.
+    :param kwargs: The attributes of the file, like in
+      :meth:`gridfs.AsyncGridFS.new_file`.
+    """
+
+    def __init__(self, proxy, concurrency=4, dedupe=False, compression=None,
+                 **kwargs):
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+
+        if 'content_type' in kwargs:
+            kwargs['contentType'] = kwargs.pop('content_type')
+        if 'chunk_size' in kwargs:
+            kwargs['chunkSize'] = kwargs.pop('chunk_size')
+        kwargs.setdefault('_id', ObjectId())
+        kwargs.setdefault('chunkSize', DEFAULT_CHUNK_SIZE)
+
+        self._proxy = proxy
+        self.concurrency = concurrency
+        self.dedupe = dedupe
+        self._hash = hashlib.sha256() if dedupe else None
+        self._codec = None if compression is None else get_codec(compression)
+        self._compressor = self._codec and self._codec.compressobj()
+        self._original_length = 0
+        self._file = kwargs
+        self._buffer = bytearray()
+        self._chunk_number = 0
+        self._position = 0
+        self._pending = set()
+        self._ensured_indexes = False
+        self._closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            await self.close()
+        else:
+            await self.abort()
+
+    @property
+    def _id(self):
+        return self._file['_id']
+
+    @property
+    def chunk_size(self):
+        return self._file['chunkSize']
+
+    @property
+    def closed(self):
+        return self._closed
+
+    async def write(self, data):
+        """Writes ``data`` to the file.
+
+        :param data: Bytes, a bytes-like object, ie: a memoryview, that is
+          not copied, a file-like object with a ``read`` method, that may
+          be a coroutine function, or a string if the file has an
+          ``encoding``.
+        """
+        if self._closed:
+            raise ValueError('cannot write to a closed file')
+
+        if hasattr(data, 'read'):
+            while True:
+                piece = data.read(self.chunk_size)
+                if inspect.isawaitable(piece):
+                    piece = await piece
+                if not piece:
+                    break
+                await self.write(piece)
+            return
+
+        if isinstance(data, str):
+            encoding = self._file.get('encoding')
+            if encoding is None:
+                raise TypeError('must specify an encoding for file in order '
+                                'to write str')
+            data = data.encode(encoding)
+
+        view = memoryview(data).cast('B')
+        if self._hash is not None:
+            self._hash.update(view)
+
+        self._original_length += len(view)
+        if self._compressor is not None:
+            view = memoryview(await _run_codec(self._compressor.compress,
+                                               view))
+        await self._write_chunks(view)
+
+    async def _write_chunks(self, view):
+        start = 0
+        if self._buffer:
+            start = self.chunk_size - len(self._buffer)
+            self._buffer += view[:start]
+            if len(self._buffer) < self.chunk_size:
+                return
+            await self._insert_chunk(bytes(self._buffer))
+            self._buffer.clear()
+
+        while len(view) - start >= self.chunk_size:
+            end = start + self.chunk_size
+            await self._insert_chunk(bytes(view[start:end]))
+            start = end
+        self._buffer += view[start:]
+
+    async def close(self):
+        """Inserts the last chunk and the files document. If a chunk
+        failed the file is aborted and the error is raised."""
+
+        if self._closed:
+            return
+
+        try:
+            if self._compressor is not None:
+                await self._write_chunks(memoryview(self._compressor.flush()))
+                self._file['compression'] = self._codec.name
+                self._file['originalLength'] = Int64(self._original_length)
+
+            if self._buffer:
+                await self._insert_chunk(bytes(self._buffer))
+                self._buffer.clear()
+            await self._wait(asyncio.ALL_COMPLETED)
+            await self._ensure_indexes()
+            if self.dedupe:
+                digest = self._hash.hexdigest()
+                if await self._reuse(digest):
+                    return
+                self._file['sha256'] = digest
+                self._file['refcount'] = 1
+
+            self._file['length'] = Int64(self._position)
+            self._file['uploadDate'] = datetime.datetime.now(
+                tz=datetime.timezone.utc)
+            while True:
+                try:
+                    await self._proxy._files.insert_one(self._file)
+                    break
+                except DuplicateKeyError:
+                    if not self.dedupe or await self._proxy._files.find_one(
+                            {'_id': self._id}, {'_id': 1}):
+                        raise FileExists(
+                            'file with _id {!r} already exists'.format(
+                                self._id))
+                # someone else inserted the same contents meanwhile. If
+                # it was deleted before we could reuse it, insert again.
+                if await self._reuse(digest):
+                    return
+        except BaseException:
+            await self.abort()
+            raise
+        self._closed = True
+
+    async def abort(self):
+        """Cancels the chunks being inserted and removes the chunks
+        already inserted."""
+
+        for task in self._pending:
+            task.cancel()
+        if self._pending:
+            await asyncio.wait(self._pending)
+        self._pending = set()
+        self._closed = True
+        await self._proxy._chunks.delete_many({'files_id': self._id})
+
+    async def _reuse(self, digest):
+        """Uses the existing file with the same contents, if any,
+        removing the chunks written."""
+
+        file_id = await self._proxy._add_reference(digest)
+        if file_id is None:
+            return False
+
+        await self._proxy._chunks.delete_many({'files_id': self._id})
+        self._file['_id'] = file_id
+        self._closed = True
+        return True
+
+    async def _ensure_indexes(self):
+        if self._ensured_indexes:
+            return
+
+        await self._proxy._chunks.create_index(
+            [('files_id', 1), ('n', 1)], unique=True)
+        await self._proxy._files.create_index(
+            [('filename', 1), ('uploadDate', 1)])
+        if self.dedupe:
+            await self._proxy._files.create_index('sha256', unique=True,
+                                                  sparse=True)
+        self._ensured_indexes = True
+
+    async def _insert_chunk(self, data):
+        await self._ensure_indexes()
+        if len(self._pending) >= self.concurrency:
+            await self._wait(asyncio.FIRST_COMPLETED)
+
+        chunk = {'files_id': self._id, 'n': self._chunk_number, 'data': data}
+        task = asyncio.ensure_future(self._proxy._chunks.insert_one(chunk))
+        self._pending.add(task)
+        self._chunk_number += 1
+        self._position += len(data)
+
+    async def _wait(self, return_when):
+        if not self._pending:
+            return
+
+        done, self._pending = await asyncio.wait(self._pending,
+                                                 return_when=return_when)
+        for task in done:
+            exc = task.exception()
+            if isinstance(exc, DuplicateKeyError):
+                raise FileExists('file with _id {!r} already exists'.format(
+                    self._id))
+            if exc is not None:
+                raise exc
+
+
 class GridFSProxy(fields.GridFSProxy):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # (gridout, reader) used to read compressed files.
+        self._reader = None
+
+    def __getstate__(self):
+        state = dict(super().__getstate__())
+        state['_reader'] = None
+        return state
 
     async def __aenter__(self):
         return self
@@ -236,6 +676,10 @@ class GridFSProxy(fields.GridFSProxy):
     async def close(self):
         if self.newfile:
             await self.newfile.close()
+            if self.newfile._id != self.grid_id:
+                # a deduplicated file
+                self.grid_id = self.newfile._id
+                self._mark_as_changed()
             self.newfile = None
 
     async def write(self, data):
@@ -253,28 +697,387 @@ class GridFSProxy(fields.GridFSProxy):
             self.new_file()
         await self.newfile.write(data)
 
-    async def put(self, file_obj, **kwargs):
+    def new_file(self, concurrency=None, dedupe=None, compression=None,
+                 **kwargs):
+        """Creates a new file to be written with :meth:`write`.
+
+        :param concurrency: If not None a :class:`GridFSWriter` that
+          inserts up to ``concurrency`` chunks at the same time is used.
+        :param dedupe: Indicates if the file is deduplicated. If None the
+          option of the :class:`FileField` is used.
+        :param compression: The codec used to compress the file. If None
+          the option of the :class:`FileField` is used.
+        :param kwargs: The attributes of the file.
+        """
+        writer = self._get_writer(concurrency, dedupe, compression, kwargs)
+        if writer is None:
+            return super().new_file(**kwargs)
+
+        self.newfile = writer
+        self.grid_id = self.newfile._id
+        self._mark_as_changed()
+
+    async def put(self, file_obj, concurrency=None, dedupe=None,
+                  compression=None, **kwargs):
+        """Writes ``file_obj`` to gridfs.
+
+        :param file_obj: Bytes, a bytes-like object or a file-like object.
+        :param concurrency: If not None the chunks are inserted by a
+          :class:`GridFSWriter`, up to ``concurrency`` at the same time.
+        :param dedupe: Indicates if the file is deduplicated. If None the
+          option of the :class:`FileField` is used.
+        :param compression: The codec used to compress the file. If None
+          the option of the :class:`FileField` is used.
+        :param kwargs: The attributes of the file.
+        """
         if self.grid_id:
             raise GridFSError(
                 "This document already has a file. Either delete "
                 "it or call replace to overwrite it"
             )
-        self.grid_id = await self.fs.put(file_obj, **kwargs)
+
+        writer = self._get_writer(concurrency, dedupe, compression, kwargs)
+        if writer is None:
+            self.grid_id = await self.fs.put(file_obj, **kwargs)
+            self._mark_as_changed()
+            return
+
+        if writer.dedupe and isinstance(file_obj,
+                                        (bytes, bytearray, memoryview)):
+            # the contents are already in memory so we don't upload them
+            # if they are already there.
+            file_id = await self._add_reference(
+                hashlib.sha256(file_obj).hexdigest())
+            if file_id is not None:
+                self.grid_id = file_id
+                self._mark_as_changed()
+                return
+
+        async with writer:
+            await writer.write(file_obj)
+        self.grid_id = writer._id
         self._mark_as_changed()
 
+    def _get_writer(self, concurrency, dedupe, compression, kwargs):
+        """Returns the :class:`GridFSWriter` for a new file or None if
+        the file is written by gridfs."""
+
+        if dedupe is None:
+            dedupe = getattr(self._field, 'dedupe', False)
+        if compression is None:
+            compression = getattr(self._field, 'compression', None)
+
+        if concurrency is None and not dedupe and compression is None:
+            return None
+
+        return GridFSWriter(self, concurrency or 1, dedupe=dedupe,
+                            compression=compression, **kwargs)
+
     async def read(self, size=-1):
+        if size < 0 and self._cache is not None and self.grid_id is not None:
+            # the cached files are read without fetching the gridout.
+            try:
+                return bytes(await self.read_buffer())
+            except NoFile:
+                return None
+            except Exception:
+                return ""
+
         gridout = await self.get()
         if gridout is None:
             return None
         else:
             try:
-                return await gridout.read(size)
+                if getattr(gridout, 'compression', None) is None:
+                    return await gridout.read(size)
+                # size is the number of uncompressed bytes, read from
+                # where the last read stopped, like the gridout does.
+                reader = await self._get_reader(gridout)
+                return await reader.read(size)
             except Exception:
                 return ""
 
+    async def iter_chunks(self, chunk_size=None):
+        """Yields the contents of the file in chunks without reading the
+        whole file in memory.
+
+        .. code-block:: python
+
+            async for chunk in doc.file.iter_chunks():
+                await response.write(chunk)
+
+        :param chunk_size: The size of the yielded chunks. The last one may
+          be smaller. If None the chunks are the ones stored in gridfs.
+        """
+        if chunk_size is not None and chunk_size <= 0:
+            raise ValueError('chunk_size must be positive')
+
+        if self.grid_id is None:
+            return
+
+        file_doc = await self._get_file_doc()
+        chunks = self._iter_contents(file_doc)
+        try:
+            if chunk_size is None:
+                async for chunk in chunks:
+                    yield chunk
+                return
+
+            buf = bytearray()
+            async for chunk in chunks:
+                buf += chunk
+                while len(buf) >= chunk_size:
+                    yield bytes(buf[:chunk_size])
+                    del buf[:chunk_size]
+        finally:
+            await chunks.aclose()
+
+        if buf:
+            yield bytes(buf)
+
+    async def stream_to(self, writer, chunk_size=None):
+        """Writes the contents of the file to ``writer``, ie: an http
+        response, one chunk at a time. Returns the number of bytes written.
+
+        :param writer: An object with a ``write`` method. If ``write`` is
+          a coroutine function, like in aiohttp's ``StreamResponse``, it is
+          awaited. Otherwise, like in :class:`asyncio.StreamWriter`,
+          ``drain()`` is awaited after each chunk if the writer has it.
+        :param chunk_size: The size of the chunks written. See
+          :meth:`iter_chunks`.
+        """
+        written = 0
+        drain = getattr(writer, 'drain', None)
+        async for chunk in self.iter_chunks(chunk_size):
+            r = writer.write(chunk)
+            if inspect.isawaitable(r):
+                await r
+            elif drain is not None:
+                await drain()
+            written += len(chunk)
+        return written
+
+    async def open_reader(self, cache_chunks=0):
+        """Returns a :class:`GridFSReader` for the file. Raises NoFile
+        if there is no file. Close the reader when done, a compressed
+        file is kept open between reads.
+
+        .. code-block:: python
+
+            reader = await doc.file.open_reader(cache_chunks=4)
+            reader.seek(1024)
+            data = await reader.read(512)
+            await reader.close()
+
+        :param cache_chunks: How many chunks the reader keeps in memory.
+        """
+        if self.grid_id is None:
+            raise NoFile('There is no file')
+
+        file_doc = await self._get_file_doc()
+        return GridFSReader(self, file_doc, cache_chunks=cache_chunks)
+
+    async def read_range(self, start, end=None):
+        """Returns the bytes from ``start`` to ``end`` of the file,
+        fetching only the chunks in the range. Like in slices ``end`` is
+        not included, so the http range ``bytes=0-99`` is
+        ``read_range(0, 100)``.
+
+        :param start: The position of the first byte.
+        :param end: The position after the last byte. If None reads until
+          the end of the file.
+        """
+        reader = await self.open_reader()
+        reader.seek(start)
+        size = -1 if end is None else max(end - start, 0)
+        try:
+            return await reader.read(size)
+        finally:
+            await reader.close()
+
+    async def read_buffer(self, validate=False):
+        """Returns the contents of the file as a read-only memoryview.
+
+        If the field has a :class:`~mongomotor.filecache.FileCache` the
+        file is read from the local disk when it is cached and is cached
+        otherwise. Files bigger than the cache are not cached.
+
+        :param validate: If True the version of the cached file is
+          checked against gridfs, so a file replaced in other process is
+          not served from the cache. Otherwise cache hits don't touch
+          the database.
+        """
+        if self.grid_id is None:
+            raise NoFile('There is no file')
+
+        cache = self._cache
+        if cache is None:
+            return memoryview(await self.read_range(0))
+
+        if not validate:
+            buf = cache.get(self.grid_id)
+            if buf is not None:
+                return buf
+
+        file_doc = await self._get_file_doc()
+        version = file_version(file_doc)
+        buf = cache.get(self.grid_id, version) if validate else None
+        if buf is not None:
+            return buf
+
+        size = file_doc.get('originalLength', file_doc['length'])
+        if size > cache.max_size:
+            reader = GridFSReader(self, file_doc)
+            try:
+                return memoryview(await reader.read())
+            finally:
+                await reader.close()
+        return await cache.put(self.grid_id, version,
+                               self._iter_contents(file_doc))
+
+    @property
+    def _cache(self):
+        return getattr(self._field, 'cache', None)
+
+    @property
+    def _field(self):
+        """The :class:`FileField` of the proxy if it is known."""
+        if self.instance is None or self.key is None:
+            return None
+
+        field = self.instance._fields.get(self.key)
+        # Handle nested fields
+        if field is not None and not isinstance(field, fields.FileField):
+            field = getattr(field, 'field', None)
+        return field
+
+    @property
+    def _files(self):
+        return get_db(self.db_alias)[self.collection_name].files
+
+    @property
+    def _chunks(self):
+        return get_db(self.db_alias)[self.collection_name].chunks
+
+    async def _get_file_doc(self):
+        file_doc = await self._files.find_one({'_id': self.grid_id})
+        if file_doc is None:
+            raise NoFile('no file in gridfs collection {!r} with _id '
+                         '{!r}'.format(self.collection_name, self.grid_id))
+        return file_doc
+
+    async def _get_reader(self, gridout):
+        if self._reader is None or self._reader[0] is not gridout:
+            if self._reader is not None:
+                await self._reader[1].close()
+            reader = GridFSReader(self, await self._get_file_doc())
+            self._reader = (gridout, reader)
+        return self._reader[1]
+
+    async def _iter_contents(self, file_doc):
+        """Yields the contents of the file, decompressing them if the
+        file is compressed."""
+
+        chunks = self._iter_stored_chunks(file_doc)
+        compression = file_doc.get('compression')
+        try:
+            if compression is None:
+                async for chunk in chunks:
+                    yield chunk
+                return
+
+            decompressor = get_codec(compression).decompressobj()
+            async for chunk in chunks:
+                data = await _run_codec(decompressor.decompress, chunk)
+                if data:
+                    yield data
+        finally:
+            # closes the cursor if we stopped in the middle.
+            await chunks.aclose()
+
+        data = decompressor.flush()
+        if data:
+            yield data
+
+    async def _iter_stored_chunks(self, file_doc, first=0, last=None):
+        """Yields the data of the chunks ``first`` to ``last`` of a file
+        as stored in gridfs. Raises CorruptGridFile if a chunk is missing
+        or truncated."""
+
+        length = file_doc['length']
+        size = file_doc['chunkSize']
+        num_chunks = math.ceil(length / size)
+        last = num_chunks - 1 if last is None else min(last, num_chunks - 1)
+        if first > last:
+            return
+
+        cursor = self._chunks.find(
+            {'files_id': file_doc['_id'], 'n': {'$gte': first, '$lte': last}},
+            sort=[('n', 1)], batch_size=CHUNKS_BATCH_SIZE)
+        expected = first
+        try:
+            async for chunk in cursor:
+                if chunk['n'] != expected:
+                    raise CorruptGridFile(
+                        'Missing chunk: expected chunk #{} but found chunk '
+                        'with n={}'.format(expected, chunk['n']))
+
+                expected_length = size if expected < num_chunks - 1 \
+                    else length - size * (num_chunks - 1)
+                if len(chunk['data']) != expected_length:
+                    raise CorruptGridFile(
+                        'truncated chunk #{}: expected chunk length to be {} '
+                        'but found chunk with length {}'.format(
+                            expected, expected_length, len(chunk['data'])))
+                yield chunk['data']
+                expected += 1
+        finally:
+            await cursor.close()
+
+        if expected <= last:
+            raise CorruptGridFile('no chunk #{}'.format(expected))
+
+    async def _add_reference(self, digest):
+        """Increments the reference count of the file with the sha256
+        ``digest``. Returns the id of the file or None if there is no
+        file with these contents."""
+
+        file_doc = await self._files.find_one_and_update(
+            {'sha256': digest}, {'$inc': {'refcount': 1}},
+            projection={'_id': 1})
+        return None if file_doc is None else file_doc['_id']
+
+    async def _remove_reference(self):
+        """Decrements the reference count of the file and removes it
+        from gridfs if it was the last reference. Files not deduplicated
+        have no reference count and are always removed."""
+
+        while True:
+            file_doc = await self._files.find_one_and_update(
+                {'_id': self.grid_id, 'refcount': {'$gt': 1}},
+                {'$inc': {'refcount': -1}}, projection={'_id': 1})
+            if file_doc is not None:
+                return
+
+            file_doc = await self._files.find_one_and_delete(
+                {'_id': self.grid_id,
+                 '$or': [{'refcount': {'$exists': False}},
+                         {'refcount': {'$lte': 1}}]},
+                projection={'_id': 1})
+            if file_doc is None and await self._files.find_one(
+                    {'_id': self.grid_id}, {'_id': 1}):
+                # a reference was added meanwhile.
+                continue
+
+            await self._chunks.delete_many({'files_id': self.grid_id})
+            return
+
     async def delete(self):
-        # Delete file from GridFS, FileField still remains
-        await self.fs.delete(self.grid_id)
+        # Delete file from GridFS, FileField still remains. Deduplicated
+        # files are only deleted when the last reference goes.
+        await self._remove_reference()
+        if self._cache is not None:
+            self._cache.remove(self.grid_id)
         self.grid_in = None
         self.grid_id = None
         self.grid_out = None
@@ -291,5 +1094,27 @@ class GridFSProxy(fields.GridFSProxy):
 
 
 class FileField(fields.FileField):
+    """A GridFS storage field.
+
+    :param dedupe: If True the files are stored by their contents. Putting
+      a file with the same contents as an existing one only increments the
+      reference count of the existing file, that is removed from gridfs
+      when the last reference is deleted.
+    :param compression: The name of a registered codec, ie: ``zlib`` or
+      ``lzma``, or a :class:`~mongomotor.compression.Codec` used to
+      compress the files. See :mod:`mongomotor.compression`.
+    :param cache: A :class:`~mongomotor.filecache.FileCache` used by
+      :meth:`GridFSProxy.read_buffer` to keep the files in the local disk.
+    """
 
     proxy_class = GridFSProxy
+
+    def __init__(self, *args, dedupe=False, compression=None, cache=None,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = cache
+        self.dedupe = dedupe
+        if compression is not None:
+            # fails early for unknown codecs.
+            get_codec(compression)
+        self.compression = compression
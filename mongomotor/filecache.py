@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+"""A local disk cache for gridfs files that are read often.
+
+.. code-block:: python
+
+    cache = FileCache('/var/cache/myapp', max_size=512 * 1024 ** 2)
+
+    class Template(Document):
+        body = FileField(cache=cache)
+
+    buf = await template.body.read_buffer()
+
+The files are stored by their gridfs id and version, the md5 or the
+upload date, and the least recently used ones are removed when the cache
+is bigger than ``max_size``. Hits are memory-mapped, so they are served
+without network and without copying the file.
+"""
+
+import asyncio
+from collections import OrderedDict
+import hashlib
+import mmap
+import os
+import re
+import uuid
+import weakref
+
+# Separates the id and the version of a file in the cache file names.
+_SEP = '_'
+_TMP_SUFFIX = '.tmp'
+_SAFE_NAME = re.compile('[0-9A-Za-z]+')
+
+
+def file_version(file_doc):
+    """Returns the version of a gridfs file, its md5 or, for the files
+    without md5, the upload date."""
+
+    md5 = file_doc.get('md5')
+    if md5:
+        return md5
+    return '{:.0f}'.format(file_doc['uploadDate'].timestamp() * 1e6)
+
+
+class FileCache:
+    """A LRU cache of gridfs files in a local directory.
+
+    :param path: The directory of the cache. It is created if it does not
+      exist and the files already there are used.
+    :param max_size: The maximum size of the cache in bytes.
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        # grid_id -> (version, size), the least recently used first.
+        self._index = OrderedDict()
+        self.size = 0
+        # key -> lock held while the file is written to the cache.
+        self._locks = weakref.WeakValueDictionary()
+        self.reset_stats()
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    def reset_stats(self):
+        """Zeroes the counters returned by :meth:`stats`."""
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def stats(self):
+        """Returns a dict with the size and the counters of the cache."""
+        return {'files': len(self._index),
+                'size': self.size,
+                'max_size': self.max_size,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions}
+
+    def get(self, grid_id, version=None):
+        """Returns a read-only memoryview of the cached contents of a file
+        or None if the file is not cached.
+
+        :param grid_id: The id of the gridfs file.
+        :param version: The version of the file, see :func:`file_version`.
+          If None any cached version is returned.
+        """
+        buf = self._lookup(self._key(grid_id), version)
+        if buf is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+        return buf
+
+    async def put(self, grid_id, version, chunks):
+        """Writes the contents of a file to the cache and returns them as
+        a read-only memoryview. A file bigger than ``max_size`` is removed
+        right away, but the memoryview returned is still valid. If the
+        same file is being written by another task, waits for it instead
+        of writing it again.
+
+        :param grid_id: The id of the gridfs file.
+        :param version: The version of the file.
+        :param chunks: An async iterable with the contents of the file.
+        """
+        key = self._key(grid_id)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+
+        async with lock:
+            # written by other task while we waited.
+            buf = self._lookup(key, version)
+            if buf is not None:
+                return buf
+            return await self._write(key, self._safe_name(version), chunks)
+
+    async def _write(self, key, version, chunks):
+        self._remove(key)
+        tmp = os.path.join(self.path, uuid.uuid4().hex + _TMP_SUFFIX)
+        size = 0
+        try:
+            with open(tmp, 'wb') as fd:
+                async for chunk in chunks:
+                    fd.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            self._unlink(tmp)
+            raise
+
+        filename = self._filename(key, version)
+        os.replace(tmp, filename)
+        buf = self._map(filename, size)
+        self._index[key] = (version, size)
+        self.size += size
+        self._evict()
+        return buf
+
+    def remove(self, grid_id):
+        """Removes a file from the cache."""
+        self._remove(self._key(grid_id))
+
+    def clear(self):
+        """Removes all the files from the cache."""
+        for key in list(self._index):
+            self._remove(key)
+
+    def _key(self, grid_id):
+        # the ids may have any type, and strings may have anything, so
+        # they are hashed to be used in the file names.
+        name = '{}:{}'.format(type(grid_id).__name__, grid_id)
+        return hashlib.sha256(name.encode('utf-8')).hexdigest()
+
+    def _safe_name(self, version):
+        if _SAFE_NAME.fullmatch(version):
+            return version
+        return hashlib.sha256(version.encode('utf-8')).hexdigest()
+
+    def _lookup(self, key, version):
+        entry = self._index.get(key)
+        if version is not None:
+            version = self._safe_name(version)
+        if entry is None or (version is not None and entry[0] != version):
+            return None
+
+        try:
+            buf = self._map(self._filename(key, entry[0]), entry[1])
+        except FileNotFoundError:
+            # removed by someone else.
+            self._forget(key)
+            return None
+
+        self._index.move_to_end(key)
+        return buf
+
+    def _remove(self, key):
+        entry = self._index.get(key)
+        if entry is not None:
+            self._unlink(self._filename(key, entry[0]))
+            self._forget(key)
+
+    def _filename(self, key, version):
+        return os.path.join(self.path, key + _SEP + version)
+
+    def _map(self, filename, size):
+        if not size:
+            return memoryview(b'')
+
+        with open(filename, 'rb') as fd:
+            # the mapping stays valid after the file is closed, and after
+            # it is removed from the cache.
+            return memoryview(mmap.mmap(fd.fileno(), 0,
+                                        access=mmap.ACCESS_READ))
+
+    def _forget(self, key):
+        version, size = self._index.pop(key)
+        self.size -= size
+
+    def _evict(self):
+        while self.size > self.max_size and self._index:
+            key = next(iter(self._index))
+            self._remove(key)
+            self._evictions += 1
+
+    def _unlink(self, filename):
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            pass
+
+    def _load(self):
+        """Indexes the files already in the cache directory, the older
+        ones as the least recently used."""
+
+        entries = []
+        for entry in os.scandir(self.path):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(_TMP_SUFFIX):
+                # left by an interrupted put.
+                self._unlink(entry.path)
+                continue
+
+            key, sep, version = entry.name.partition(_SEP)
+            if not sep:
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, key, version, stat.st_size))
+
+        for _, key, version, size in sorted(entries):
+            if key in self._index:
+                self._remove(key)
+            self._index[key] = (version, size)
+            self.size += size
+        self._evict()
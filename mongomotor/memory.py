@@ -0,0 +1,1894 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+"""An in-memory backend implementing the part of the async pymongo api
+used by mongomotor. It is selected with ``connect(backend='memory')`` and
+is meant for tests and benchmarks that don't need a real server.
+
+.. code-block:: python
+
+    connect('mydb', backend='memory')
+
+The data lives in the client and is gone when the connection is closed.
+Supported are find with filter, sort, skip, limit and projection,
+count_documents, distinct, the insert, update, replace and delete
+methods, the find_one_and_* methods, the indexes (only the unique ones
+are enforced) and the aggregation stages $match, $project, $addFields,
+$set, $unset, $sort, $skip, $limit, $unwind, $group, $count,
+$sortByCount, $replaceRoot, $replaceWith, $facet and $lookup (with
+localField and foreignField). Anything else, ie: $where, $text, map
+reduce or GridFS, raises :class:`pymongo.errors.OperationFailure`.
+"""
+
+from collections import deque
+import datetime
+from decimal import Decimal
+import functools
+import math
+import random
+import re
+import uuid
+from bson import Binary, DBRef, Decimal128, ObjectId, Regex, Timestamp
+from bson.max_key import MaxKey
+from bson.min_key import MinKey
+from pymongo import ReturnDocument
+from pymongo.errors import (BulkWriteError, DuplicateKeyError,
+                            InvalidOperation, OperationFailure, WriteError)
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import ReadPreference
+from pymongo.results import (DeleteResult, InsertManyResult,
+                             InsertOneResult, UpdateResult)
+from pymongo.write_concern import WriteConcern
+
+# The version reported for the memory backend.
+SERVER_VERSION = (7, 0)
+
+# Code of the errors of the commands not supported by the server.
+COMMAND_NOT_SUPPORTED = 115
+
+_MISSING = object()
+_Pattern = type(re.compile(''))
+
+
+def _unsupported(what):
+    return OperationFailure(
+        '{} is not supported by the memory backend'.format(what),
+        COMMAND_NOT_SUPPORTED)
+
+
+def _copy(value):
+    """Copies the containers of a document. The other bson values are
+    immutable."""
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_copy(v) for v in value]
+    return value
+
+
+def _hashable(value):
+    """Returns a hashable version of a value, used to group and to find
+    documents by id."""
+    if isinstance(value, dict):
+        return ('d', tuple((k, _hashable(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return ('l', tuple(_hashable(v) for v in value))
+    if isinstance(value, bool):
+        return ('b', value)
+    try:
+        hash(value)
+    except TypeError:
+        return ('r', repr(value))
+    return value
+
+
+# Comparison
+
+def _rank(value):
+    """The position of the type of a value in the bson sort order."""
+    if isinstance(value, MinKey):
+        return -1
+    if value is None or value is _MISSING:
+        return 0
+    if isinstance(value, bool):
+        return 7
+    if isinstance(value, (int, float, Decimal128, Decimal)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, (dict, DBRef)):
+        return 3
+    if isinstance(value, (list, tuple)):
+        return 4
+    if isinstance(value, (bytes, Binary, uuid.UUID)):
+        return 5
+    if isinstance(value, ObjectId):
+        return 6
+    if isinstance(value, datetime.datetime):
+        return 8
+    if isinstance(value, Timestamp):
+        return 9
+    if isinstance(value, (_Pattern, Regex)):
+        return 10
+    if isinstance(value, MaxKey):
+        return 11
+    return 12
+
+
+def _normalize(value):
+    if isinstance(value, Decimal128):
+        return value.to_decimal()
+    if isinstance(value, DBRef):
+        return value.as_doc()
+    if isinstance(value, uuid.UUID):
+        return value.bytes
+    if isinstance(value, (_Pattern, Regex)):
+        return (value.pattern, value.flags)
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        return value.replace(tzinfo=None) - value.utcoffset()
+    if isinstance(value, float) and math.isnan(value):
+        return float('-inf')
+    return value
+
+
+def _compare(a, b):
+    """Compares two values like the server does."""
+    rank_a, rank_b = _rank(a), _rank(b)
+    if rank_a != rank_b:
+        return -1 if rank_a < rank_b else 1
+
+    if rank_a in (-1, 0, 11):
+        return 0
+
+    a, b = _normalize(a), _normalize(b)
+    if rank_a == 3:
+        for (ka, va), (kb, vb) in zip(a.items(), b.items()):
+            r = _compare(ka, kb) or _compare(va, vb)
+            if r:
+                return r
+        return (len(a) > len(b)) - (len(a) < len(b))
+
+    if rank_a == 4:
+        for va, vb in zip(a, b):
+            r = _compare(va, vb)
+            if r:
+                return r
+        return (len(a) > len(b)) - (len(a) < len(b))
+
+    try:
+        return (a > b) - (a < b)
+    except TypeError:
+        return 0
+
+
+def _equals(a, b):
+    return _compare(a, b) == 0
+
+
+def _truthy(value):
+    if value is None or value is _MISSING or value is False:
+        return False
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value != 0
+    return True
+
+
+# Paths
+
+def _lookup(value, parts):
+    """Returns the values found in a path. Arrays in the middle of the
+    path are traversed."""
+    if not parts:
+        return [value]
+
+    key, rest = parts[0], parts[1:]
+    if isinstance(value, dict):
+        if key not in value:
+            return []
+        return _lookup(value[key], rest)
+
+    if isinstance(value, list):
+        found = []
+        if key.isdigit() and int(key) < len(value):
+            found.extend(_lookup(value[int(key)], rest))
+        for item in value:
+            if isinstance(item, dict):
+                found.extend(_lookup(item, parts))
+        return found
+
+    return []
+
+
+def _get_child(container, part):
+    if isinstance(container, dict):
+        return container.get(part, _MISSING)
+    if isinstance(container, list):
+        try:
+            index = int(part)
+        except ValueError:
+            return _MISSING
+        return container[index] if index < len(container) else _MISSING
+    return _MISSING
+
+
+def _get_path(doc, parts):
+    value = doc
+    for part in parts:
+        value = _get_child(value, part)
+        if value is _MISSING:
+            break
+    return value
+
+
+def _put_child(container, part, value):
+    if isinstance(container, list):
+        index = int(part)
+        while len(container) <= index:
+            container.append(None)
+        container[index] = value
+    else:
+        container[part] = value
+
+
+def _set_path(doc, parts, value):
+    container = doc
+    for part in parts[:-1]:
+        child = _get_child(container, part)
+        if child is _MISSING or child is None:
+            child = {}
+            _put_child(container, part, child)
+        elif not isinstance(child, (dict, list)):
+            raise WriteError("Cannot create field '{}' in element {{{}: {!r}}}"
+                             .format(parts[-1], part, child), 28)
+        container = child
+    _put_child(container, parts[-1], value)
+
+
+def _unset_path(doc, parts):
+    parent = _get_path(doc, parts[:-1])
+    if isinstance(parent, dict):
+        parent.pop(parts[-1], None)
+    elif isinstance(parent, list):
+        index = int(parts[-1])
+        if index < len(parent):
+            parent[index] = None
+
+
+def _iter_query_fields(query):
+    """Yields the field conditions of a query, including the ones
+    inside $and."""
+    for key, cond in query.items():
+        if key == '$and':
+            for sub in cond:
+                yield from _iter_query_fields(sub)
+        else:
+            yield key, cond
+
+
+# Queries
+
+def _regex(value, options=''):
+    if isinstance(value, _Pattern):
+        return value
+    if isinstance(value, Regex):
+        return value.try_compile()
+
+    flags = 0
+    for option, flag in (('i', re.I), ('m', re.M), ('s', re.S), ('x', re.X)):
+        if option in options:
+            flags |= flag
+    return re.compile(value, flags)
+
+
+def _any(values, pred):
+    """Checks ``pred`` against the values and the elements of the
+    values that are arrays."""
+    for value in values:
+        if pred(value):
+            return True
+        if isinstance(value, list) and any(pred(v) for v in value):
+            return True
+    return False
+
+
+def _match_eq(values, arg):
+    if isinstance(arg, (_Pattern, Regex)):
+        regex = _regex(arg)
+        return _any(values, lambda v: isinstance(v, str) and bool(
+            regex.search(v)))
+
+    if arg is None and not values:
+        return True
+    return _any(values, lambda v: _equals(v, arg))
+
+
+def _is_operators(cond):
+    return isinstance(cond, dict) and bool(cond) and all(
+        k.startswith('$') for k in cond)
+
+
+_TYPES = {'double': (float,), 'string': (str,), 'object': (dict,),
+          'array': (list,), 'binData': (bytes, Binary, uuid.UUID),
+          'objectId': (ObjectId,), 'bool': (bool,),
+          'date': (datetime.datetime,), 'null': (type(None),),
+          'regex': (_Pattern, Regex), 'int': (int,), 'long': (int,),
+          'timestamp': (Timestamp,), 'decimal': (Decimal128,),
+          'number': (int, float, Decimal128)}
+_TYPE_CODES = {1: 'double', 2: 'string', 3: 'object', 4: 'array',
+               5: 'binData', 7: 'objectId', 8: 'bool', 9: 'date',
+               10: 'null', 11: 'regex', 16: 'int', 17: 'timestamp',
+               18: 'long', 19: 'decimal'}
+
+
+def _is_type(value, name):
+    name = _TYPE_CODES.get(name, name)
+    if name not in _TYPES:
+        raise _unsupported('$type {}'.format(name))
+    if isinstance(value, bool) and name != 'bool':
+        return False
+    return isinstance(value, _TYPES[name])
+
+
+def _match_operator(values, op, arg, cond):
+    if op == '$eq':
+        return _match_eq(values, arg)
+    if op == '$ne':
+        return not _match_eq(values, arg)
+    if op in ('$gt', '$gte', '$lt', '$lte'):
+        if arg is None and op in ('$gte', '$lte'):
+            return _match_eq(values, None)
+
+        def pred(v):
+            if _rank(v) != _rank(arg):
+                return False
+            r = _compare(v, arg)
+            return {'$gt': r > 0, '$gte': r >= 0,
+                    '$lt': r < 0, '$lte': r <= 0}[op]
+
+        return _any(values, pred)
+    if op == '$in':
+        return any(_match_eq(values, a) for a in arg)
+    if op == '$nin':
+        return not any(_match_eq(values, a) for a in arg)
+    if op == '$exists':
+        return bool(values) == bool(arg)
+    if op == '$size':
+        return any(isinstance(v, list) and len(v) == arg for v in values)
+    if op == '$all':
+        if not arg:
+            return False
+        return all(
+            _match_operator(values, '$elemMatch', a['$elemMatch'], a)
+            if isinstance(a, dict) and '$elemMatch' in a
+            else _match_eq(values, a) for a in arg)
+    if op == '$elemMatch':
+        return any(isinstance(v, list) and any(_elem_match(e, arg)
+                                               for e in v)
+                   for v in values)
+    if op == '$not':
+        return not _match_cond(values, arg)
+    if op == '$regex':
+        regex = _regex(arg, cond.get('$options', ''))
+        return _any(values, lambda v: isinstance(v, str) and bool(
+            regex.search(v)))
+    if op == '$options':
+        return True
+    if op == '$mod':
+        divisor, remainder = arg
+        return _any(values, lambda v: isinstance(
+            v, (int, float)) and not isinstance(v, bool) and
+            v % divisor == remainder)
+    if op == '$type':
+        types = arg if isinstance(arg, list) else [arg]
+        return any(_any(values, lambda v: _is_type(v, t)) for t in types)
+
+    raise _unsupported(op)
+
+
+def _match_cond(values, cond):
+    if isinstance(cond, (_Pattern, Regex)):
+        return _match_eq(values, cond)
+    if _is_operators(cond):
+        return all(_match_operator(values, op, arg, cond)
+                   for op, arg in cond.items())
+    return _match_eq(values, cond)
+
+
+def _elem_match(element, cond):
+    if _is_operators(cond) and not any(
+            k in ('$and', '$or', '$nor', '$expr') for k in cond):
+        return all(_match_operator([element], op, arg, cond)
+                   for op, arg in cond.items())
+    return isinstance(element, dict) and _match(element, cond)
+
+
+def _match(doc, query):
+    """Checks if a document matches a query."""
+    for key, cond in query.items():
+        if key == '$and':
+            if not all(_match(doc, q) for q in cond):
+                return False
+        elif key == '$or':
+            if not any(_match(doc, q) for q in cond):
+                return False
+        elif key == '$nor':
+            if any(_match(doc, q) for q in cond):
+                return False
+        elif key == '$expr':
+            if not _truthy(_evaluate(cond, doc)):
+                return False
+        elif key == '$comment':
+            continue
+        elif key.startswith('$'):
+            raise _unsupported(key)
+        elif not _match_cond(_lookup(doc, key.split('.')), cond):
+            return False
+    return True
+
+
+# Sorting and projection
+
+def _sort_value(doc, key, direction):
+    values = _lookup(doc, key.split('.'))
+    flat = []
+    for value in values:
+        if isinstance(value, list):
+            flat.extend(value)
+        else:
+            flat.append(value)
+
+    if not flat:
+        return None
+
+    cmp = functools.cmp_to_key(_compare)
+    return min(flat, key=cmp) if direction > 0 else max(flat, key=cmp)
+
+
+def _sort_items(sort):
+    if isinstance(sort, dict):
+        return list(sort.items())
+    return [(k, d) for k, d in sort]
+
+
+def _sort_docs(docs, sort):
+    docs = list(docs)
+    for key, direction in reversed(_sort_items(sort)):
+        if isinstance(direction, dict):
+            raise _unsupported('sorting by $meta')
+
+        def sort_key(doc, key=key, direction=direction):
+            return _sort_value(doc, key, direction)
+
+        docs.sort(key=functools.cmp_to_key(
+            lambda a, b: _compare(sort_key(a), sort_key(b))),
+            reverse=direction < 0)
+    return docs
+
+
+def _add_to_tree(tree, path):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        sub = tree.get(part)
+        if sub is True:
+            return
+        tree = tree.setdefault(part, {})
+    tree[parts[-1]] = True
+
+
+def _filter_include(doc, tree):
+    out = {}
+    for key, value in doc.items():
+        if key not in tree:
+            continue
+        sub = tree[key]
+        if sub is True:
+            out[key] = value
+        elif isinstance(value, dict):
+            out[key] = _filter_include(value, sub)
+        elif isinstance(value, list):
+            out[key] = [_filter_include(v, sub) for v in value
+                        if isinstance(v, dict)]
+    return out
+
+
+def _filter_exclude(doc, tree):
+    out = {}
+    for key, value in doc.items():
+        if key in tree:
+            sub = tree[key]
+            if sub is True:
+                continue
+            if isinstance(value, dict):
+                value = _filter_exclude(value, sub)
+            elif isinstance(value, list):
+                value = [_filter_exclude(v, sub) if isinstance(v, dict)
+                         else v for v in value]
+        out[key] = value
+    return out
+
+
+def _project(doc, projection):
+    """Applies a find projection to a document."""
+    if not projection:
+        return doc
+
+    if not isinstance(projection, dict):
+        projection = {k: 1 for k in projection}
+
+    include_id = _truthy(projection.get('_id', True))
+    specials = {k: v for k, v in projection.items()
+                if isinstance(v, dict)}
+    fields = {k: v for k, v in projection.items()
+              if k != '_id' and k not in specials}
+
+    tree = {}
+    inclusion = any(_truthy(v) for v in fields.values())
+    for path, value in fields.items():
+        if _truthy(value) == inclusion:
+            _add_to_tree(tree, path)
+
+    if inclusion:
+        for path, spec in specials.items():
+            if '$slice' in spec or '$elemMatch' in spec:
+                _add_to_tree(tree, path)
+        if include_id:
+            tree['_id'] = True
+        out = _filter_include(doc, tree)
+    elif fields or not include_id:
+        if not include_id:
+            tree['_id'] = True
+        out = _filter_exclude(doc, tree)
+    else:
+        out = dict(doc)
+
+    for path, spec in specials.items():
+        parts = path.split('.')
+        value = _get_path(out, parts)
+        if not isinstance(value, list):
+            continue
+        if '$slice' in spec:
+            arg = spec['$slice']
+            if isinstance(arg, list):
+                skip, limit = arg
+                value = value[skip:][:limit]
+            else:
+                value = value[:arg] if arg >= 0 else value[arg:]
+            _set_path(out, parts, value)
+        elif '$elemMatch' in spec:
+            matched = [e for e in value if _elem_match(e, spec['$elemMatch'])]
+            if matched:
+                _set_path(out, parts, matched[:1])
+            else:
+                _unset_path(out, parts)
+        elif '$meta' in spec:
+            raise _unsupported('$meta')
+
+    return out
+
+
+# Updates
+
+def _positional_index(doc, parts, query):
+    """Returns the index of the element of the array in ``parts`` matched
+    by the query, for the positional operator ``$``."""
+    path = '.'.join(str(p) for p in parts)
+    array = _get_path(doc, parts)
+    conds = []
+    for key, cond in _iter_query_fields(query or {}):
+        if key == path:
+            conds.append(([], cond))
+        elif key.startswith(path + '.'):
+            conds.append((key[len(path) + 1:].split('.'), cond))
+
+    if isinstance(array, list) and conds:
+        for i, element in enumerate(array):
+            if all(_match_element(element, sub, cond)
+                   for sub, cond in conds):
+                return i
+
+    raise WriteError('The positional operator did not find the match '
+                     'needed from the query.', 2)
+
+
+def _match_element(element, parts, cond):
+    if not parts and isinstance(cond, dict) and '$elemMatch' in cond:
+        return _elem_match(element, cond['$elemMatch'])
+    values = _lookup(element, parts) if parts else [element]
+    return _match_cond(values, cond)
+
+
+def _match_array_filter(element, ident, array_filters):
+    for array_filter in array_filters or ():
+        for key, cond in array_filter.items():
+            if key == ident:
+                if not _match_element(element, [], cond):
+                    return False
+            elif key.startswith(ident + '.'):
+                parts = key[len(ident) + 1:].split('.')
+                if not _match_element(element, parts, cond):
+                    return False
+    return True
+
+
+def _update_paths(doc, parts, query, array_filters):
+    """Expands the positional operators in ``parts``."""
+    paths = [[]]
+    for i, part in enumerate(parts):
+        expanded = []
+        for prefix in paths:
+            if part == '$':
+                expanded.append(
+                    prefix + [_positional_index(doc, prefix, query)])
+            elif part.startswith('$['):
+                array = _get_path(doc, prefix)
+                if not isinstance(array, list):
+                    continue
+                ident = part[2:-1]
+                expanded.extend(
+                    prefix + [j] for j, e in enumerate(array)
+                    if not ident or _match_array_filter(e, ident,
+                                                        array_filters))
+            else:
+                expanded.append(prefix + [part])
+        paths = expanded
+    return paths
+
+
+def _number(value, op, parts):
+    if isinstance(value, bool) or not isinstance(
+            value, (int, float, Decimal128)):
+        raise WriteError('Cannot apply {} to a value of non-numeric type. '
+                         '{{_id: ...}} has the field {} of non-numeric '
+                         'type'.format(op, parts[-1]), 14)
+    return value
+
+
+def _array(doc, parts, op):
+    value = _get_path(doc, parts)
+    if value is _MISSING:
+        return None
+    if not isinstance(value, list):
+        raise WriteError("The field '{}' must be an array but is of type "
+                         "{} in document {{_id: ...}}".format(
+                             parts[-1], type(value).__name__), 2)
+    return value
+
+
+def _op_set(doc, parts, arg):
+    _set_path(doc, parts, _copy(arg))
+
+
+def _op_unset(doc, parts, arg):
+    _unset_path(doc, parts)
+
+
+def _op_inc(doc, parts, arg):
+    value = _get_path(doc, parts)
+    if value is _MISSING:
+        _set_path(doc, parts, arg)
+    else:
+        _set_path(doc, parts, _number(value, '$inc', parts) + arg)
+
+
+def _op_mul(doc, parts, arg):
+    value = _get_path(doc, parts)
+    if value is _MISSING:
+        _set_path(doc, parts, type(arg)(0))
+    else:
+        _set_path(doc, parts, _number(value, '$mul', parts) * arg)
+
+
+def _op_min(doc, parts, arg):
+    value = _get_path(doc, parts)
+    if value is _MISSING or _compare(arg, value) < 0:
+        _set_path(doc, parts, _copy(arg))
+
+
+def _op_max(doc, parts, arg):
+    value = _get_path(doc, parts)
+    if value is _MISSING or _compare(arg, value) > 0:
+        _set_path(doc, parts, _copy(arg))
+
+
+def _op_rename(doc, parts, arg):
+    value = _get_path(doc, parts)
+    if value is _MISSING:
+        return
+    _unset_path(doc, parts)
+    _set_path(doc, arg.split('.'), value)
+
+
+def _op_current_date(doc, parts, arg):
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    if isinstance(arg, dict) and arg.get('$type') == 'timestamp':
+        value = Timestamp(now, 1)
+    else:
+        value = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    _set_path(doc, parts, value)
+
+
+def _op_push(doc, parts, arg):
+    value = _array(doc, parts, '$push')
+    value = [] if value is None else value
+    if isinstance(arg, dict) and '$each' in arg:
+        items = _copy(arg['$each'])
+        position = arg.get('$position')
+        if position is None:
+            value.extend(items)
+        else:
+            value[position:position] = items
+
+        if '$sort' in arg:
+            sort = arg['$sort']
+            if isinstance(sort, dict):
+                value[:] = _sort_docs(value, sort)
+            else:
+                value.sort(key=functools.cmp_to_key(_compare),
+                           reverse=sort < 0)
+
+        if '$slice' in arg:
+            n = arg['$slice']
+            value[:] = value[:n] if n >= 0 else value[n:]
+    else:
+        value.append(_copy(arg))
+    _set_path(doc, parts, value)
+
+
+def _op_add_to_set(doc, parts, arg):
+    value = _array(doc, parts, '$addToSet')
+    value = [] if value is None else value
+    items = arg['$each'] if isinstance(arg, dict) and '$each' in arg \
+        else [arg]
+    for item in items:
+        if not any(_equals(v, item) for v in value):
+            value.append(_copy(item))
+    _set_path(doc, parts, value)
+
+
+def _op_pop(doc, parts, arg):
+    value = _array(doc, parts, '$pop')
+    if value:
+        value.pop(0 if arg < 0 else -1)
+
+
+def _op_pull(doc, parts, arg):
+    value = _array(doc, parts, '$pull')
+    if not value:
+        return
+
+    if isinstance(arg, dict) and not _is_operators(arg):
+        def matches(e):
+            return isinstance(e, dict) and _match(e, arg)
+    else:
+        def matches(e):
+            return _match_cond([e], arg)
+
+    value[:] = [e for e in value if not matches(e)]
+
+
+def _op_pull_all(doc, parts, arg):
+    value = _array(doc, parts, '$pullAll')
+    if value:
+        value[:] = [e for e in value
+                    if not any(_equals(e, a) for a in arg)]
+
+
+_UPDATE_OPERATORS = {'$set': _op_set,
+                     '$setOnInsert': _op_set,
+                     '$unset': _op_unset,
+                     '$inc': _op_inc,
+                     '$mul': _op_mul,
+                     '$min': _op_min,
+                     '$max': _op_max,
+                     '$rename': _op_rename,
+                     '$currentDate': _op_current_date,
+                     '$push': _op_push,
+                     '$addToSet': _op_add_to_set,
+                     '$pop': _op_pop,
+                     '$pull': _op_pull,
+                     '$pullAll': _op_pull_all}
+
+
+def _is_replacement(update):
+    return not isinstance(update, list) and not any(
+        k.startswith('$') for k in update)
+
+
+def _apply_update(doc, update, query=None, array_filters=None,
+                  is_insert=False):
+    """Returns a copy of ``doc`` with ``update`` applied."""
+    if isinstance(update, list):
+        return _aggregate([doc], update, None)[0]
+
+    new = _copy(doc)
+    for op, fields in update.items():
+        if op == '$setOnInsert' and not is_insert:
+            continue
+        try:
+            func = _UPDATE_OPERATORS[op]
+        except KeyError:
+            raise _unsupported(op)
+
+        for path, arg in fields.items():
+            for parts in _update_paths(new, path.split('.'), query,
+                                       array_filters):
+                func(new, parts, arg)
+    return new
+
+
+def _upsert_doc(query):
+    """Returns the document created by an upsert from the equality
+    conditions of the query."""
+    doc = {}
+    for key, cond in _iter_query_fields(query):
+        if key.startswith('$') or isinstance(cond, (_Pattern, Regex)):
+            continue
+        if _is_operators(cond):
+            if '$eq' not in cond:
+                continue
+            cond = cond['$eq']
+        _set_path(doc, key.split('.'), _copy(cond))
+    return doc
+
+
+# Aggregation
+
+def _field_value(value, parts):
+    for i, part in enumerate(parts):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list):
+            values = [_field_value(v, parts[i:]) for v in value
+                      if isinstance(v, dict)]
+            return [v for v in values if v is not _MISSING]
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def _value(value):
+    return None if value is _MISSING else value
+
+
+def _numbers(values):
+    return [v for v in values if isinstance(v, (int, float, Decimal128)) and
+            not isinstance(v, bool)]
+
+
+def _evaluate(expr, doc, variables=None):
+    """Evaluates an aggregation expression."""
+    if isinstance(expr, str):
+        if expr.startswith('$$'):
+            name, _, path = expr[2:].partition('.')
+            if name in ('ROOT', 'CURRENT'):
+                base = doc
+            else:
+                base = (variables or {}).get(name, _MISSING)
+            return _field_value(base, path.split('.')) if path else base
+
+        if expr.startswith('$'):
+            return _field_value(doc, expr[1:].split('.'))
+        return expr
+
+    if isinstance(expr, list):
+        return [_value(_evaluate(e, doc, variables)) for e in expr]
+
+    if isinstance(expr, dict):
+        if len(expr) == 1:
+            op, arg = next(iter(expr.items()))
+            if op.startswith('$'):
+                return _operator(op, arg, doc, variables)
+        # like in the server the missing fields are omitted.
+        values = ((k, _evaluate(v, doc, variables)) for k, v in expr.items())
+        return {k: v for k, v in values if v is not _MISSING}
+
+    return expr
+
+
+def _operator(op, arg, doc, variables):
+    if op == '$literal':
+        return arg
+
+    def args():
+        items = arg if isinstance(arg, list) else [arg]
+        return [_value(_evaluate(a, doc, variables)) for a in items]
+
+    if op in ('$eq', '$ne', '$gt', '$gte', '$lt', '$lte', '$cmp'):
+        a, b = args()
+        r = _compare(a, b)
+        return {'$eq': r == 0, '$ne': r != 0, '$gt': r > 0, '$gte': r >= 0,
+                '$lt': r < 0, '$lte': r <= 0, '$cmp': r}[op]
+    if op == '$and':
+        return all(_truthy(v) for v in args())
+    if op == '$or':
+        return any(_truthy(v) for v in args())
+    if op == '$not':
+        return not _truthy(args()[0])
+    if op == '$cond':
+        if isinstance(arg, dict):
+            arg = [arg['if'], arg['then'], arg['else']]
+        cond, then, otherwise = arg
+        branch = then if _truthy(_evaluate(cond, doc, variables)) \
+            else otherwise
+        return _evaluate(branch, doc, variables)
+    if op == '$ifNull':
+        values = args()
+        for value in values[:-1]:
+            if value is not None:
+                return value
+        return values[-1]
+    if op in ('$add', '$multiply'):
+        values = args()
+        if any(v is None for v in values):
+            return None
+        if op == '$multiply':
+            return functools.reduce(lambda a, b: a * b, values, 1)
+        dates = [v for v in values if isinstance(v, datetime.datetime)]
+        total = sum(v for v in values
+                    if not isinstance(v, datetime.datetime))
+        if dates:
+            return dates[0] + datetime.timedelta(milliseconds=total)
+        return total
+    if op in ('$subtract', '$divide', '$mod'):
+        a, b = args()
+        if a is None or b is None:
+            return None
+        if op == '$subtract':
+            r = a - b
+            if isinstance(r, datetime.timedelta):
+                return int(r.total_seconds() * 1000)
+            return r
+        if op == '$divide':
+            return a / b
+        return a % b
+    if op == '$abs':
+        value = args()[0]
+        return None if value is None else abs(value)
+    if op in ('$sum', '$avg', '$min', '$max'):
+        values = args()
+        if len(values) == 1 and isinstance(values[0], list):
+            values = values[0]
+        return _accumulate(op, values)
+    if op == '$size':
+        value = args()[0]
+        if not isinstance(value, list):
+            raise OperationFailure('The argument to $size must be an array',
+                                   17124)
+        return len(value)
+    if op == '$in':
+        value, array = args()
+        return any(_equals(value, v) for v in array or ())
+    if op == '$arrayElemAt':
+        array, index = args()
+        try:
+            return array[index]
+        except (IndexError, TypeError):
+            return _MISSING
+    if op == '$concat':
+        values = args()
+        if any(v is None for v in values):
+            return None
+        return ''.join(values)
+    if op in ('$toLower', '$toUpper'):
+        value = args()[0]
+        value = '' if value is None else str(value)
+        return value.lower() if op == '$toLower' else value.upper()
+    if op == '$toString':
+        value = args()[0]
+        return None if value is None else str(value)
+
+    raise _unsupported(op)
+
+
+def _accumulate(op, values):
+    """Returns the result of the accumulators that only need all the
+    values."""
+    if op == '$sum':
+        return sum(_numbers(values))
+    if op == '$avg':
+        numbers = _numbers(values)
+        return sum(numbers) / len(numbers) if numbers else None
+    values = [v for v in values if v is not None and v is not _MISSING]
+    if not values:
+        return None
+    cmp = functools.cmp_to_key(_compare)
+    return min(values, key=cmp) if op == '$min' else max(values, key=cmp)
+
+
+def _accumulator(op, values):
+    if op in ('$sum', '$avg', '$min', '$max'):
+        return _accumulate(op, values)
+    if op == '$first':
+        return _value(values[0]) if values else None
+    if op == '$last':
+        return _value(values[-1]) if values else None
+    if op == '$push':
+        return [v for v in values if v is not _MISSING]
+    if op == '$addToSet':
+        found = []
+        for value in values:
+            if value is not _MISSING and not any(
+                    _equals(value, f) for f in found):
+                found.append(value)
+        return found
+    if op in ('$stdDevPop', '$stdDevSamp'):
+        numbers = _numbers(values)
+        n = len(numbers) - (op == '$stdDevSamp')
+        if n < 1:
+            return None
+        mean = sum(numbers) / len(numbers)
+        return math.sqrt(sum((v - mean) ** 2 for v in numbers) / n)
+
+    raise _unsupported(op)
+
+
+def _stage_group(docs, spec, collection):
+    groups = {}
+    for doc in docs:
+        key = _value(_evaluate(spec['_id'], doc))
+        group = groups.setdefault(_hashable(key), (key, []))
+        group[1].append(doc)
+
+    out = []
+    for key, group_docs in groups.values():
+        result = {'_id': key}
+        for name, acc in spec.items():
+            if name == '_id':
+                continue
+            op, expr = next(iter(acc.items()))
+            if op == '$count':
+                result[name] = len(group_docs)
+                continue
+            values = [_evaluate(expr, d) for d in group_docs]
+            if op == '$sum':
+                # $sum in $group ignores the arrays.
+                values = [v for v in values if not isinstance(v, list)]
+            result[name] = _accumulator(op, values)
+        out.append(result)
+    return out
+
+
+def _flatten_projection(spec, prefix=''):
+    flat = {}
+    for key, value in spec.items():
+        path = prefix + key
+        if isinstance(value, dict) and value and not next(
+                iter(value)).startswith('$'):
+            flat.update(_flatten_projection(value, path + '.'))
+        else:
+            flat[path] = value
+    return flat
+
+
+def _is_flag(value):
+    return isinstance(value, (bool, int, float)) and not isinstance(
+        value, dict)
+
+
+def _stage_project(docs, spec, collection):
+    spec = _flatten_projection(spec)
+    include_id = '_id' not in spec or (
+        not _is_flag(spec['_id']) or _truthy(spec['_id']))
+    fields = {k: v for k, v in spec.items() if k != '_id'}
+    if '_id' in spec and not _is_flag(spec['_id']):
+        fields['_id'] = spec['_id']
+
+    if fields and all(_is_flag(v) and not _truthy(v)
+                      for v in fields.values()):
+        return _stage_unset(docs, list(fields) + (
+            [] if include_id else ['_id']), collection)
+
+    tree = {}
+    computed = {}
+    for path, value in fields.items():
+        if _is_flag(value):
+            if _truthy(value):
+                _add_to_tree(tree, path)
+        else:
+            computed[path] = value
+    if include_id and '_id' not in computed:
+        tree['_id'] = True
+
+    out = []
+    for doc in docs:
+        new = _filter_include(doc, tree)
+        for path, expr in computed.items():
+            value = _evaluate(expr, doc)
+            if value is not _MISSING:
+                _set_path(new, path.split('.'), value)
+        out.append(new)
+    return out
+
+
+def _stage_add_fields(docs, spec, collection):
+    out = []
+    for doc in docs:
+        new = dict(doc)
+        for path, expr in spec.items():
+            value = _evaluate(expr, doc)
+            if value is not _MISSING:
+                _set_path(new, path.split('.'), _copy(value))
+        out.append(new)
+    return out
+
+
+def _stage_unset(docs, spec, collection):
+    tree = {}
+    for path in ([spec] if isinstance(spec, str) else spec):
+        _add_to_tree(tree, path)
+    return [_filter_exclude(doc, tree) for doc in docs]
+
+
+def _stage_unwind(docs, spec, collection):
+    if isinstance(spec, str):
+        spec = {'path': spec}
+    parts = spec['path'][1:].split('.')
+    preserve = spec.get('preserveNullAndEmptyArrays', False)
+    index_field = spec.get('includeArrayIndex')
+
+    out = []
+    for doc in docs:
+        value = _get_path(doc, parts)
+        if isinstance(value, list) and value:
+            for i, item in enumerate(value):
+                new = _copy(doc)
+                _set_path(new, parts, item)
+                if index_field:
+                    new[index_field] = i
+                out.append(new)
+        elif isinstance(value, list) or value is None or value is _MISSING:
+            if preserve:
+                new = _copy(doc)
+                if index_field:
+                    new[index_field] = None
+                out.append(new)
+        else:
+            new = dict(doc)
+            if index_field:
+                new[index_field] = None
+            out.append(new)
+    return out
+
+
+def _stage_lookup(docs, spec, collection):
+    if 'localField' not in spec:
+        raise _unsupported('$lookup with pipeline')
+
+    foreign = list(collection.database[spec['from']]._find_docs({}))
+    local_parts = spec['localField'].split('.')
+    foreign_parts = spec['foreignField'].split('.')
+    out = []
+    for doc in docs:
+        values = _lookup(doc, local_parts) or [None]
+        matched = [_copy(f) for f in foreign
+                   if any(_match_eq(_lookup(f, foreign_parts), v)
+                          for v in values)]
+        new = dict(doc)
+        _set_path(new, spec['as'].split('.'), matched)
+        out.append(new)
+    return out
+
+
+def _stage_facet(docs, spec, collection):
+    return [{name: _aggregate(docs, pipeline, collection)
+             for name, pipeline in spec.items()}]
+
+
+def _stage_count(docs, spec, collection):
+    return [{spec: len(docs)}] if docs else []
+
+
+def _stage_sort_by_count(docs, spec, collection):
+    groups = _stage_group(docs, {'_id': spec, 'count': {'$sum': 1}},
+                          collection)
+    return _sort_docs(groups, [('count', -1)])
+
+
+def _stage_replace_root(docs, spec, collection):
+    return [_evaluate(spec['newRoot'], doc) for doc in docs]
+
+
+def _stage_replace_with(docs, spec, collection):
+    return [_evaluate(spec, doc) for doc in docs]
+
+
+def _stage_sample(docs, spec, collection):
+    return random.sample(docs, min(spec['size'], len(docs)))
+
+
+_STAGES = {'$match': lambda docs, spec, c: [
+               d for d in docs if _match(d, spec)],
+           '$sort': lambda docs, spec, c: _sort_docs(docs, spec),
+           '$skip': lambda docs, spec, c: docs[spec:],
+           '$limit': lambda docs, spec, c: docs[:spec],
+           '$project': _stage_project,
+           '$addFields': _stage_add_fields,
+           '$set': _stage_add_fields,
+           '$unset': _stage_unset,
+           '$unwind': _stage_unwind,
+           '$group': _stage_group,
+           '$count': _stage_count,
+           '$sortByCount': _stage_sort_by_count,
+           '$replaceRoot': _stage_replace_root,
+           '$replaceWith': _stage_replace_with,
+           '$facet': _stage_facet,
+           '$lookup': _stage_lookup,
+           '$sample': _stage_sample}
+
+
+def _aggregate(docs, pipeline, collection):
+    docs = list(docs)
+    for stage in pipeline:
+        if len(stage) != 1:
+            raise OperationFailure('A pipeline stage specification object '
+                                   'must contain exactly one field.', 40323)
+        name, spec = next(iter(stage.items()))
+        try:
+            handler = _STAGES[name]
+        except KeyError:
+            raise _unsupported(name)
+        docs = handler(docs, spec, collection)
+    return docs
+
+
+# The pymongo like api
+
+class MemoryCursor:
+    """A cursor for the results of :meth:`MemoryCollection.find`. The
+    query runs when the first result is fetched."""
+
+    def __init__(self, collection, filter=None, projection=None, skip=0,
+                 limit=0, sort=None, **kwargs):
+        self._collection = collection
+        self._filter = filter or {}
+        self._projection = projection
+        self._skip = skip
+        self._limit = limit
+        self._sort = _sort_items(sort) if sort else None
+        self._results = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.next()
+
+    @property
+    def collection(self):
+        return self._collection
+
+    @property
+    def alive(self):
+        return self._results is None or bool(self._results)
+
+    def _check_not_started(self):
+        if self._results is not None:
+            raise InvalidOperation('cannot set options after executing '
+                                   'query')
+
+    def sort(self, key_or_list, direction=None):
+        self._check_not_started()
+        if isinstance(key_or_list, str):
+            key_or_list = [(key_or_list, direction or 1)]
+        self._sort = _sort_items(key_or_list)
+        return self
+
+    def skip(self, skip):
+        self._check_not_started()
+        self._skip = skip
+        return self
+
+    def limit(self, limit):
+        self._check_not_started()
+        self._limit = limit
+        return self
+
+    def _ignored(self, *args, **kwargs):
+        self._check_not_started()
+        return self
+
+    hint = collation = batch_size = comment = max_time_ms = _ignored
+    allow_disk_use = _ignored
+
+    def where(self, code):
+        raise _unsupported('$where')
+
+    def rewind(self):
+        self._results = None
+        return self
+
+    def clone(self):
+        return MemoryCursor(self._collection, self._filter, self._projection,
+                            self._skip, self._limit, self._sort)
+
+    def _execute(self):
+        docs = self._collection._find_docs(self._filter)
+        if self._sort:
+            docs = _sort_docs(docs, self._sort)
+        else:
+            docs = list(docs)
+
+        docs = docs[self._skip or 0:]
+        if self._limit:
+            docs = docs[:abs(self._limit)]
+        self._results = deque(_copy(_project(d, self._projection))
+                              for d in docs)
+
+    async def next(self):
+        if self._results is None:
+            self._execute()
+        if not self._results:
+            raise StopAsyncIteration
+        return self._results.popleft()
+
+    async def to_list(self, length=None):
+        if self._results is None:
+            self._execute()
+        n = len(self._results) if length is None else min(
+            length, len(self._results))
+        return [self._results.popleft() for _ in range(n)]
+
+    async def close(self):
+        self._results = deque()
+
+    async def distinct(self, key):
+        return await self._collection.distinct(key, self._filter)
+
+    async def explain(self):
+        plan = self._collection._plan(self._filter, self._sort)
+        docs = list(self._collection._find_docs(self._filter))
+        return {'queryPlanner': {
+                    'namespace': self._collection.full_name,
+                    'parsedQuery': self._filter,
+                    'winningPlan': plan},
+                'explainVersion': '1',
+                'executionStats': {
+                    'nReturned': len(docs),
+                    'totalDocsExamined': len(self._collection._documents)},
+                'ok': 1.0}
+
+
+class MemoryCommandCursor(MemoryCursor):
+    """A cursor for results already computed, like the ones of
+    :meth:`MemoryCollection.aggregate`."""
+
+    def __init__(self, collection, results):
+        super().__init__(collection)
+        self._results = deque(results)
+
+    def _check_not_started(self):
+        pass
+
+    def rewind(self):
+        raise InvalidOperation('command cursors can not be rewound')
+
+
+class _Storage:
+    """The documents and indexes of a collection."""
+
+    def __init__(self):
+        self.documents = {}
+        self.indexes = {'_id_': {'key': [('_id', 1)], 'v': 2}}
+
+
+class MemoryCollection:
+
+    def __init__(self, database, name, read_preference=None,
+                 read_concern=None, write_concern=None, **kwargs):
+        self._database = database
+        self._name = name
+        self.read_preference = read_preference or ReadPreference.PRIMARY
+        self.read_concern = read_concern or ReadConcern()
+        self.write_concern = write_concern or WriteConcern()
+
+    def __repr__(self):
+        return 'MemoryCollection({!r}, {!r})'.format(self._database,
+                                                     self._name)
+
+    def __eq__(self, other):
+        return isinstance(other, MemoryCollection) and (
+            self._database, self._name) == (other._database, other._name)
+
+    def __hash__(self):
+        return hash((self._database, self._name))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        return MemoryCollection(self._database, self._name + '.' + name)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def full_name(self):
+        return '{}.{}'.format(self._database.name, self._name)
+
+    @property
+    def database(self):
+        return self._database
+
+    @property
+    def _documents(self):
+        storage = self._storage()
+        return storage.documents if storage else {}
+
+    def _storage(self, create=False):
+        return self._database._storage(self._name, create=create)
+
+    def with_options(self, codec_options=None, read_preference=None,
+                     write_concern=None, read_concern=None):
+        return MemoryCollection(
+            self._database, self._name,
+            read_preference=read_preference or self.read_preference,
+            read_concern=read_concern or self.read_concern,
+            write_concern=write_concern or self.write_concern)
+
+    def _find_docs(self, filter):
+        """Yields the stored documents matched by ``filter``. They must
+        be copied before being returned."""
+        documents = self._documents
+        filter = filter or {}
+        doc_id = filter.get('_id', _MISSING)
+        if _is_operators(doc_id) and list(doc_id) == ['$in'] and all(
+                not isinstance(i, (dict, _Pattern, Regex))
+                for i in doc_id['$in']):
+            candidates = [documents.get(_hashable(i)) for i in doc_id['$in']]
+        elif doc_id is not _MISSING and not isinstance(
+                doc_id, (dict, list, _Pattern, Regex)):
+            candidates = [documents.get(_hashable(doc_id))]
+        else:
+            candidates = list(documents.values())
+
+        for doc in candidates:
+            if doc is not None and _match(doc, filter):
+                yield doc
+
+    def _first(self, filter, sort=None):
+        docs = self._find_docs(filter)
+        if sort:
+            docs = _sort_docs(docs, sort)
+        return next(iter(docs), None)
+
+    def _plan(self, filter, sort):
+        fields = {k for k, _ in _iter_query_fields(filter or {})}
+        storage = self._storage()
+        indexes = storage.indexes.items() if storage else ()
+        sort = _sort_items(sort) if sort else []
+
+        def stage(name, info):
+            return {'stage': 'FETCH', 'inputStage': {
+                'stage': 'IXSCAN', 'indexName': name,
+                'keyPattern': dict(info['key'])}}
+
+        def sorts(info):
+            key = info['key'][:len(sort)]
+            return len(key) == len(sort) and (
+                key == sort or all(k == s and d == -sd for (k, d), (s, sd)
+                                   in zip(key, sort)))
+
+        plan = None
+        for name, info in indexes:
+            if info['key'][0][0] in fields:
+                plan = stage(name, info)
+                if not sort or sorts(info):
+                    return plan
+
+        if plan is None:
+            for name, info in indexes:
+                if sort and sorts(info):
+                    return stage(name, info)
+            plan = {'stage': 'COLLSCAN'}
+
+        if sort:
+            plan = {'stage': 'SORT', 'sortPattern': dict(sort),
+                    'inputStage': plan}
+        return plan
+
+    def _check_unique(self, storage, doc, ignore_id=_MISSING):
+        for name, info in storage.indexes.items():
+            if name == '_id_' or not info.get('unique'):
+                continue
+
+            fields = [k for k, _ in info['key']]
+            values = [_get_path(doc, f.split('.')) for f in fields]
+            if info.get('sparse') and all(v is _MISSING for v in values):
+                continue
+            key = _hashable([_value(v) for v in values])
+            for other in storage.documents.values():
+                if ignore_id is not _MISSING and _equals(other['_id'],
+                                                         ignore_id):
+                    continue
+                other_values = [_value(_get_path(other, f.split('.')))
+                                for f in fields]
+                if _hashable(other_values) == key:
+                    raise self._duplicate(name, dict(zip(fields, values)))
+
+    def _duplicate(self, index, key):
+        msg = 'E11000 duplicate key error collection: {} index: {} ' \
+              'dup key: {}'.format(self.full_name, index, key)
+        return DuplicateKeyError(msg, 11000, {'code': 11000, 'errmsg': msg,
+                                              'keyValue': key})
+
+    def _insert(self, doc):
+        if '_id' not in doc:
+            doc['_id'] = ObjectId()
+
+        storage = self._storage(create=True)
+        key = _hashable(doc['_id'])
+        if key in storage.documents:
+            raise self._duplicate('_id_', {'_id': doc['_id']})
+        self._check_unique(storage, doc)
+        new = _copy(doc)
+        if next(iter(new)) != '_id':
+            new = {'_id': new.pop('_id'), **new}
+        storage.documents[key] = new
+        return doc['_id']
+
+    def _replace(self, old, new):
+        storage = self._storage(create=True)
+        if '_id' in new and not _equals(new['_id'], old['_id']):
+            raise WriteError("Performing an update on the path '_id' would "
+                             "modify the immutable field '_id'", 66)
+        fields = {k: v for k, v in new.items() if k != '_id'}
+        new = {'_id': old['_id'], **fields}
+        self._check_unique(storage, new, ignore_id=old['_id'])
+        storage.documents[_hashable(old['_id'])] = new
+        return new
+
+    def find(self, filter=None, projection=None, skip=0, limit=0, sort=None,
+             **kwargs):
+        return MemoryCursor(self, filter, projection, skip=skip, limit=limit,
+                            sort=sort)
+
+    async def find_one(self, filter=None, *args, **kwargs):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {'_id': filter}
+        cursor = self.find(filter, *args, **kwargs).limit(1)
+        docs = await cursor.to_list(1)
+        return docs[0] if docs else None
+
+    async def count_documents(self, filter, skip=0, limit=0, **kwargs):
+        n = sum(1 for _ in self._find_docs(filter))
+        n = max(n - skip, 0)
+        return min(n, limit) if limit else n
+
+    async def estimated_document_count(self, **kwargs):
+        return len(self._documents)
+
+    async def distinct(self, key, filter=None, **kwargs):
+        found = []
+        seen = set()
+        for doc in self._find_docs(filter):
+            for value in _lookup(doc, key.split('.')):
+                for item in value if isinstance(value, list) else [value]:
+                    h = _hashable(item)
+                    if h not in seen:
+                        seen.add(h)
+                        found.append(_copy(item))
+        return found
+
+    async def insert_one(self, document, **kwargs):
+        return InsertOneResult(self._insert(document), True)
+
+    async def insert_many(self, documents, ordered=True, **kwargs):
+        ids = []
+        errors = []
+        for i, doc in enumerate(documents):
+            try:
+                ids.append(self._insert(doc))
+            except DuplicateKeyError as err:
+                errors.append({'index': i, 'code': err.code,
+                               'errmsg': str(err), 'op': doc})
+                if ordered:
+                    break
+
+        if errors:
+            raise BulkWriteError({'writeErrors': errors,
+                                  'writeConcernErrors': [],
+                                  'nInserted': len(ids), 'nUpserted': 0,
+                                  'nMatched': 0, 'nModified': 0,
+                                  'nRemoved': 0, 'upserted': []})
+        return InsertManyResult(ids, True)
+
+    def _update(self, filter, update, upsert, multi, array_filters=None,
+                sort=None):
+        """Updates the documents and returns the raw result, the document
+        before and the document after the update."""
+
+        replacement = _is_replacement(update)
+        if replacement and multi:
+            raise ValueError('update can not be a replacement document')
+
+        docs = list(self._find_docs(filter))
+        if sort:
+            docs = _sort_docs(docs, sort)
+        if not multi:
+            docs = docs[:1]
+
+        before = after = None
+        modified = 0
+        for doc in docs:
+            if replacement:
+                new = _copy(update)
+            else:
+                new = _apply_update(doc, update, filter, array_filters)
+            before = doc
+            if _hashable(new) != _hashable(doc):
+                after = self._replace(doc, new)
+                modified += 1
+            else:
+                after = doc
+
+        raw = {'n': len(docs), 'nModified': modified, 'ok': 1.0,
+               'updatedExisting': bool(docs)}
+        if docs or not upsert:
+            return raw, before, after
+
+        if replacement:
+            new = _copy(update)
+            query_doc = _upsert_doc(filter)
+            if '_id' in query_doc and '_id' not in new:
+                new['_id'] = query_doc['_id']
+        else:
+            new = _apply_update(_upsert_doc(filter), update, filter,
+                                array_filters, is_insert=True)
+        doc_id = self._insert(new)
+        raw.update({'n': 1, 'upserted': doc_id})
+        return raw, None, self._documents[_hashable(doc_id)]
+
+    async def update_one(self, filter, update, upsert=False,
+                         array_filters=None, **kwargs):
+        raw, _, _ = self._update(filter, update, upsert, False,
+                                 array_filters)
+        return UpdateResult(raw, True)
+
+    async def update_many(self, filter, update, upsert=False,
+                          array_filters=None, **kwargs):
+        raw, _, _ = self._update(filter, update, upsert, True, array_filters)
+        return UpdateResult(raw, True)
+
+    async def replace_one(self, filter, replacement, upsert=False, **kwargs):
+        raw, _, _ = self._update(filter, replacement, upsert, False)
+        return UpdateResult(raw, True)
+
+    def _delete(self, filter, multi, sort=None):
+        docs = list(self._find_docs(filter))
+        if sort:
+            docs = _sort_docs(docs, sort)
+        if not multi:
+            docs = docs[:1]
+
+        storage = self._storage()
+        for doc in docs:
+            del storage.documents[_hashable(doc['_id'])]
+        return docs
+
+    async def delete_one(self, filter, **kwargs):
+        n = len(self._delete(filter, False))
+        return DeleteResult({'n': n, 'ok': 1.0}, True)
+
+    async def delete_many(self, filter, **kwargs):
+        n = len(self._delete(filter, True))
+        return DeleteResult({'n': n, 'ok': 1.0}, True)
+
+    async def find_one_and_delete(self, filter, projection=None, sort=None,
+                                  **kwargs):
+        docs = self._delete(filter, False, sort=sort)
+        return _copy(_project(docs[0], projection)) if docs else None
+
+    async def find_one_and_replace(self, filter, replacement,
+                                   projection=None, sort=None, upsert=False,
+                                   return_document=ReturnDocument.BEFORE,
+                                   **kwargs):
+        return await self.find_one_and_update(
+            filter, replacement, projection=projection, sort=sort,
+            upsert=upsert, return_document=return_document)
+
+    async def find_one_and_update(self, filter, update, projection=None,
+                                  sort=None, upsert=False,
+                                  return_document=ReturnDocument.BEFORE,
+                                  array_filters=None, **kwargs):
+        _, before, after = self._update(filter, update, upsert, False,
+                                        array_filters, sort=sort)
+        doc = after if return_document == ReturnDocument.AFTER else before
+        return None if doc is None else _copy(_project(doc, projection))
+
+    async def aggregate(self, pipeline, **kwargs):
+        results = _aggregate(self._find_docs({}), pipeline, self)
+        return MemoryCommandCursor(self, [_copy(d) for d in results])
+
+    async def create_indexes(self, indexes, **kwargs):
+        names = []
+        for index in indexes:
+            document = dict(index.document)
+            keys = list(document.pop('key').items())
+            name = document.pop('name')
+            self._storage(create=True).indexes[name] = {
+                'key': keys, 'v': 2, **document}
+            names.append(name)
+        return names
+
+    async def create_index(self, keys, **kwargs):
+        from pymongo import IndexModel
+        names = await self.create_indexes([IndexModel(keys, **kwargs)])
+        return names[0]
+
+    async def index_information(self, **kwargs):
+        storage = self._storage()
+        if storage is None:
+            return {}
+        return {name: {**_copy(info), 'key': list(info['key'])}
+                for name, info in storage.indexes.items()}
+
+    async def list_indexes(self, **kwargs):
+        info = await self.index_information()
+        return MemoryCommandCursor(self, [
+            {'name': name, **{k: v for k, v in i.items() if k != 'key'},
+             'key': dict(i['key'])} for name, i in info.items()])
+
+    async def drop_index(self, index_or_name, **kwargs):
+        storage = self._storage()
+        if storage is None or index_or_name not in storage.indexes:
+            raise OperationFailure(
+                'index not found with name [{}]'.format(index_or_name), 27)
+        del storage.indexes[index_or_name]
+
+    async def drop_indexes(self, **kwargs):
+        storage = self._storage()
+        if storage is not None:
+            storage.indexes = {'_id_': storage.indexes['_id_']}
+
+    async def drop(self, **kwargs):
+        await self._database.drop_collection(self._name)
+
+
+class MemoryDatabase:
+
+    def __init__(self, client, name, read_preference=None, **kwargs):
+        self._client = client
+        self._name = name
+        self.read_preference = read_preference or ReadPreference.PRIMARY
+
+    def __repr__(self):
+        return 'MemoryDatabase({!r})'.format(self._name)
+
+    def __eq__(self, other):
+        return isinstance(other, MemoryDatabase) and (
+            self._client, self._name) == (other._client, other._name)
+
+    def __hash__(self):
+        return hash((id(self._client), self._name))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        return MemoryCollection(self, name)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def client(self):
+        return self._client
+
+    def _storage(self, name, create=False):
+        collections = self._client._data.get(self._name)
+        if collections is None:
+            if not create:
+                return None
+            collections = self._client._data[self._name] = {}
+
+        storage = collections.get(name)
+        if storage is None and create:
+            storage = collections[name] = _Storage()
+        return storage
+
+    def get_collection(self, name, **kwargs):
+        return MemoryCollection(self, name, **kwargs)
+
+    def with_options(self, read_preference=None, **kwargs):
+        return MemoryDatabase(self._client, self._name,
+                              read_preference=read_preference)
+
+    async def create_collection(self, name, **kwargs):
+        if self._storage(name) is not None:
+            raise OperationFailure(
+                'Collection {}.{} already exists'.format(self._name, name),
+                48)
+        self._storage(name, create=True)
+        return self[name]
+
+    async def drop_collection(self, name_or_collection, **kwargs):
+        name = getattr(name_or_collection, 'name', name_or_collection)
+        self._client._data.get(self._name, {}).pop(name, None)
+
+    async def list_collection_names(self, **kwargs):
+        return list(self._client._data.get(self._name, {}))
+
+    async def dereference(self, dbref, **kwargs):
+        if dbref.database not in (None, self._name):
+            db = self._client[dbref.database]
+        else:
+            db = self
+        return await db[dbref.collection].find_one({'_id': dbref.id})
+
+    async def command(self, command, value=1, **kwargs):
+        name = command if isinstance(command, str) else next(iter(command))
+        if name == 'ping':
+            return {'ok': 1.0}
+        if name.lower() == 'buildinfo':
+            return self._client._server_info()
+        if name == 'dropDatabase':
+            await self._client.drop_database(self._name)
+            return {'ok': 1.0}
+        raise _unsupported('The command {}'.format(name))
+
+
+class MemoryClient:
+    """A client that keeps the data in memory. It accepts, and ignores,
+    the arguments of :class:`pymongo.AsyncMongoClient`."""
+
+    is_primary = True
+
+    def __init__(self, host=None, port=None, **kwargs):
+        self._data = {}
+        self.address = ('memory', 0)
+
+    def __repr__(self):
+        return 'MemoryClient()'
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        return MemoryDatabase(self, name)
+
+    def get_database(self, name=None, **kwargs):
+        return MemoryDatabase(self, name or 'test', **kwargs)
+
+    def _server_info(self):
+        version = list(SERVER_VERSION) + [0, 0]
+        return {'version': '.'.join(str(v) for v in version[:3]),
+                'versionArray': version, 'ok': 1.0}
+
+    async def server_info(self):
+        return self._server_info()
+
+    async def list_database_names(self, **kwargs):
+        return list(self._data)
+
+    async def drop_database(self, name_or_database, **kwargs):
+        name = getattr(name_or_database, 'name', name_or_database)
+        self._data.pop(name, None)
+
+    async def close(self):
+        pass
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+"""In-process counters and histograms used to expose what mongomotor is
+doing."""
+
+import bisect
+from collections import defaultdict
+
+_counters = defaultdict(int)
+_histograms = {}
+
+# The upper bounds of the buckets of the histograms: 1, 2, 5, 10, 20...
+BUCKETS = tuple(m * 10 ** e for e in range(10) for m in (1, 2, 5))
+
+
+class Histogram:
+    """Keeps the count, sum, min, max and the number of values by bucket
+    of the observed values."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # the last one is for the values greater than the last bucket.
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        """Adds a value to the histogram."""
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, p):
+        """Returns the upper bound of the bucket of the ``p`` percentile.
+
+        :param p: A number between 0 and 100."""
+        if not self.count:
+            return None
+
+        rank = self.count * p / 100
+        total = 0
+        for i, n in enumerate(self.bucket_counts):
+            total += n
+            if n and total >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def as_dict(self):
+        """Returns a dict with count, sum, min, max, avg, p50, p95
+        and p99."""
+        return {'count': self.count, 'sum': self.sum,
+                'min': self.min, 'max': self.max,
+                'avg': self.sum / self.count if self.count else None,
+                'p50': self.percentile(50), 'p95': self.percentile(95),
+                'p99': self.percentile(99)}
+
+
+def incr(name, value=1):
+    """Increments the counter ``name`` by ``value``."""
+    _counters[name] += value
+
+
+def get_counter(name):
+    """Returns the value of the counter ``name``."""
+    return _counters.get(name, 0)
+
+
+def get_counters(prefix=''):
+    """Returns a dict with the counters whose names start with ``prefix``.
+    """
+    return {k: v for k, v in _counters.items() if k.startswith(prefix)}
+
+
+def observe(name, value):
+    """Adds ``value`` to the histogram ``name``."""
+    try:
+        histogram = _histograms[name]
+    except KeyError:
+        histogram = _histograms[name] = Histogram()
+    histogram.observe(value)
+
+
+def get_histogram(name):
+    """Returns the :class:`~mongomotor.metrics.Histogram` ``name`` or None.
+    """
+    return _histograms.get(name)
+
+
+def get_histograms(prefix=''):
+    """Returns a dict with the histograms, as returned by
+    :meth:`~mongomotor.metrics.Histogram.as_dict`, whose names start with
+    ``prefix``."""
+    return {k: v.as_dict() for k, v in _histograms.items()
+            if k.startswith(prefix)}
+
+
+def reset(prefix=''):
+    """Zeroes the counters and histograms whose names start with
+    ``prefix``."""
+    for name in list(_counters):
+        if name.startswith(prefix):
+            del _counters[name]
+
+    for name in list(_histograms):
+        if name.startswith(prefix):
+            del _histograms[name]
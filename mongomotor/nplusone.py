@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+"""Detection of references loaded one by one in a loop, the N+1 queries.
+
+.. code-block:: python
+
+    with nplusone.detect(threshold=10):
+        async for post in Post.objects:
+            # Warns when the author of more than 10 posts is loaded.
+            author = await post.author
+"""
+
+from contextlib import contextmanager
+import contextvars
+import os
+import random
+import sys
+import warnings
+from mongomotor.exceptions import NPlusOneError, NPlusOneWarning
+
+_scope = contextvars.ContextVar('mongomotor_nplusone', default=None)
+
+_MONGOMOTOR_DIR = os.path.dirname(os.path.abspath(__file__))
+_ASYNCIO_DIR = os.path.dirname(os.path.abspath(
+    sys.modules['asyncio'].__file__))
+
+
+class Scope:
+    """Counts the references loaded by (document, field).
+
+    :param threshold: How many loads of the same field are allowed.
+    :param raise_error: If True raises
+      :class:`~mongomotor.exceptions.NPlusOneError` instead of warning.
+    """
+
+    def __init__(self, threshold, raise_error):
+        self.threshold = threshold
+        self.raise_error = raise_error
+        # (document name, field name) -> count
+        self.counts = {}
+        # (document name, field name) -> call site
+        self.reported = {}
+
+    def add(self, instance, field_name):
+        key = (type(instance).__name__, field_name)
+        count = self.counts.get(key, 0) + 1
+        self.counts[key] = count
+        if count <= self.threshold or key in self.reported:
+            return
+
+        call_site = _get_call_site()
+        self.reported[key] = call_site
+        msg = ('{}.{} was loaded {} times in the same context, last at '
+               '{}:{}. Use select_related() or in_bulk() to load the '
+               'references at once.').format(
+                   key[0], key[1], count, call_site[0], call_site[1])
+        if self.raise_error:
+            raise NPlusOneError(msg)
+        warnings.warn(msg, NPlusOneWarning, stacklevel=2)
+
+
+@contextmanager
+def detect(threshold=10, raise_error=False, sample_rate=1.0):
+    """Counts the references loaded inside the context manager and warns,
+    with :class:`~mongomotor.exceptions.NPlusOneWarning`, when the same
+    field of a document is loaded more than ``threshold`` times. Yields a
+    :class:`~mongomotor.nplusone.Scope`, or None if the context was not
+    sampled.
+
+    :param threshold: How many loads of the same field are allowed.
+    :param raise_error: If True raises
+      :class:`~mongomotor.exceptions.NPlusOneError` instead of warning.
+    :param sample_rate: The fraction of the contexts that are checked.
+    """
+    if sample_rate < 1 and random.random() >= sample_rate:
+        scope = None
+    else:
+        scope = Scope(threshold, raise_error)
+
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+def record_load(instance, field_name):
+    """Records that a reference of ``instance`` was loaded. Called by the
+    reference fields."""
+    scope = _scope.get()
+    if scope is not None:
+        scope.add(instance, field_name)
+
+
+def _get_call_site():
+    """Returns (filename, lineno) of the first frame outside mongomotor
+    and asyncio."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if not filename.startswith((_MONGOMOTOR_DIR, _ASYNCIO_DIR)) and \
+           not filename.startswith('<'):
+            return filename, frame.f_lineno
+        frame = frame.f_back
+    return '<unknown>', 0
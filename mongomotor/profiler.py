@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+"""Profiling of the queryset and document operations.
+
+When enabled the duration, the documents and, with ``count_bytes``, the
+bytes returned by each operation are recorded in the histograms of
+:mod:`mongomotor.metrics`, named
+``profile.<Document>.<operation>.<duration_ms|docs|bytes>``. The
+operations slower than ``slow_ms`` are logged. Only the outermost
+operation is recorded, ie: the ``to_list`` called by ``get`` is part of
+the ``get``.
+
+.. code-block:: python
+
+    profiler.enable(slow_ms=50)
+    ...
+    print(profiler.get_profile())
+"""
+
+import contextvars
+from collections import deque
+import functools
+import logging
+import random
+import time
+import bson
+from mongoengine.base import BaseDocument
+from mongomotor import metrics
+
+logger = logging.getLogger('mongomotor.profiler')
+
+_config = None
+_slow_queries = deque(maxlen=100)
+_current = contextvars.ContextVar('mongomotor_profile', default=None)
+
+
+class _Config:
+
+    def __init__(self, slow_ms, sample_rate, on_slow, count_bytes):
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.on_slow = on_slow
+        self.count_bytes = count_bytes
+
+
+class _Record:
+
+    def __init__(self, count_bytes):
+        self.docs = 0
+        self.bytes = 0
+        self.count_bytes = count_bytes
+
+
+def enable(slow_ms=100, sample_rate=1.0, on_slow=None, count_bytes=False):
+    """Starts profiling the operations.
+
+    :param slow_ms: Operations that take longer than this are logged
+      as slow queries.
+    :param sample_rate: The fraction of the operations that are profiled.
+    :param on_slow: A callable called with a dict describing each slow
+      query.
+    :param count_bytes: Indicates if the bytes returned are counted. The
+      documents are already decoded when they are profiled, so they are
+      encoded again to be measured. This is as expensive as decoding
+      them.
+    """
+    global _config
+    _config = _Config(slow_ms, sample_rate, on_slow, count_bytes)
+
+
+def disable():
+    """Stops profiling the operations."""
+    global _config
+    _config = None
+
+
+def is_enabled():
+    return _config is not None
+
+
+def get_profile(prefix=''):
+    """Returns the histograms of the operations profiled. The keys are
+    ``<Document>.<operation>.<duration_ms|docs|bytes>``."""
+    hprefix = 'profile.'
+    return {k[len(hprefix):]: v
+            for k, v in metrics.get_histograms(hprefix + prefix).items()}
+
+
+def get_slow_queries():
+    """Returns a list with the last slow queries."""
+    return list(_slow_queries)
+
+
+def reset():
+    """Clears the profiled data and the slow queries."""
+    metrics.reset('profile.')
+    _slow_queries.clear()
+
+
+def normalize_query(query):
+    """Returns the shape of a raw query, the query with the values
+    replaced by ``?``."""
+    if isinstance(query, dict):
+        return {k: normalize_query(v) if k.startswith('$') or isinstance(
+            v, (dict, list)) else '?' for k, v in query.items()}
+
+    if isinstance(query, list):
+        if query and all(isinstance(v, dict) for v in query):
+            return [normalize_query(v) for v in query]
+        return '?'
+
+    return '?'
+
+
+def add_docs(docs):
+    """Adds the raw documents returned by the server to the operation
+    being profiled, if any."""
+    record = _current.get()
+    if record is None:
+        return
+
+    record.docs += len(docs)
+    if record.count_bytes:
+        record.bytes += sum(_size(d) for d in docs)
+
+
+def _size(doc):
+    raw = getattr(doc, 'raw', None)
+    if raw is not None:
+        # a RawBSONDocument
+        return len(raw)
+    return len(bson.encode(doc))
+
+
+def profiled(operation, filters=False):
+    """Decorator for the coroutines of querysets and documents that
+    profiles the operation.
+
+    :param operation: The name of the operation.
+    :param filters: Indicates if the arguments of the coroutine are
+      filters for the query, like in :meth:`~mongomotor.queryset.QuerySet.get`.
+    """
+    def decorator(fn):
+
+        @functools.wraps(fn)
+        async def wrapper(obj, *args, **kwargs):
+            config = _config
+            # the operations called by a profiled operation are part of it.
+            if config is None or _current.get() is not None or (
+                    config.sample_rate < 1 and
+                    random.random() >= config.sample_rate):
+                return await fn(obj, *args, **kwargs)
+
+            record = _Record(config.count_bytes)
+            token = _current.set(record)
+            start = time.monotonic()
+            try:
+                return await fn(obj, *args, **kwargs)
+            finally:
+                duration_ms = (time.monotonic() - start) * 1000
+                _current.reset(token)
+                _record(config, obj, operation, duration_ms, record,
+                        args if filters else (), kwargs if filters else {})
+
+        return wrapper
+
+    return decorator
+
+
+def _describe(obj, args, kwargs):
+    """Returns the name of the document and the shape of the query
+    of a queryset or document."""
+    # avoid circular imports
+    from mongomotor.queryset import QuerySet
+
+    if isinstance(obj, QuerySet):
+        if args or kwargs:
+            obj = obj.filter(*args, **kwargs)
+        return obj._document.__name__, normalize_query(obj._query)
+
+    if isinstance(obj, BaseDocument):
+        return type(obj).__name__, {'_id': '?'}
+
+    return type(obj).__name__, None
+
+
+def _record(config, obj, operation, duration_ms, record, args, kwargs):
+    name, shape = _describe(obj, args, kwargs)
+    prefix = 'profile.{}.{}.'.format(name, operation)
+    metrics.observe(prefix + 'duration_ms', duration_ms)
+    metrics.observe(prefix + 'docs', record.docs)
+    nbytes = None
+    if record.count_bytes:
+        nbytes = record.bytes
+        metrics.observe(prefix + 'bytes', nbytes)
+
+    if duration_ms < config.slow_ms:
+        return
+
+    entry = {'document': name, 'operation': operation, 'shape': shape,
+             'duration_ms': duration_ms, 'docs': record.docs,
+             'bytes': nbytes}
+    _slow_queries.append(entry)
+    logger.warning('Slow query %s.%s %s took %.1fms (%d docs, %s bytes)',
+                   name, operation, shape, duration_ms, record.docs,
+                   '?' if nbytes is None else nbytes)
+    if config.on_slow is not None:
+        config.on_slow(entry)
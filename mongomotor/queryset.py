@@ -17,13 +17,19 @@
 # You should have received a copy of the GNU General Public License
 # along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
+from collections import namedtuple
 from bson.code import Code
-from bson import SON
+from bson import DBRef, SON
+import copy
+from functools import lru_cache, partial
 import os
 import re
+import time
+import warnings
 from mongoengine import DENY, CASCADE, NULLIFY, PULL
 from mongoengine.common import _import_class
-from mongoengine.connection import get_db
+from mongoengine.connection import get_db, DEFAULT_CONNECTION_NAME
 from mongoengine.context_managers import (
     set_write_concern,
     set_read_write_concern,
@@ -33,19 +39,145 @@ from mongoengine.errors import (
     BulkWriteError,
     NotUniqueError,
     LookUpError,
+    InvalidQueryError,
 )
 from mongoengine.queryset import transform
 from mongoengine.queryset.queryset import QuerySet as MEQuerySet
 import pymongo
 from pymongo import ReturnDocument
-from mongomotor import signals
+from pymongo.read_preferences import ReadPreference
+from mongomotor import advisor, metrics, profiler, signals
+from mongomotor.aggregation import GroupBy
+from mongomotor.connection import admission
+from mongomotor.exceptions import ChunkedWriteError, ScatterGatherWarning
+from mongomotor.utils import (get_alias_for_db, get_read_preference,
+                              get_stacklevel)
 
 # for tests
 TEST_ENV = os.environ.get('MONGOMOTOR_TEST_ENV')
 
+# How many ids are read at a time when applying the delete rules.
+DELETE_RULES_BATCH_SIZE = 1000
+# How many documents are deleted at a time by delete_many when a queryset
+# with skip or limit is deleted.
+DELETE_BATCH_SIZE = 1000
+
+
+def get_hedge_stats():
+    """Returns a dict with the counters of the hedged reads.
+
+    - ``reads``: How many hedged reads were done.
+    - ``hedged``: How many reads took longer than the threshold and were
+      sent again.
+    - ``hedge_wins``: How many times the hedge answered first.
+    - ``hedge_rate``: hedged / reads.
+    - ``win_rate``: hedge_wins / hedged.
+    """
+    reads = metrics.get_counter('hedge.reads')
+    hedged = metrics.get_counter('hedge.hedged')
+    wins = metrics.get_counter('hedge.hedge_wins')
+    return {'reads': reads,
+            'hedged': hedged,
+            'hedge_wins': wins,
+            'hedge_rate': hedged / reads if reads else 0.0,
+            'win_rate': wins / hedged if hedged else 0.0}
+
+
+def get_scatter_gather_stats():
+    """Returns a dict with the name of the sharded documents as keys
+    and how many operations without the shard key were done as values.
+    """
+    prefix = 'scatter_gather.'
+    return {k[len(prefix):]: v
+            for k, v in metrics.get_counters(prefix).items()}
+
+
+# The result of an update or delete with chunk_size. ``n`` is the number of
+# documents written and ``checkpoint`` the id of the last document of the
+# last chunk.
+ChunkedWriteResult = namedtuple('ChunkedWriteResult', ['n', 'checkpoint'])
+# The result of QuerySet.stats(). sum, avg, min, max and freq are dicts
+# keyed by field.
+QueryStats = namedtuple('QueryStats',
+                        ['count', 'sum', 'avg', 'min', 'max', 'freq'])
+
+
+class AggregationResults:
+    """The results of :meth:`QuerySet.aggregate` converted to documents or
+    namedtuples. The results are converted while they are read, so only a
+    batch of them is in memory at a time.
+
+    :param cursor: The cursor of the aggregation.
+    :param factory: A callable that converts a result.
+    """
+
+    def __init__(self, cursor, factory):
+        self.cursor = cursor
+        self._factory = factory
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        doc = await self.cursor.next()
+        return self._factory(doc)
+
+    async def to_list(self, length=None):
+        """Returns a list with the next ``length`` results, or all of them
+        if ``length`` is None."""
+        docs = await self.cursor.to_list(length)
+        return [self._factory(d) for d in docs]
+
+    async def close(self):
+        await self.cursor.close()
+
+
+def _as_list(fields):
+    if fields is None:
+        return []
+    return [fields] if isinstance(fields, str) else list(fields)
+
+
+@lru_cache(maxsize=128)
+def _get_row_class(keys):
+    fields = ['id' if k == '_id' else k for k in keys]
+    return namedtuple('Row', fields, rename=True)
+
+
+def _get_row_factory(row_class):
+    """Returns a function that converts the results of an aggregation to
+    namedtuples. If ``row_class`` is True the namedtuple class is created
+    from the keys of the results."""
+
+    if row_class is True:
+        def factory(doc):
+            return _get_row_class(tuple(doc))(*doc.values())
+        return factory
+
+    def get(doc, field):
+        if field == 'id' and '_id' in doc:
+            return doc['_id']
+        return doc.get(field)
+
+    def factory(doc):
+        return row_class._make(get(doc, f) for f in row_class._fields)
+    return factory
+
 
 class QuerySet(MEQuerySet):
 
+    # Attributes copied when the queryset is cloned, besides the ones
+    # copied by mongoengine.
+    _copy_props = ('_hedge_after_ms', '_hedge_read_preference')
+
+    def __init__(self, document, collection):
+        super().__init__(document, collection)
+        self._read_preference = get_read_preference(
+            document._meta.get('read_preference'))
+        self._hedge_after_ms = None
+        self._hedge_read_preference = None
+        self._next_raw_doc = None
+
     def __repr__(self):  # pragma no cover
         return self.__class__.__name__
 
@@ -78,14 +210,11 @@ class QuerySet(MEQuerySet):
         return self
 
     async def __anext__(self):
-        async for doc in self._cursor:
-            mm_doc = self._document._from_son(
-                doc,
-                _auto_dereference=self._auto_dereference)
-            return mm_doc
-        else:
-            raise StopAsyncIteration()
+        doc = await self._next_raw()
+        return self._document._from_son(
+            doc, _auto_dereference=self._auto_dereference)
 
+    @profiler.profiled('get', filters=True)
     async def get(self, *q_objs, **query):
         """Retrieve the the matching object raising
         :class:`~mongoengine.queryset.MultipleObjectsReturned` or
@@ -110,6 +239,7 @@ class QuerySet(MEQuerySet):
 
         return docs[0]
 
+    @profiler.profiled('first')
     async def first(self):
         """Retrieve the first object matching the query.
         """
@@ -120,6 +250,7 @@ class QuerySet(MEQuerySet):
         except IndexError:
             return None
 
+    @profiler.profiled('count')
     async def count(self, with_limit_and_skip=True):
         """Counts the documents in the queryset.
 
@@ -129,6 +260,9 @@ class QuerySet(MEQuerySet):
         if self._limit == 0 and with_limit_and_skip or self._none:
             return 0
 
+        if self._hedge_after_ms is not None:
+            return await self._hedged_read('count', with_limit_and_skip)
+
         kw = {}
         if with_limit_and_skip and self._limit:
             kw['limit'] = self._limit
@@ -136,7 +270,10 @@ class QuerySet(MEQuerySet):
         if with_limit_and_skip and self._skip:
             kw['skip'] = self._skip
 
-        return await self._collection.count_documents(self._query, **kw)
+        advisor.record(self)
+        async with admission(self._alias):
+            return await self._read_collection.count_documents(
+                self._query, **kw)
 
     async def insert(
         self, doc_or_docs, load_bulk=True, write_concern=None,
@@ -194,7 +331,8 @@ class QuerySet(MEQuerySet):
                 insert_func = collection.insert_one
 
         try:
-            inserted_result = await insert_func(raw)
+            async with admission(self._alias):
+                inserted_result = await insert_func(raw)
             ids = (
                 [inserted_result.inserted_id]
                 if return_one
@@ -234,6 +372,7 @@ class QuerySet(MEQuerySet):
         )
         return results[0] if return_one else results
 
+    @profiler.profiled('update')
     async def update(
         self,
         upsert=False,
@@ -242,6 +381,10 @@ class QuerySet(MEQuerySet):
         read_concern=None,
         full_result=False,
         array_filters=None,
+        chunk_size=None,
+        max_rate=None,
+        throttle=None,
+        resume_after=None,
         **update,
     ):
         """Perform an atomic update on the fields matched by the query.
@@ -259,17 +402,35 @@ class QuerySet(MEQuerySet):
             rather than just the number updated items
         :param array_filters: A list of filters specifying which array elements
             an update should apply.
+        :param chunk_size: If not None, the documents are updated in
+            chunks of ``chunk_size`` documents, in the order of their ids,
+            instead of a single update.
+        :param max_rate: Maximum number of documents written per second
+            when using ``chunk_size``.
+        :param throttle: A coroutine function awaited after each chunk,
+            ie: :class:`~mongomotor.throttling.ReplicationLagThrottle`.
+        :param resume_after: The checkpoint of a previous chunked write.
+            Only documents with ids greater than it are updated.
         :param update: Django-style update keyword arguments
 
         :returns the number of updated documents (unless ``full_result``
-            is True)
+            is True). With ``chunk_size`` returns a
+            :class:`~mongomotor.queryset.ChunkedWriteResult`.
         """
         if not update and not upsert:
             raise OperationError("No update parameters, would remove data")
 
+        if chunk_size and (upsert or not multi):
+            raise OperationError(
+                "chunk_size can't be used with upsert or single updates")
+        if chunk_size:
+            self._check_chunked_write()
+
         if write_concern is None:
             write_concern = {}
         if self._none or self._empty:
+            if chunk_size:
+                return ChunkedWriteResult(0, resume_after)
             return 0
 
         queryset = self.clone()
@@ -290,6 +451,16 @@ class QuerySet(MEQuerySet):
                 update["$set"]["_cls"] = queryset._document._class_name
             else:
                 update["$set"] = {"_cls": queryset._document._class_name}
+        self._check_shard_key(query)
+
+        if chunk_size:
+            async def write(ids):
+                return await queryset._update_chunk(
+                    ids, update, write_concern, read_concern, array_filters)
+
+            return await queryset._chunked_write(
+                write, chunk_size, max_rate, throttle, resume_after)
+
         try:
             with set_read_write_concern(
                 queryset._collection, write_concern, read_concern
@@ -297,9 +468,11 @@ class QuerySet(MEQuerySet):
                 update_func = collection.update_one
                 if multi:
                     update_func = collection.update_many
-                result = await update_func(
-                    query, update, upsert=upsert, array_filters=array_filters
-                )
+                async with admission(self._alias):
+                    result = await update_func(
+                        query, update, upsert=upsert,
+                        array_filters=array_filters
+                    )
             if full_result:
                 return result
             elif result.raw_result:
@@ -312,6 +485,7 @@ class QuerySet(MEQuerySet):
                 raise OperationError(message)
             raise OperationError("Update failed (%s)" % err)
 
+    @profiler.profiled('in_bulk')
     async def in_bulk(self, object_ids):
         """Retrieve a set of documents by their ids.
 
@@ -319,28 +493,38 @@ class QuerySet(MEQuerySet):
         :rtype: dict of ObjectId's as keys and collection-specific
                 Document subclasses as values.
         """
+        if self._hedge_after_ms is not None:
+            return await self._hedged_read('in_bulk', object_ids)
+
         doc_map = {}
 
-        docs = self._collection.find(
-            {"_id": {"$in": object_ids}}, **self._cursor_args)
-        if self._scalar:
-            async for doc in docs:
-                doc_map[doc["_id"]] = self._get_scalar(
-                    self._document._from_son(doc))
-        elif self._as_pymongo:
-            async for doc in docs:
-                doc_map[doc["_id"]] = doc
-        else:
+        # if the queryset is filtered by the shard key we keep it
+        # so the query is sent only to the right shards
+        query = self._get_chunk_query(
+            self._get_shard_key_query(self._query), object_ids)
+        self._check_shard_key(query)
+
+        docs = self._read_collection.find(query, **self._cursor_args)
+        async with admission(self._alias):
             async for doc in docs:
-                doc_map[doc["_id"]] = self._document._from_son(
-                    doc,
-                    _auto_dereference=self._auto_dereference,
-                )
+                profiler.add_docs((doc,))
+                if self._scalar:
+                    doc_map[doc["_id"]] = self._get_scalar(
+                        self._document._from_son(doc))
+                elif self._as_pymongo:
+                    doc_map[doc["_id"]] = doc
+                else:
+                    doc_map[doc["_id"]] = self._document._from_son(
+                        doc,
+                        _auto_dereference=self._auto_dereference,
+                    )
 
         return doc_map
 
+    @profiler.profiled('delete')
     async def delete(self, write_concern=None, _from_doc_delete=False,
-                     cascade_refs=None):
+                     cascade_refs=None, concurrency=None, chunk_size=None,
+                     max_rate=None, throttle=None, resume_after=None):
         """Deletes the documents matched by the query.
 
         :param write_concern: Extra keyword arguments are passed down which
@@ -351,8 +535,21 @@ class QuerySet(MEQuerySet):
             will force an fsync on the primary server.
         :param _from_doc_delete: True when called from document delete
           therefore signals will have been triggered so don't loop.
-
-        :returns number of deleted documents
+        :param concurrency: When the documents are deleted one by one,
+          because there are delete signals, how many documents are
+          deleted at the same time.
+        :param chunk_size: If not None, the documents are deleted in
+          chunks of ``chunk_size`` documents, in the order of their ids,
+          instead of a single delete.
+        :param max_rate: Maximum number of documents deleted per second
+          when using ``chunk_size``.
+        :param throttle: A coroutine function awaited after each chunk,
+          ie: :class:`~mongomotor.throttling.ReplicationLagThrottle`.
+        :param resume_after: The checkpoint of a previous chunked delete.
+          Only documents with ids greater than it are deleted.
+
+        :returns number of deleted documents. With ``chunk_size`` returns a
+          :class:`~mongomotor.queryset.ChunkedWriteResult`.
         """
         queryset = self.clone()
         doc = queryset._document
@@ -360,6 +557,18 @@ class QuerySet(MEQuerySet):
         if write_concern is None:
             write_concern = {}
 
+        if chunk_size:
+            self._check_chunked_write()
+            if self._none or self._empty:
+                return ChunkedWriteResult(0, resume_after)
+
+            async def write(ids):
+                return await queryset._delete_chunk(
+                    ids, write_concern, concurrency=concurrency)
+
+            return await queryset._chunked_write(
+                write, chunk_size, max_rate, throttle, resume_after)
+
         # Handle deletes where skips or limits have been applied or
         # there is an untriggered delete signal
         has_delete_signal = (
@@ -370,14 +579,22 @@ class QuerySet(MEQuerySet):
                                 has_delete_signal) and not _from_doc_delete
 
         if call_document_delete:
-            r = await self._document_delete(queryset, write_concern)
+            # Only the signals and the file fields need the whole
+            # document. Without them the documents are deleted in chunks.
+            if has_delete_signal or self._has_file_fields(doc):
+                r = await self._document_delete(queryset, write_concern,
+                                                concurrency=concurrency)
+            else:
+                r = await self._batch_delete(queryset, write_concern)
             return r
 
         await self._check_delete_rules(doc, queryset, cascade_refs,
                                        write_concern)
 
-        r = await queryset._collection.delete_many(
-            queryset._query, **write_concern)
+        self._check_shard_key(queryset._query)
+        async with admission(self._alias):
+            r = await queryset._collection.delete_many(
+                queryset._query, **write_concern)
 
         return r
 
@@ -408,13 +625,19 @@ class QuerySet(MEQuerySet):
 
         return doc
 
+    @profiler.profiled('to_list')
     async def to_list(self, length=100):
         """Returns a list of the current documents in the queryset.
 
         :param length: maximum number of documents to return for this call."""
 
+        if self._hedge_after_ms is not None and self._cursor_obj is None:
+            return await self._hedged_read('to_list', length)
+
         cursor = self._cursor
-        docs_list = await cursor.to_list(length)
+        async with admission(self._alias):
+            docs_list = await cursor.to_list(length)
+        profiler.add_docs(docs_list)
 
         final_list = [self._document._from_son(
             d, _auto_dereference=self._auto_dereference)
@@ -422,7 +645,7 @@ class QuerySet(MEQuerySet):
 
         return final_list
 
-    async def item_frequencies(self, field, normalize=False):
+    async def item_frequencies(self, field, normalize=False, hint=None):
         """Returns a dictionary of all items present in a field across
         the whole queried set of documents, and their corresponding frequency.
         This is useful for generating tag clouds, or searching documents.
@@ -439,16 +662,15 @@ class QuerySet(MEQuerySet):
 
         :param field: the field to use
         :param normalize: normalize the results so they add to 1.0
+        :param hint: (optional) the index to use. By default the hint of
+            the queryset.
         """
 
-        cursor = await self._document._get_collection().aggregate([
-            {'$match': self._query},
+        docs = await self._aggregate_all([
             {'$unwind': f'${field}'},
             {'$group': {'_id': '$' + field, 'total': {'$sum': 1}}}
-        ])
-        freqs = {}
-        async for doc in cursor:
-            freqs[doc['_id']] = doc['total']
+        ], hint=hint)
+        freqs = {doc['_id']: doc['total'] for doc in docs}
 
         if normalize:
             count = sum(freqs.values())
@@ -457,72 +679,152 @@ class QuerySet(MEQuerySet):
 
         return freqs
 
-    async def average(self, field):
+    async def average(self, field, hint=None):
         """Average over the values of the specified field.
 
         :param field: the field to average over; use dot-notation to refer to
             embedded document fields
+        :param hint: (optional) the index to use. By default the hint of
+            the queryset.
 
         This method is more performant than the regular `average`, because it
         uses the aggregation framework instead of map-reduce.
         """
-        cursor = await self._document._get_collection().aggregate([
-            {'$match': self._query},
+        docs = await self._aggregate_all([
             {'$group': {'_id': 'avg', 'total': {'$avg': '$' + field}}}
-        ])
+        ], hint=hint)
+        return docs[0]['total'] if docs else 0
+
+    async def stats(self, count=True, sum=None, avg=None, min=None,
+                    max=None, freq=None, hint=None):
+        """Computes many metrics of the queryset in a single aggregation,
+        reading the documents only once. Returns a :class:`QueryStats`.
+
+        .. code-block:: python
+
+            stats = await Sale.objects(year=2025).stats(
+                sum=['total'], avg=['total', 'items'], freq=['city'])
+            stats.count, stats.sum['total'], stats.freq['city']['Paris']
+
+        :param count: Indicates if the documents are counted.
+        :param sum: A field or a list of fields to sum.
+        :param avg: A field or a list of fields to average.
+        :param min: A field or a list of fields to get the minimum value.
+        :param max: A field or a list of fields to get the maximum value.
+        :param freq: A field or a list of fields to get the frequencies of
+            the values, like in :meth:`item_frequencies`. The frequencies
+            are returned in a single document, so they can't be bigger than
+            16MB.
+        :param hint: (optional) the index to use. By default the hint of
+            the queryset.
+        """
+        group = {'_id': None}
+        if count:
+            group['count'] = {'$sum': 1}
+
+        ops = {'sum': _as_list(sum), 'avg': _as_list(avg),
+               'min': _as_list(min), 'max': _as_list(max)}
+        for op, fields in ops.items():
+            for i, field in enumerate(fields):
+                group['{}_{}'.format(op, i)] = {'$' + op: '$' + field}
+
+        facets = {'metrics': [{'$group': group}]}
+        freq = _as_list(freq)
+        for i, field in enumerate(freq):
+            facets['freq_{}'.format(i)] = [
+                {'$unwind': '$' + field},
+                {'$group': {'_id': '$' + field, 'total': {'$sum': 1}}}]
+
+        docs = await self._aggregate_all([{'$facet': facets}], hint=hint)
+        result = docs[0] if docs else {}
+        values = result['metrics'][0] if result.get('metrics') else {}
+        # like sum() and average() the sums and averages of an empty
+        # queryset are 0.
+        empty = {'sum': 0, 'avg': 0} if not values else {}
+
+        def get_values(op):
+            return {field: values.get('{}_{}'.format(op, i), empty.get(op))
+                    for i, field in enumerate(ops[op])}
+
+        return QueryStats(
+            count=values.get('count', 0) if count else None,
+            sum=get_values('sum'), avg=get_values('avg'),
+            min=get_values('min'), max=get_values('max'),
+            freq={field: {d['_id']: d['total']
+                          for d in result.get('freq_{}'.format(i), [])}
+                  for i, field in enumerate(freq)})
+
+    def group_by(self, *fields, allow_disk_use=True, batch_size=None):
+        """Groups the documents of the queryset by ``fields``. Returns a
+        :class:`~mongomotor.aggregation.GroupBy` that is iterated to get
+        the groups.
+
+        .. code-block:: python
+
+            groups = Sale.objects.group_by('city').annotate(
+                total=Sum('amount'), n=Count()).order_by('-total')
+            async for row in groups:
+                print(row.city, row.total, row.n)
+
+        :param fields: The names of the fields.
+        :param allow_disk_use: Lets the server use temporary files for
+            groupings that don't fit in its memory.
+        :param batch_size: The number of groups fetched at a time.
+        """
+        return GroupBy(self.clone(), fields, allow_disk_use=allow_disk_use,
+                       batch_size=batch_size)
+
+    @profiler.profiled('aggregate')
+    async def aggregate(self, pipeline, as_document=None, as_namedtuple=None,
+                        batch_size=None, **kwargs):
+        """Perform an aggregate function based on your queryset params
 
-        avg = 0
-        async for doc in cursor:
-            avg = doc['total']
-            break
+        By default returns pymongo's cursor, that yields dicts. With
+        ``as_document`` or ``as_namedtuple`` returns an
+        :class:`AggregationResults` that converts the results while they
+        are read:
 
-        return avg
+        .. code-block:: python
 
-    async def aggregate(self, pipeline, **kwargs):
-        """Perform an aggregate function based on your queryset params
+            results = await Person.objects.aggregate(
+                [{'$group': {'_id': '$city', 'n': {'$sum': 1}}}],
+                as_namedtuple=True)
+            async for row in results:
+                print(row.id, row.n)
 
         :param pipeline: list of aggregation commands,
             see: https://www.mongodb.com/docs/manual/core/aggregation-pipeline/
+        :param as_document: A document class. The results are returned as
+            instances of it.
+        :param as_namedtuple: If True the results are returned as
+            namedtuples with the keys of the results, ``_id`` named ``id``.
+            It may also be a namedtuple class, whose fields are read from
+            the results.
+        :param batch_size: The number of results fetched at a time.
         :param kwargs: (optional) kwargs dictionary to be passed to pymongo's
-            aggregate call.
+            aggregate call. The hint and the collation of the queryset are
+            used if not given here.
         """
-        user_pipeline = pipeline
-
-        initial_pipeline = []
-        if self._none or self._empty:
-            initial_pipeline.append({"$limit": 1})
-            initial_pipeline.append({"$match": {"$expr": False}})
-
-        if self._query:
-            initial_pipeline.append({"$match": self._query})
-
-        if self._ordering:
-            initial_pipeline.append({"$sort": dict(self._ordering)})
-
-        if self._limit is not None:
-            # As per MongoDB Documentation
-            # (https://www.mongodb.com/docs/manual/reference/operator/aggregation/limit/),
-            # keeping limit stage right after sort stage is more efficient.
-            # But this leads to wrong set of documents
-            # for a skip stage that might succeed these. So we need to maintain
-            # more documents in memory in such a case
-            # (https://stackoverflow.com/a/24161461).
-            initial_pipeline.append(
-                {"$limit": self._limit + (self._skip or 0)})
-
-        if self._skip is not None:
-            initial_pipeline.append({"$skip": self._skip})
-
-        final_pipeline = initial_pipeline + user_pipeline
-
-        collection = self._collection
-        if self._read_preference is not None or self._read_concern is not None:
-            collection = self._collection.with_options(
-                read_preference=self._read_preference,
-                read_concern=self._read_concern
-            )
-
-        return await collection.aggregate(final_pipeline, cursor={}, **kwargs)
+        if as_document is not None and as_namedtuple:
+            raise TypeError(
+                'as_document and as_namedtuple can not be used together')
+
+        final_pipeline, kwargs = self._get_aggregation_args(pipeline, kwargs)
+        if batch_size is not None:
+            kwargs['batchSize'] = batch_size
+
+        collection = self._read_collection
+        async with admission(self._alias):
+            cursor = await collection.aggregate(
+                final_pipeline, cursor={}, **kwargs)
+
+        if as_document is not None:
+            return AggregationResults(cursor, partial(
+                as_document._from_son,
+                _auto_dereference=self._auto_dereference))
+        if as_namedtuple:
+            return AggregationResults(cursor, _get_row_factory(as_namedtuple))
+        return cursor
 
     async def map_reduce(
         self, map_f, reduce_f, output, finalize_f=None, limit=None, scope=None
@@ -601,26 +903,21 @@ class QuerySet(MEQuerySet):
                 doc["value"]
             )
 
-    async def sum(self, field):
+    async def sum(self, field, hint=None):
         """Sum over the values of the specified field.
 
         :param field: the field to sum over; use dot-notation to refer to
             embedded document fields
+        :param hint: (optional) the index to use. By default the hint of
+            the queryset.
 
         This method is more performant than the regular `sum`, because it uses
         the aggregation framework instead of map-reduce.
         """
-        cursor = await self._document._get_collection().aggregate([
-            {'$match': self._query},
+        docs = await self._aggregate_all([
             {'$group': {'_id': 'sum', 'total': {'$sum': '$' + field}}}
-        ])
-
-        r = 0
-        async for doc in cursor:
-            r = doc['total']
-            break
-
-        return r
+        ], hint=hint)
+        return docs[0]['total'] if docs else 0
 
     async def distinct(self, field):
         """Return a list of distinct values for a given field.
@@ -637,12 +934,14 @@ class QuerySet(MEQuerySet):
         except LookUpError:
             pass
 
-        raw_values = await queryset._cursor.distinct(field)
+        async with admission(self._alias):
+            raw_values = await queryset._cursor.distinct(field)
         if not self._auto_dereference:
             return raw_values
 
         distinct = await self._dereference(
-            raw_values, 1, name=field, instance=self._document)
+            raw_values, 1, name=field, instance=self._document,
+            read_preference=self._read_preference)
 
         doc_field = self._document._fields.get(field.split(".", 1)[0])
         instance = None
@@ -729,26 +1028,29 @@ class QuerySet(MEQuerySet):
         if not remove:
             update = transform.update(queryset._document, **update)
         sort = queryset._ordering
+        self._check_shard_key(query)
 
         try:
             if remove:
-                result = await queryset._collection.find_one_and_delete(
-                    query, sort=sort, **self._cursor_args
-                )
+                async with admission(self._alias):
+                    result = await queryset._collection.find_one_and_delete(
+                        query, sort=sort, **self._cursor_args
+                    )
             else:
                 if new:
                     return_doc = ReturnDocument.AFTER
                 else:
                     return_doc = ReturnDocument.BEFORE
-                result = await queryset._collection.find_one_and_update(
-                    query,
-                    update,
-                    upsert=upsert,
-                    sort=sort,
-                    return_document=return_doc,
-                    array_filters=array_filters,
-                    **self._cursor_args,
-                )
+                async with admission(self._alias):
+                    result = await queryset._collection.find_one_and_update(
+                        query,
+                        update,
+                        upsert=upsert,
+                        sort=sort,
+                        return_document=return_doc,
+                        array_filters=array_filters,
+                        **self._cursor_args,
+                    )
         except pymongo.errors.DuplicateKeyError as err:
             raise NotUniqueError("Update failed (%s)" % err)
         except pymongo.errors.OperationFailure as err:
@@ -763,17 +1065,88 @@ class QuerySet(MEQuerySet):
         """Return an explain plan record for the
         :class:`~mongoengine.queryset.QuerySet` cursor.
         """
-        return await self._cursor.explain()
+        async with admission(self._alias):
+            return await self._cursor.explain()
+
+    def read_preference(self, read_preference, tag_sets=None,
+                        max_staleness=-1):
+        """Change the read_preference when querying. The read preference
+        is used by all the reads of the queryset, including the ones
+        done to dereference documents.
+
+        The default read preference for a document may be set using
+        ``read_preference`` in the document's meta.
+
+        :param read_preference: A pymongo read preference or the name of
+          a read preference mode, ie: 'secondaryPreferred'.
+        :param tag_sets: The tag sets used to select the replica set members.
+        :param max_staleness: The maximum replication lag, in seconds, of
+          the selected secondaries. -1 means no maximum.
+        """
+        read_preference = get_read_preference(
+            read_preference, tag_sets=tag_sets, max_staleness=max_staleness)
+        return super().read_preference(read_preference)
+
+    def hedged(self, after_ms=20, read_preference=None):
+        """Hedges the reads of the queryset. If a read does not complete
+        within ``after_ms`` milliseconds the same read is sent again using
+        ``read_preference`` and the first answer is used. The slower read
+        is cancelled.
+
+        Only the idempotent reads are hedged: :meth:`to_list`,
+        :meth:`first`, :meth:`get`, :meth:`in_bulk` and :meth:`count`.
+        A hedged :meth:`to_list` always reads from the beginning of the
+        queryset.
+
+        :param after_ms: How many milliseconds to wait before sending
+          the hedge. If None hedging is disabled.
+        :param read_preference: The read preference of the hedge. If None
+          ``secondaryPreferred`` is used when the queryset reads from the
+          primary, otherwise ``nearest`` is used.
+
+        The hedge counters are returned by
+        :func:`~mongomotor.queryset.get_hedge_stats`.
+        """
+        if after_ms is not None and after_ms < 0:
+            raise ValueError('after_ms must not be negative')
+
+        queryset = self.clone()
+        queryset._hedge_after_ms = after_ms
+        queryset._hedge_read_preference = get_read_preference(
+            read_preference)
+        return queryset
 
     @property
     def fetch_next(self):
-        return self._cursor.fetch_next
+        """An awaitable that fetches the next document and returns True,
+        or False if there are no more documents. Use :meth:`next_object`
+        to get the fetched document."""
+        return self._fetch_next()
 
     def next_object(self):
-        raw = self._cursor.next_object()
+        """Returns the document fetched by :attr:`fetch_next`."""
+        raw, self._next_raw_doc = self._next_raw_doc, None
+        if raw is None:
+            return None
         return self._document._from_son(
             raw, _auto_dereference=self._auto_dereference)
 
+    async def _fetch_next(self):
+        try:
+            self._next_raw_doc = await self._next_raw()
+        except StopAsyncIteration:
+            self._next_raw_doc = None
+            return False
+        return True
+
+    async def _next_raw(self):
+        cursor = self._cursor
+        if getattr(cursor, '_data', None):
+            # already in the batch, no round trip to the server.
+            return await cursor.__anext__()
+        async with admission(self._alias):
+            return await cursor.__anext__()
+
     def no_cache(self):
         """Convert to a non-caching queryset
         """
@@ -783,6 +1156,195 @@ class QuerySet(MEQuerySet):
         return self._clone_into(QuerySetNoCache(self._document,
                                                 self._collection))
 
+    async def _aggregate_all(self, pipeline, hint=None):
+        """Runs an aggregation whose result does not depend on the order
+        of the documents and returns all the results."""
+
+        kwargs = {} if hint is None else {'hint': hint}
+        pipeline, kwargs = self._get_aggregation_args(pipeline, kwargs,
+                                                      ordered=False)
+        async with admission(self._alias):
+            cursor = await self._read_collection.aggregate(
+                pipeline, cursor={}, **kwargs)
+            return await cursor.to_list(None)
+
+    def _get_aggregation_args(self, pipeline, kwargs, ordered=True):
+        """Returns the pipeline of an aggregation over the queryset and
+        the arguments to the aggregate call, with the hint and the collation
+        of the queryset."""
+
+        kwargs = dict(kwargs)
+        if self._hint not in (-1, None):
+            kwargs.setdefault('hint', self._hint)
+        if self._collation is not None:
+            kwargs.setdefault('collation', self._collation)
+        return self._get_pipeline_prefix(ordered) + pipeline, kwargs
+
+    def _get_pipeline_prefix(self, ordered=True):
+        """Returns the aggregation stages that select the documents of the
+        queryset, to be used before the stages of an aggregation.
+
+        :param ordered: If False the documents are only sorted when needed
+          by skip or limit.
+        """
+
+        initial_pipeline = []
+        if self._none or self._empty:
+            initial_pipeline.append({"$limit": 1})
+            initial_pipeline.append({"$match": {"$expr": False}})
+
+        if self._query:
+            initial_pipeline.append({"$match": self._query})
+
+        sliced = self._limit is not None or self._skip is not None
+        if self._ordering and (ordered or sliced):
+            initial_pipeline.append({"$sort": dict(self._ordering)})
+
+        if self._limit is not None:
+            # As per MongoDB Documentation
+            # (https://www.mongodb.com/docs/manual/reference/operator/aggregation/limit/),
+            # keeping limit stage right after sort stage is more efficient.
+            # But this leads to wrong set of documents
+            # for a skip stage that might succeed these. So we need to maintain
+            # more documents in memory in such a case
+            # (https://stackoverflow.com/a/24161461).
+            initial_pipeline.append(
+                {"$limit": self._limit + (self._skip or 0)})
+
+        if self._skip is not None:
+            initial_pipeline.append({"$skip": self._skip})
+
+        return initial_pipeline
+
+    @property
+    def _read_collection(self):
+        """The collection used for reads, with the read preference and
+        read concern of the queryset."""
+        if self._read_preference is None and self._read_concern is None:
+            return self._collection
+
+        return self._collection.with_options(
+            read_preference=self._read_preference,
+            read_concern=self._read_concern)
+
+    @property
+    def _cursor(self):
+        if self._cursor_obj is None:
+            advisor.record(self)
+        return super()._cursor
+
+    @property
+    def _alias(self):
+        """The alias of the connection used by the queryset, the one of
+        its collection, that may have been changed by :meth:`using`."""
+        alias = self._document._meta.get('db_alias', DEFAULT_CONNECTION_NAME)
+        collection = self._collection_obj
+        if collection is None:
+            return alias
+
+        return get_alias_for_db(collection.database) or alias
+
+    def _clone_into(self, new_qs):
+        new_qs = super()._clone_into(new_qs)
+        for prop in self._copy_props:
+            setattr(new_qs, prop, copy.copy(getattr(self, prop)))
+        return new_qs
+
+    def _get_shard_key_fields(self):
+        """Returns the db names of the fields in the shard key."""
+        fields = []
+        for key in self._document._meta.get('shard_key') or ():
+            path = self._document._lookup_field(key.split('.'))
+            fields.append('.'.join(p.db_field for p in path))
+        return fields
+
+    def _get_shard_key_query(self, query):
+        """Returns the equality conditions on the shard key fields
+        present in ``query``."""
+
+        shard_key = self._get_shard_key_fields()
+        if not shard_key:
+            return {}
+
+        conditions = [query] + [
+            q for q in query.get('$and', []) if isinstance(q, dict)]
+        shard_query = {}
+        for condition in conditions:
+            for field in shard_key:
+                if field not in condition or field in shard_query:
+                    continue
+                value = condition[field]
+                if isinstance(value, dict) and any(
+                        k.startswith('$') and k not in ('$eq', '$in')
+                        for k in value):
+                    continue
+                shard_query[field] = value
+        return shard_query
+
+    def _check_shard_key(self, query):
+        """Counts and warns about operations on sharded documents that
+        don't use the shard key, because they are sent to all the shards.
+        """
+        shard_key = self._get_shard_key_fields()
+        if not shard_key or shard_key[0] in self._get_shard_key_query(query):
+            return
+
+        name = self._document._class_name
+        metrics.incr('scatter_gather.' + name)
+        warnings.warn(
+            '{} query without the shard key {} will be sent to all '
+            'the shards'.format(name, tuple(shard_key)),
+            ScatterGatherWarning, stacklevel=get_stacklevel())
+
+    def _get_hedge_read_preference(self):
+        if self._hedge_read_preference is not None:
+            return self._hedge_read_preference
+
+        if self._read_preference in (None, ReadPreference.PRIMARY):
+            return ReadPreference.SECONDARY_PREFERRED
+        return ReadPreference.NEAREST
+
+    async def _hedged_read(self, method_name, *args, **kwargs):
+        """Calls ``method_name`` in a copy of the queryset and, if it
+        does not complete in time, calls it again in a copy using the
+        hedge read preference. Returns the first successful result."""
+
+        main = self.clone()
+        main._hedge_after_ms = None
+        hedge = main.read_preference(self._get_hedge_read_preference())
+
+        metrics.incr('hedge.reads')
+        main_task = asyncio.ensure_future(
+            getattr(main, method_name)(*args, **kwargs))
+        tasks = {main_task}
+        try:
+            done, pending = await asyncio.wait(
+                tasks, timeout=self._hedge_after_ms / 1000)
+            if not done:
+                metrics.incr('hedge.hedged')
+                hedge_task = asyncio.ensure_future(
+                    getattr(hedge, method_name)(*args, **kwargs))
+                tasks.add(hedge_task)
+
+            while True:
+                done, pending = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED)
+                ok = [t for t in done if t.exception() is None]
+                if ok:
+                    winner = main_task if main_task in ok else ok[0]
+                    if winner is not main_task:
+                        metrics.incr('hedge.hedge_wins')
+                    return winner.result()
+
+                if not pending:
+                    # all reads failed. We raise the main one's error.
+                    return main_task.result()
+                tasks = pending
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
     def _get_code(self, func):
         f_scope = {}
         if isinstance(func, Code):
@@ -794,68 +1356,320 @@ class QuerySet(MEQuerySet):
     async def _check_delete_rules(self, doc, queryset, cascade_refs,
                                   write_concern):
         """Checks the delete rules for documents being deleted in a queryset.
-        Raises an exception if any document has a DENY rule."""
+        Raises an exception if any document has a DENY rule.
+
+        Only the ids of the documents are read from the database,
+        ``DELETE_RULES_BATCH_SIZE`` at a time, and the rules are applied
+        to each batch."""
+
+        delete_rules = self._get_delete_rules(doc)
+        if not delete_rules:
+            return
+
+        deny_rules = [(document_cls, field_name)
+                      for document_cls, field_name, rule in delete_rules
+                      if rule == DENY]
+        other_rules = [r for r in delete_rules if r[2] != DENY]
 
-        delete_rules = doc._meta.get('delete_rules') or {}
         # Check for DENY rules before actually deleting/nullifying any other
         # references
-        delete_rules = delete_rules.copy()
-        fields = [d async for d in self]
-        for rule_entry in delete_rules:
-            document_cls, field_name = rule_entry
-            if document_cls._meta.get('abstract'):
-                continue
-            rule = doc._meta['delete_rules'][rule_entry]
-            if rule == DENY and document_cls.objects(
-                    **{field_name + '__in': self}).count() > 0:
+        if deny_rules:
+            async for ids in self._iter_ids(queryset):
+                await self._check_deny_rules(deny_rules, ids)
+
+        if not other_rules:
+            return
+
+        r = None
+        async for ids in self._iter_ids(queryset):
+            r = await self._apply_delete_rules(other_rules, ids, cascade_refs,
+                                               write_concern)
+        return r
+
+    def _get_delete_rules(self, doc):
+        """Returns a list of (document_cls, field_name, rule) with the
+        delete rules of ``doc``, skipping the abstract documents."""
+        delete_rules = doc._meta.get('delete_rules') or {}
+        return [(document_cls, field_name, rule)
+                for (document_cls, field_name), rule in delete_rules.items()
+                if not document_cls._meta.get('abstract')]
+
+    async def _iter_ids(self, queryset, batch_size=None):
+        """Yields lists with the ids of the documents matched by
+        ``queryset``, ``batch_size`` at a time. The skip, limit and
+        ordering of the queryset are respected.
+
+        :param queryset: The queryset to read the ids from.
+        :param batch_size: How many ids to yield at a time. Defaults
+          to ``DELETE_RULES_BATCH_SIZE``.
+        """
+        batch_size = batch_size or DELETE_RULES_BATCH_SIZE
+        queryset = queryset.only('pk')
+        # The ids are read from the primary, as the documents are about
+        # to be changed.
+        queryset._read_preference = None
+        queryset._batch_size = batch_size
+        cursor = queryset._cursor
+        try:
+            while True:
+                async with admission(self._alias):
+                    batch = await cursor.to_list(batch_size)
+                if batch:
+                    yield [d['_id'] for d in batch]
+                if len(batch) < batch_size:
+                    break
+        finally:
+            await cursor.close()
+
+    def _get_refs_query(self, document_cls, field_name, ids):
+        """Returns a raw query for the documents of ``document_cls``
+        that reference ``ids`` in ``field_name``."""
+        field = document_cls._fields[field_name]
+        db_field = field.db_field
+        # list fields have the reference field as its inner field.
+        field = getattr(field, 'field', None) or field
+        if field.dbref or field.document_type._meta.get('abstract'):
+            db_field = db_field + '.$id'
+        return {db_field: {'$in': ids}}
+
+    def _get_ref_values(self, document_cls, field_name, ids):
+        """Returns ``ids`` the way they are stored in ``field_name``."""
+        field = document_cls._fields[field_name]
+        field = getattr(field, 'field', None) or field
+        if field.document_type._meta.get('abstract'):
+            # The references to abstract documents store the class
+            # of the referenced document.
+            collection = self._document._get_collection_name()
+            return [DBRef(collection, i, cls=self._document._class_name)
+                    for i in ids]
+        return [field.to_mongo(i) for i in ids]
+
+    async def _check_deny_rules(self, deny_rules, ids):
+        """Raises OperationError if any document references ``ids``
+        through a field with a DENY rule."""
+        for document_cls, field_name in deny_rules:
+            query = self._get_refs_query(document_cls, field_name, ids)
+            ref = await document_cls.objects(__raw__=query).only(
+                'id').first()
+            if ref is not None:
                 msg = ("Could not delete document (%s.%s refers to it)"
                        % (document_cls.__name__, field_name))
                 raise OperationError(msg)
 
-        if not delete_rules:
-            return
-
+    async def _apply_delete_rules(self, delete_rules, ids, cascade_refs,
+                                  write_concern):
+        """Applies the CASCADE, NULLIFY and PULL rules to the documents
+        that reference ``ids``."""
         r = None
-        for rule_entry in delete_rules:
-            document_cls, field_name = rule_entry
-            if document_cls._meta.get('abstract'):
-                continue
-            rule = doc._meta['delete_rules'][rule_entry]
+        for document_cls, field_name, rule in delete_rules:
+            query = self._get_refs_query(document_cls, field_name, ids)
             if rule == CASCADE:
-                cascade_refs = set() if cascade_refs is None else cascade_refs
-                async for ref in queryset:
-                    cascade_refs.add(ref.id)
-
-                ref_q = document_cls.objects(**{field_name + '__in': fields,
-                                                'id__nin': cascade_refs})
+                # Only the ids of the documents being deleted in the
+                # cascade chain are kept, so a reference cycle does not
+                # loop forever.
+                refs = set(cascade_refs or ()) | set(ids)
+                ref_q = document_cls.objects(__raw__=query,
+                                             id__nin=list(refs))
 
                 count = await ref_q.count()
                 if count > 0:
                     r = await ref_q.delete(write_concern=write_concern,
-                                           cascade_refs=cascade_refs)
+                                           cascade_refs=refs)
 
             elif rule in (NULLIFY, PULL):
                 if rule == NULLIFY:
                     updatekw = {'unset__%s' % field_name: 1}
                 else:
-                    updatekw = {'pull_all__%s' % field_name: fields}
+                    field = document_cls._fields[field_name]
+                    values = self._get_ref_values(document_cls, field_name,
+                                                  ids)
+                    updatekw = {'__raw__': {
+                        '$pull': {field.db_field: {'$in': values}}}}
 
-                r = await document_cls.objects(
-                    **{field_name + '__in': fields}).update(
-                        write_concern=write_concern, **updatekw)
+                r = await document_cls.objects(__raw__=query).update(
+                    write_concern=write_concern, **updatekw)
 
         return r
 
-    async def _document_delete(self, queryset, write_concern):
+    async def _document_delete(self, queryset, write_concern,
+                               concurrency=None):
         """Delete the documents in queryset by calling the document's delete
-        method."""
+        method.
+
+        :param concurrency: How many documents are deleted at the same
+          time. If None the documents are deleted one by one."""
+
+        if not concurrency or concurrency < 2:
+            cnt = 0
+            async for doc in queryset:
+                await doc.delete(**write_concern)
+                cnt += 1
+            return cnt
+
+        sem = asyncio.Semaphore(concurrency)
+        pending = set()
+        errors = []
+        deleted = 0
+
+        async def delete_doc(doc):
+            try:
+                await doc.delete(**write_concern)
+            finally:
+                sem.release()
+
+        def task_done(task):
+            nonlocal deleted
+            pending.discard(task)
+            if task.cancelled():
+                return
+            if task.exception() is not None:
+                errors.append(task.exception())
+            else:
+                deleted += 1
+
+        try:
+            async for doc in queryset:
+                await sem.acquire()
+                if errors:
+                    sem.release()
+                    raise errors[0]
+
+                task = asyncio.ensure_future(delete_doc(doc))
+                pending.add(task)
+                task.add_done_callback(task_done)
+
+            await asyncio.gather(*pending)
+            # the tasks that failed before the gather are not in pending.
+            if errors:
+                raise errors[0]
+        except BaseException:
+            for task in pending:
+                task.cancel()
+            raise
+
+        return deleted
+
+    async def _batch_delete(self, queryset, write_concern):
+        """Deletes the documents in queryset using chunks of
+        ``DELETE_BATCH_SIZE`` ids. The delete rules are applied to each
+        chunk before it is deleted."""
 
         cnt = 0
-        async for doc in queryset:
-            await doc.delete(**write_concern)
-            cnt += 1
+        async for ids in self._iter_ids(queryset, DELETE_BATCH_SIZE):
+            cnt += await queryset._delete_chunk(ids, write_concern)
+
         return cnt
 
+    async def _delete_chunk(self, ids, write_concern, concurrency=None):
+        """Deletes the documents matched by the query whose ids are in
+        ``ids``. Returns the number of deleted documents."""
+
+        doc = self._document
+        has_delete_signal = (
+            signals.pre_delete.has_receivers_for(doc) or
+            signals.post_delete.has_receivers_for(doc))
+        if has_delete_signal or self._has_file_fields(doc):
+            queryset = self.clone()
+            queryset._skip = queryset._limit = None
+            return await self._document_delete(
+                queryset.filter(pk__in=ids), write_concern,
+                concurrency=concurrency)
+
+        delete_rules = self._get_delete_rules(doc)
+        deny_rules = [(document_cls, field_name)
+                      for document_cls, field_name, rule in delete_rules
+                      if rule == DENY]
+        other_rules = [r for r in delete_rules if r[2] != DENY]
+        await self._check_deny_rules(deny_rules, ids)
+        if other_rules:
+            await self._apply_delete_rules(other_rules, ids, None,
+                                           write_concern)
+
+        query = self._get_chunk_query(self._query, ids)
+        async with admission(self._alias):
+            r = await self._collection.delete_many(query, **write_concern)
+        return r.deleted_count
+
+    async def _update_chunk(self, ids, update, write_concern, read_concern,
+                            array_filters):
+        """Updates the documents matched by the query whose ids are in
+        ``ids``. Returns the number of updated documents."""
+
+        query = self._get_chunk_query(self._query, ids)
+        with set_read_write_concern(
+                self._collection, write_concern, read_concern) as collection:
+            async with admission(self._alias):
+                result = await collection.update_many(
+                    query, update, array_filters=array_filters)
+        return result.raw_result['n']
+
+    def _get_chunk_query(self, query, ids):
+        """Restricts ``query`` to the documents with ids in ``ids``."""
+        if '_id' in query:
+            return {'$and': [query, {'_id': {'$in': ids}}]}
+        chunk_query = dict(query)
+        chunk_query['_id'] = {'$in': ids}
+        return chunk_query
+
+    def _check_chunked_write(self):
+        if self._skip or self._limit:
+            raise InvalidQueryError(
+                "chunk_size can't be used with skip or limit")
+
+    async def _chunked_write(self, write, chunk_size, max_rate=None,
+                             throttle=None, resume_after=None):
+        """Walks the documents matched by the query in the order of their
+        ids, ``chunk_size`` documents at a time, and awaits ``write`` with
+        the ids of each chunk.
+
+        :param write: A coroutine function that receives a list of ids
+          and returns the number of documents written.
+        :param chunk_size: How many documents are written at a time.
+        :param max_rate: Maximum number of documents written per second.
+        :param throttle: A coroutine function awaited after each chunk.
+        :param resume_after: Only documents with ids greater than this are
+          written.
+        """
+        n = 0
+        checkpoint = resume_after
+        while True:
+            queryset = self.clone().order_by('pk').limit(chunk_size)
+            if checkpoint is not None:
+                queryset = queryset.filter(pk__gt=checkpoint)
+
+            start = time.monotonic()
+            try:
+                batches = [ids async for ids in self._iter_ids(
+                    queryset, chunk_size)]
+                ids = batches[0] if batches else []
+                if not ids:
+                    break
+
+                n += await write(ids)
+                checkpoint = ids[-1]
+
+                if len(ids) < chunk_size:
+                    break
+
+                if max_rate:
+                    wait = len(ids) / max_rate - (time.monotonic() - start)
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+
+                if throttle is not None:
+                    await throttle()
+            except Exception as err:
+                raise ChunkedWriteError(
+                    'Chunked write failed (%s)' % err, n=n,
+                    checkpoint=checkpoint) from err
+
+        return ChunkedWriteResult(n, checkpoint)
+
+    def _has_file_fields(self, doc):
+        FileField = _import_class('FileField')
+        return any(isinstance(field, FileField)
+                   for field in doc._fields.values())
+
     def _get_map_reduce_args(self, queryset, finalize_f, scope, limit, output):
         mr_args = {"query": queryset._query}
 
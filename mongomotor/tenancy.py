@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+"""Routing of the documents to a database per tenant.
+
+.. code-block:: python
+
+    def resolver(tenant_id):
+        return {'db': 'tenant-{}'.format(tenant_id)}
+
+    mongomotor.router(resolver)
+
+    with mongomotor.tenant('acme'):
+        # uses the database tenant-acme
+        await Post.objects.count()
+"""
+
+import asyncio
+from collections import OrderedDict
+from contextlib import contextmanager
+import contextvars
+import time
+from mongoengine.connection import (
+    DEFAULT_CONNECTION_NAME,
+    get_connection,
+    get_db,
+)
+from pymongo import AsyncMongoClient, monitoring
+from mongomotor.connection import get_event_listeners
+
+current_tenant = contextvars.ContextVar('mongomotor_tenant', default=None)
+
+_router = None
+
+
+@contextmanager
+def tenant(tenant_id):
+    """Sets the current tenant while inside the context manager.
+
+    :param tenant_id: The id of the tenant. It is passed to the resolver
+      of the router.
+    """
+    token = current_tenant.set(tenant_id)
+    try:
+        yield
+    finally:
+        current_tenant.reset(token)
+
+
+class _ClientUsage(monitoring.CommandListener):
+    """Counts the commands running in a client, so the client is only
+    closed when it is not in use."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def started(self, event):
+        self.in_flight += 1
+        self._idle.clear()
+
+    def succeeded(self, event):
+        self._done()
+
+    def failed(self, event):
+        self._done()
+
+    async def wait_idle(self):
+        await self._idle.wait()
+
+    def _done(self):
+        self.in_flight = max(self.in_flight - 1, 0)
+        if not self.in_flight:
+            self._idle.set()
+
+
+class Router:
+    """Maps tenants to databases.
+
+    The resolver is a callable that receives a tenant id and returns
+    either the alias of a connection created with
+    :func:`~mongomotor.connection.connect` or a dict with the key ``db``,
+    the name of the database, and optionally the keyword arguments for
+    :class:`~pymongo.AsyncMongoClient`, ie: ``host``. When the dict has only
+    ``db`` the client of the default connection is used.
+
+    Clients are only created when a tenant is used for the first time and
+    tenants with the same client settings share the same client. When there
+    are more than ``max_clients`` clients or a client is not used for
+    ``idle_timeout`` seconds, the least recently used client is closed as
+    soon as the commands running in it finish.
+
+    :param resolver: A callable that maps a tenant id to a database.
+    :param max_clients: Maximum number of clients kept open.
+    :param max_tenants: Maximum number of resolved tenants kept in memory.
+    :param idle_timeout: Seconds a client may stay unused before being
+      closed. If None idle clients are only closed by ``max_clients``.
+    """
+
+    def __init__(self, resolver, max_clients=100, max_tenants=10000,
+                 idle_timeout=None):
+        self.resolver = resolver
+        self.max_clients = max_clients
+        self.max_tenants = max_tenants
+        self.idle_timeout = idle_timeout
+        # client key -> [client, last used time, usage]
+        self._clients = OrderedDict()
+        # tenant id -> (client key, db name) or alias
+        self._tenants = OrderedDict()
+        self._closing = set()
+
+    @property
+    def clients_count(self):
+        """The number of clients open by the router."""
+        return len(self._clients)
+
+    def get_db(self, tenant_id):
+        """Returns the database of a tenant.
+
+        :param tenant_id: The id of the tenant."""
+
+        try:
+            resolved = self._tenants[tenant_id]
+            self._tenants.move_to_end(tenant_id)
+        except KeyError:
+            resolved = self._resolve(tenant_id)
+            self._tenants[tenant_id] = resolved
+            if len(self._tenants) > self.max_tenants:
+                self._tenants.popitem(last=False)
+
+        if isinstance(resolved, str):
+            return get_db(resolved)
+
+        key, db_name, client_kwargs = resolved
+        return self._get_client(key, client_kwargs)[db_name]
+
+    async def close(self):
+        """Closes all the clients open by the router."""
+        clients = [c for c, _, _ in self._clients.values()]
+        self._clients.clear()
+        self._tenants.clear()
+        for client in clients:
+            await client.close()
+
+    def _resolve(self, tenant_id):
+        resolved = self.resolver(tenant_id)
+        if isinstance(resolved, str):
+            return resolved
+
+        client_kwargs = dict(resolved)
+        db_name = client_kwargs.pop('db')
+        key = tuple(sorted((k, repr(v)) for k, v in client_kwargs.items()))
+        return key, db_name, client_kwargs
+
+    def _get_client(self, key, client_kwargs):
+        if not client_kwargs:
+            return get_connection(DEFAULT_CONNECTION_NAME)
+
+        now = time.monotonic()
+        try:
+            entry = self._clients[key]
+            entry[1] = now
+            self._clients.move_to_end(key)
+        except KeyError:
+            client_kwargs = dict(client_kwargs)
+            client_kwargs.setdefault('uuidrepresentation', 'standard')
+            usage = _ClientUsage()
+            client_kwargs['event_listeners'] = get_event_listeners(
+                client_kwargs.get('event_listeners')) + [usage]
+            entry = [AsyncMongoClient(**client_kwargs), now, usage]
+            self._clients[key] = entry
+
+        self._evict(now)
+        return entry[0]
+
+    def _evict(self, now):
+        while len(self._clients) > self.max_clients:
+            _, (client, _, usage) = self._clients.popitem(last=False)
+            self._close_client(client, usage)
+
+        if self.idle_timeout is None:
+            return
+
+        while self._clients:
+            key, (client, last_used, usage) = next(
+                iter(self._clients.items()))
+            if now - last_used < self.idle_timeout:
+                break
+            del self._clients[key]
+            self._close_client(client, usage)
+
+    def _close_client(self, client, usage):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # no loop, let the client be garbage collected.
+            return
+
+        task = loop.create_task(self._close_when_idle(client, usage))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _close_when_idle(self, client, usage):
+        # other tasks may still be using the databases of the client.
+        await usage.wait_idle()
+        await client.close()
+
+
+def router(resolver, **kwargs):
+    """Sets the router used to find the database of the current tenant.
+    Returns the :class:`~mongomotor.tenancy.Router`. If ``resolver`` is
+    None the router is removed.
+
+    :param resolver: A callable that maps a tenant id to a database.
+      See :class:`~mongomotor.tenancy.Router`.
+    :param kwargs: Keyword arguments for :class:`~mongomotor.tenancy.Router`.
+    """
+    global _router
+
+    _router = Router(resolver, **kwargs) if resolver is not None else None
+    return _router
+
+
+def get_router():
+    """Returns the router in use or None."""
+    return _router
+
+
+def get_tenant_db(doc_cls):
+    """Returns the database of the current tenant for a document class or
+    None if there is no router, no current tenant or if the document
+    has ``tenant_routing`` set to False in its meta.
+
+    :param doc_cls: A :class:`~mongomotor.Document` subclass.
+    """
+    if _router is None:
+        return None
+
+    tenant_id = current_tenant.get()
+    if tenant_id is None or not doc_cls._meta.get('tenant_routing', True):
+        return None
+
+    return _router.get_db(tenant_id)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+"""Throttles to be used with the chunked writes.
+
+.. code-block:: python
+
+    throttle = ReplicationLagThrottle(max_lag=5)
+    await Post.objects.filter(old=True).update(
+        chunk_size=1000, throttle=throttle, set__archived=True)
+"""
+
+import asyncio
+from mongoengine.connection import DEFAULT_CONNECTION_NAME, get_connection
+from pymongo.errors import OperationFailure
+
+
+class ReplicationLagThrottle:
+    """Waits while the replication lag of the secondaries is greater than
+    ``max_lag`` seconds.
+
+    :param alias: The alias of the connection.
+    :param max_lag: Maximum lag, in seconds, of the secondaries.
+    :param interval: Seconds to wait before checking the lag again.
+    :param timeout: Maximum time, in seconds, to wait for the lag to go
+      down. If None waits forever.
+    """
+
+    def __init__(self, alias=DEFAULT_CONNECTION_NAME, max_lag=10,
+                 interval=1, timeout=None):
+        self.alias = alias
+        self.max_lag = max_lag
+        self.interval = interval
+        self.timeout = timeout
+
+    async def __call__(self):
+        waited = 0
+        while await self.get_lag() > self.max_lag:
+            if self.timeout is not None and waited >= self.timeout:
+                raise asyncio.TimeoutError(
+                    'Replication lag did not go down in {} seconds'.format(
+                        self.timeout))
+            await asyncio.sleep(self.interval)
+            waited += self.interval
+
+    async def get_lag(self):
+        """Returns the greatest lag, in seconds, between the primary and
+        its secondaries. Returns 0 if the server is not a replica set."""
+        client = get_connection(self.alias)
+        try:
+            status = await client.admin.command('replSetGetStatus')
+        except OperationFailure:
+            # not running with a replica set
+            return 0
+
+        members = status.get('members', [])
+        primary = [m['optimeDate'] for m in members
+                   if m.get('stateStr') == 'PRIMARY']
+        if not primary:
+            return 0
+
+        lags = [(primary[0] - m['optimeDate']).total_seconds()
+                for m in members if m.get('stateStr') == 'SECONDARY']
+        return max(lags, default=0)
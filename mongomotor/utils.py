@@ -17,8 +17,17 @@
 # You should have received a copy of the GNU General Public License
 # along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
 
+import os
+import sys
 import threading
 from mongoengine.connection import _dbs
+from pymongo.read_preferences import (
+    _ServerMode,
+    make_read_preference,
+    read_pref_mode_from_name,
+)
+
+_MONGOMOTOR_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
 def get_sync_alias(alias):
@@ -36,5 +45,49 @@ def get_alias_for_db(db):
             return alias
 
 
+def get_stacklevel():
+    """Returns the ``stacklevel`` for :func:`warnings.warn` of the first
+    frame outside mongomotor, so the warning points to the user code
+    whatever the wrappers between it and the caller."""
+
+    frame = sys._getframe(1)
+    stacklevel = 1
+    while frame is not None and os.path.abspath(
+            frame.f_code.co_filename).startswith(_MONGOMOTOR_DIR):
+        frame = frame.f_back
+        stacklevel += 1
+    return stacklevel
+
+
 def is_main_thread():
     return threading.current_thread() == threading.main_thread()
+
+
+def get_read_preference(read_preference, tag_sets=None, max_staleness=-1):
+    """Returns a pymongo read preference.
+
+    :param read_preference: A pymongo read preference, the name of
+      a read preference mode, ie: 'secondaryPreferred', or a dict with
+      the keys ``mode`` and optionally ``tag_sets`` and ``max_staleness``.
+    :param tag_sets: The tag sets used to select the replica set members.
+    :param max_staleness: The maximum replication lag, in seconds, of
+      the selected secondaries. -1 means no maximum.
+    """
+    if read_preference is None:
+        return None
+
+    if isinstance(read_preference, dict):
+        kw = dict(read_preference)
+        mode = kw.pop('mode')
+        kw.setdefault('tag_sets', tag_sets)
+        kw.setdefault('max_staleness', max_staleness)
+        return get_read_preference(mode, **kw)
+
+    if isinstance(read_preference, _ServerMode):
+        if tag_sets is None and max_staleness == -1:
+            return read_preference
+        mode = read_preference.mode
+    else:
+        mode = read_pref_mode_from_name(read_preference)
+
+    return make_read_preference(mode, tag_sets, max_staleness)
@@ -22,6 +22,8 @@ def connect2db():
     port = os.environ.get('MONGOMOTOR_TEST_DB_PORT')
     username = os.environ.get('MONGOMOTOR_TEST_DB_USERNAME')
     password = os.environ.get('MONGOMOTOR_TEST_DB_PASSWORD')
+    # MONGOMOTOR_TEST_BACKEND=memory runs the tests without a mongod.
+    backend = os.environ.get('MONGOMOTOR_TEST_BACKEND')
 
     conn_kw = {}
 
@@ -37,6 +39,9 @@ def connect2db():
     if password:
         conn_kw['password'] = password
 
+    if backend:
+        conn_kw['backend'] = backend
+
     conn_kw['retryWrites'] = False
     db = 'mongomotor-test'
 
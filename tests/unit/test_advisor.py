@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from mongomotor import Document, advisor
+from mongomotor.fields import IntField, StringField
+from mongomotor.queryset import QuerySet
+from tests import async_test
+
+
+class FakeExplainCursor:
+
+    def __init__(self, plan):
+        self.plan = plan
+
+    async def explain(self):
+        return {'queryPlanner': {'winningPlan': self.plan}}
+
+
+class QueryShapeTest(TestCase):
+
+    def setUp(self):
+        class ShapeDoc(Document):
+            a = StringField()
+            b = IntField(db_field='bb')
+            c = IntField()
+
+        self.test_doc = ShapeDoc
+
+    def test_get_query_shape(self):
+        query = {'$and': [{'a': 'x'}, {'bb': {'$gt': 1}}],
+                 'c': {'$in': [1, 2]}}
+        shape = advisor.get_query_shape(self.test_doc, query,
+                                        sort=[('bb', -1)])
+        self.assertEqual(shape.equality, ('a', 'c'))
+        self.assertEqual(shape.range, ('bb',))
+        self.assertEqual(shape.sort, (('bb', -1),))
+
+    def test_get_query_shape_ignores_values(self):
+        shape = advisor.get_query_shape(self.test_doc, {'a': 'x'})
+        other = advisor.get_query_shape(self.test_doc, {'a': 'y'})
+        self.assertEqual(shape, other)
+
+    def test_suggest_index(self):
+        shape = advisor.get_query_shape(
+            self.test_doc, {'a': 'x', 'c': {'$lt': 2}}, sort=[('bb', -1)])
+        self.assertEqual(advisor.suggest_index(shape),
+                         {'fields': ['a', '-b', 'c']})
+
+
+class IndexAdvisorTest(TestCase):
+
+    def setUp(self):
+        class AdvisedDoc(Document):
+            a = StringField()
+            b = IntField()
+
+            meta = {'indexes': ['a', 'b']}
+
+        self.test_doc = AdvisedDoc
+        self.advisor = advisor.IndexAdvisor()
+
+    def test_record_only_while_recording(self):
+        qs = QuerySet(self.test_doc, MagicMock()).filter(a='x')
+        with self.advisor.recording():
+            qs._cursor
+
+        QuerySet(self.test_doc, MagicMock()).filter(b=1)._cursor
+        self.assertEqual(len(self.advisor.shapes), 1)
+
+    def test_record_counts_shapes(self):
+        with self.advisor.recording():
+            QuerySet(self.test_doc, MagicMock()).filter(a='x')._cursor
+            QuerySet(self.test_doc, MagicMock()).filter(a='y')._cursor
+
+        self.assertEqual(list(self.advisor.shapes.values())[0][0], 2)
+
+    def test_record_max_shapes(self):
+        self.advisor.max_shapes = 1
+        with self.advisor.recording():
+            QuerySet(self.test_doc, MagicMock()).filter(a='x')._cursor
+            QuerySet(self.test_doc, MagicMock()).filter(b=1)._cursor
+
+        self.assertEqual(len(self.advisor.shapes), 1)
+
+    @async_test
+    async def test_analyze(self):
+        with self.advisor.recording():
+            QuerySet(self.test_doc, MagicMock()).filter(a='x')._cursor
+            QuerySet(self.test_doc, MagicMock()).filter(
+                b=1).order_by('-a')._cursor
+
+        ixscan = {'stage': 'FETCH', 'inputStage': {
+            'stage': 'IXSCAN', 'keyPattern': {'a': 1}}}
+        collscan = {'stage': 'SORT', 'inputStage': {'stage': 'COLLSCAN'}}
+        collection = MagicMock()
+        collection.find.side_effect = [FakeExplainCursor(ixscan),
+                                       FakeExplainCursor(collscan)]
+
+        with patch.object(self.test_doc, '_get_collection',
+                          return_value=collection):
+            report = await self.advisor.analyze()
+
+        ok, bad = report.shapes
+        self.assertFalse(ok.collscan)
+        self.assertEqual(ok.index, [('a', 1)])
+        self.assertTrue(bad.collscan)
+        self.assertTrue(bad.in_memory_sort)
+        self.assertEqual(bad.suggestion, {'fields': ['b', '-a']})
+        self.assertEqual(report.unused_indexes, {self.test_doc: [[('b', 1)]]})
+
+        text = self.advisor.format_report(report)
+        self.assertIn("AdvisedDoc: COLLSCAN, in-memory SORT", text)
+        self.assertIn("meta['indexes'] += [{'fields': ['b', '-a']}]", text)
+
+    @async_test
+    async def test_analyze_newer_plan(self):
+        with self.advisor.recording():
+            QuerySet(self.test_doc, MagicMock()).filter(a='x')._cursor
+
+        plan = {'queryPlan': {'stage': 'COLLSCAN'}}
+        collection = MagicMock()
+        collection.find.return_value = FakeExplainCursor(plan)
+        with patch.object(self.test_doc, '_get_collection',
+                          return_value=collection):
+            report = await self.advisor.analyze()
+
+        self.assertTrue(report.shapes[0].collscan)
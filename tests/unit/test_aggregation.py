@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from mongomotor import Document, EmbeddedDocument, disconnect
+from mongomotor.aggregation import Count, First, Max, Push, Sum
+from mongomotor.fields import (EmbeddedDocumentField, IntField,
+                               StringField)
+from tests import async_test, connect2db
+
+
+class GroupByTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        connect2db()
+
+    @classmethod
+    def tearDownClass(cls):
+        disconnect()
+
+    def setUp(self):
+        class Store(EmbeddedDocument):
+            city = StringField(db_field='c')
+
+        class Sale(Document):
+            product = StringField()
+            amount = IntField(db_field='amt')
+            store = EmbeddedDocumentField(Store)
+
+        self.store = Store
+        self.sale = Sale
+
+    @async_test
+    async def tearDown(self):
+        await self.sale.drop_collection()
+
+    async def _create_sales(self):
+        sales = [('a', 1, 'x'), ('a', 2, 'y'), ('b', 5, 'x'),
+                 ('c', 3, 'x'), ('c', 4, 'x')]
+        await self.sale.objects.insert([
+            self.sale(product=p, amount=a, store=self.store(city=c))
+            for p, a, c in sales])
+
+    def test_to_pipeline(self):
+        groups = self.sale.objects.group_by('store__city').annotate(
+            total=Sum('amount'), n=Count()).order_by(
+                '-total', 'store__city').limit(2)
+
+        self.assertEqual(groups.to_pipeline(), [
+            {'$group': {'_id': {'store__city': '$store.c'},
+                        'total': {'$sum': '$amt'},
+                        'n': {'$sum': 1}}},
+            {'$sort': {'total': -1, '_id.store__city': 1}},
+            {'$limit': 2},
+            {'$project': {'_id': 0, 'store__city': '$_id.store__city',
+                          'total': '$total', 'n': '$n'}}])
+
+    def test_annotate_returns_new_group_by(self):
+        groups = self.sale.objects.group_by('product')
+        annotated = groups.annotate(n=Count())
+        self.assertEqual(len(groups.to_pipeline()[0]['$group']), 1)
+        self.assertIn('n', annotated.to_pipeline()[0]['$group'])
+
+    def test_invalid_names(self):
+        groups = self.sale.objects.group_by('product')
+        with self.assertRaises(ValueError):
+            groups.annotate(product=Count())
+        with self.assertRaises(ValueError):
+            groups.order_by('total')
+        with self.assertRaises(TypeError):
+            self.sale.objects.group_by()
+
+    def test_invalid_row_names(self):
+        with self.assertRaises(ValueError):
+            self.sale.objects.group_by('_cls')
+        with self.assertRaises(ValueError):
+            self.sale.objects.group_by('store-city')
+        groups = self.sale.objects.group_by('store.city')
+        with self.assertRaises(ValueError):
+            groups.annotate(_total=Sum('amount'))
+        with self.assertRaises(ValueError):
+            groups.annotate(**{'class': Count()})
+        self.assertEqual(groups._fields, ['store__city'])
+
+    @async_test
+    async def test_group_by(self):
+        await self._create_sales()
+        groups = self.sale.objects.order_by('amount').group_by(
+            'product').annotate(total=Sum('amount'), n=Count(),
+                                first=First('amount'),
+                                amounts=Push('amount')).order_by('-total')
+
+        rows = [row async for row in groups]
+        self.assertEqual([tuple(r) for r in rows],
+                         [('c', 7, 2, 3, [3, 4]), ('b', 5, 1, 5, [5]),
+                          ('a', 3, 2, 1, [1, 2])])
+        self.assertEqual(rows[0].product, 'c')
+
+    @async_test
+    async def test_group_by_many_fields_filtered(self):
+        await self._create_sales()
+        groups = self.sale.objects(amount__gt=1).group_by(
+            'product', 'store.city').annotate(
+                max=Max('amount')).order_by('product', 'store__city')
+
+        rows = await groups.limit(2).to_list()
+        self.assertEqual([tuple(r) for r in rows],
+                         [('a', 'y', 2), ('b', 'x', 5)])
+        self.assertEqual(rows[0]._fields, ('product', 'store__city', 'max'))
+
+    @async_test
+    async def test_group_by_missing_values(self):
+        await self.sale.objects.insert([
+            self.sale(product='a', amount=1, store=self.store(city='x')),
+            self.sale(product='b')])
+
+        rows = await self.sale.objects.group_by('store__city').annotate(
+            max=Max('amount')).order_by('store__city').to_list()
+        self.assertEqual([(r.store__city, r.max) for r in rows],
+                         [(None, None), ('x', 1)])
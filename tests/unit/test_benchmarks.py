@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from benchmarks import cases  # noqa f401 registers the benchmarks
+from benchmarks import runner
+from tests import async_test
+
+
+class BenchmarkTest(TestCase):
+
+    @async_test
+    async def test_run(self):
+        calls = []
+
+        async def setup():
+            async def run():
+                calls.append(1)
+            return run
+
+        bench = runner.Benchmark('bla', setup, ops=10)
+        result = await bench.run(repeat=3, warmup=2)
+
+        self.assertEqual(len(calls), 5)
+        self.assertEqual(result['repeat'], 3)
+        self.assertEqual(result['ops'], 10)
+        self.assertLessEqual(result['min'], result['median'])
+
+    @async_test
+    async def test_dereference_list_refs(self):
+        bench = runner.get_benchmarks(['dereference.list_refs'])[0]
+        result = await bench.run(repeat=1, warmup=0)
+
+        self.assertGreater(result['ops_per_sec'], 0)
+
+
+class RunnerTest(TestCase):
+
+    def test_get_benchmarks(self):
+        benchmarks = runner.get_benchmarks()
+        names = [b.name for b in benchmarks]
+
+        self.assertIn('from_son.wide', names)
+        self.assertFalse(any(b.needs_db for b in benchmarks))
+
+    def test_get_benchmarks_names(self):
+        names = [b.name for b in runner.get_benchmarks(['db.'], db=True)]
+
+        self.assertTrue(names)
+        self.assertTrue(all(n.startswith('db.') for n in names))
+
+    def test_compare(self):
+        baseline = {'results': {'a': {'median': 1.0},
+                                'b': {'median': 1.0},
+                                'c': {'median': 1.0}}}
+        results = {'results': {'a': {'median': 1.05},
+                               'b': {'median': 1.5},
+                               'd': {'median': 1.0}}}
+
+        comparison = runner.compare(results, baseline, threshold=0.1)
+
+        self.assertEqual([c['name'] for c in comparison], ['a', 'b'])
+        self.assertFalse(comparison[0]['regression'])
+        self.assertTrue(comparison[1]['regression'])
+        self.assertAlmostEqual(comparison[1]['change'], 0.5)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+from unittest import TestCase
+from unittest.mock import Mock
+import bson
+from bson.raw_bson import RawBSONDocument
+from mongomotor import budget, query_budget
+from mongomotor.connection import get_event_listeners
+from mongomotor.exceptions import QueryBudgetExceeded
+from tests import async_test
+
+
+def _find(docs, name='find'):
+    batch = 'firstBatch' if name == 'find' else 'nextBatch'
+    budget.listener.started(Mock(command_name=name))
+    budget.listener.succeeded(Mock(
+        command_name=name, reply={'cursor': {batch: docs}, 'ok': 1}))
+
+
+class QueryBudgetTest(TestCase):
+
+    @async_test
+    async def test_counts(self):
+        async with query_budget(max_bytes=10 ** 6) as b:
+            _find([{'a': 1}, {'a': 2}])
+            _find([{'a': 3}], name='getMore')
+
+        totals = b.as_dict()
+        self.assertEqual(totals['queries'], 2)
+        self.assertEqual(totals['docs'], 3)
+        self.assertGreater(totals['bytes'], 0)
+        self.assertEqual(totals['commands'], {'find': 1, 'getMore': 1})
+
+    @async_test
+    async def test_bytes_only_counted_with_max_bytes(self):
+        async with query_budget() as b:
+            _find([{'a': 1}])
+            async with query_budget() as inner:
+                _find([{'a': 1}])
+        self.assertEqual(b.bytes, 0)
+        self.assertEqual(inner.bytes, 0)
+
+        async with query_budget(max_bytes=10 ** 6) as b:
+            async with query_budget() as inner:
+                budget.listener.succeeded(Mock(reply=RawBSONDocument(
+                    bson.encode({'ok': 1}))))
+        self.assertEqual(inner.bytes, len(bson.encode({'ok': 1})))
+        self.assertEqual(b.bytes, inner.bytes)
+
+    @async_test
+    async def test_counts_tasks(self):
+        async def query():
+            _find([{'a': 1}])
+
+        async with query_budget() as b:
+            await asyncio.gather(query(), query())
+
+        self.assertEqual(b.queries, 2)
+
+    @async_test
+    async def test_outside_budget(self):
+        _find([{'a': 1}])
+        self.assertIsNone(budget.get_budget())
+
+    @async_test
+    async def test_exceeded_raises(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            async with query_budget(max_queries=1):
+                _find([])
+                _find([])
+
+    @async_test
+    async def test_exceeded_logs(self):
+        with self.assertLogs('mongomotor.budget', 'WARNING'):
+            async with query_budget(max_docs=1, raise_error=False) as b:
+                _find([{'a': 1}, {'a': 2}])
+
+        self.assertEqual(b.exceeded, ['2 docs > 1'])
+
+    @async_test
+    async def test_nested(self):
+        async with query_budget() as outer:
+            async with query_budget() as inner:
+                _find([{'a': 1}])
+            _find([])
+
+        self.assertEqual(inner.queries, 1)
+        self.assertEqual(outer.queries, 2)
+
+
+class GetEventListenersTest(TestCase):
+
+    def test_get_event_listeners(self):
+        other = Mock()
+        listeners = get_event_listeners([other])
+        self.assertEqual(listeners, [other, budget.listener])
+
+    def test_get_event_listeners_already_there(self):
+        listeners = get_event_listeners([budget.listener])
+        self.assertEqual(listeners, [budget.listener])
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+import bz2
+from unittest import TestCase
+from mongomotor import compression
+
+
+class Bz2Codec(compression.Codec):
+    name = 'bz2'
+
+    def compressobj(self):
+        return bz2.BZ2Compressor()
+
+    def decompressobj(self):
+        return compression.StreamDecompressor(bz2.BZ2Decompressor())
+
+
+def _roundtrip(codec, data, size=100):
+    compressor = codec.compressobj()
+    compressed = b''.join(compressor.compress(data[i:i + size])
+                          for i in range(0, len(data), size))
+    compressed += compressor.flush()
+
+    decompressor = codec.decompressobj()
+    decompressed = b''.join(decompressor.decompress(compressed[i:i + size])
+                            for i in range(0, len(compressed), size))
+    return compressed, decompressed + decompressor.flush()
+
+
+class CodecTest(TestCase):
+
+    def tearDown(self):
+        compression._codecs.pop('bz2', None)
+
+    def test_builtin_codecs(self):
+        data = b'some text to compress ' * 100
+        for name in ('zlib', 'lzma'):
+            compressed, decompressed = _roundtrip(
+                compression.get_codec(name), data)
+            self.assertLess(len(compressed), len(data))
+            self.assertEqual(decompressed, data)
+
+    def test_register_codec(self):
+        compression.register_codec(Bz2Codec())
+        codec = compression.get_codec('bz2')
+        data = b'some text to compress ' * 100
+        self.assertEqual(_roundtrip(codec, data)[1], data)
+
+    def test_register_codec_without_name(self):
+        with self.assertRaises(ValueError):
+            compression.register_codec(compression.Codec())
+
+    def test_get_codec_instance(self):
+        codec = compression.ZlibCodec(level=9)
+        self.assertIs(compression.get_codec(codec), codec)
+
+    def test_get_codec_unknown(self):
+        with self.assertRaises(ValueError):
+            compression.get_codec('bla')
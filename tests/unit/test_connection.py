@@ -17,6 +17,7 @@
 # You should have received a copy of the GNU General Public License
 # along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 from unittest import TestCase
 from unittest.mock import patch
 try:
@@ -26,7 +27,11 @@ except ImportError:
 
 from mongoengine.connection import _connection_settings
 from mongomotor import connect, disconnect
+from mongomotor import connection
 from mongomotor.connection import AsyncMongoClient
+from mongomotor.exceptions import ConcurrencyLimitError
+from mongomotor.memory import MemoryClient
+from tests import async_test
 
 
 class ConnectionTest(TestCase):
@@ -43,3 +48,93 @@ class ConnectionTest(TestCase):
         connect()
         self.assertEqual(len(_connection_settings), 2,
                          _connection_settings.keys())
+
+    def test_connect_memory_backend(self):
+        conn = connect(backend='memory')
+        self.assertIsInstance(conn, MemoryClient)
+        # there is no sync connection for the memory backend
+        self.assertEqual(len(_connection_settings), 1)
+        self.assertEqual(connection.get_db_version(), (7, 0))
+
+    def test_connect_keeps_concurrency_limit(self):
+        limiter = connection.set_concurrency_limit('default', 2)
+        connect(backend='memory')
+        self.assertIs(connection._limiters['default'], limiter)
+
+        disconnect()
+        connect(backend='memory', max_in_flight=3)
+        stats = connection.get_concurrency_stats('default')
+        self.assertIsNotNone(stats)
+        self.assertIsNot(connection._limiters['default'], limiter)
+
+    def test_connect_invalid_backend(self):
+        with self.assertRaises(ValueError):
+            connect(backend='bad')
+
+
+class ConcurrencyLimiterTest(TestCase):
+
+    def tearDown(self):
+        connection._limiters.clear()
+
+    @async_test
+    async def test_max_in_flight(self):
+        limiter = connection.ConcurrencyLimiter(2)
+        running = []
+        max_running = 0
+
+        async def op():
+            nonlocal max_running
+            async with limiter:
+                running.append(1)
+                max_running = max(max_running, len(running))
+                await asyncio.sleep(0.01)
+                running.pop()
+
+        await asyncio.gather(*[op() for i in range(6)])
+
+        self.assertEqual(max_running, 2)
+        stats = limiter.stats()
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertEqual(stats['acquired'], 6)
+        self.assertEqual(stats['waited'], 4)
+        self.assertEqual(stats['max_queued'], 4)
+
+    @async_test
+    async def test_reject_when_queue_full(self):
+        limiter = connection.ConcurrencyLimiter(1, max_queue=0)
+        await limiter.acquire()
+
+        with self.assertRaises(ConcurrencyLimitError):
+            await limiter.acquire()
+
+        limiter.release()
+        self.assertEqual(limiter.stats()['rejected'], 1)
+
+    @async_test
+    async def test_timeout(self):
+        limiter = connection.ConcurrencyLimiter(1, timeout=0.01)
+        await limiter.acquire()
+
+        with self.assertRaises(ConcurrencyLimitError):
+            await limiter.acquire()
+
+        limiter.release()
+        self.assertEqual(limiter.stats()['timed_out'], 1)
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertEqual(limiter.queued, 0)
+
+    @async_test
+    async def test_admission_without_limiter(self):
+        async with connection.admission('no-limit'):
+            pass
+
+        self.assertIsNone(connection.get_concurrency_stats('no-limit'))
+
+    def test_set_concurrency_limit(self):
+        connection.set_concurrency_limit('some-alias', 10)
+        stats = connection.get_concurrency_stats('some-alias')
+        self.assertEqual(stats['in_flight'], 0)
+
+        connection.set_concurrency_limit('some-alias', None)
+        self.assertIsNone(connection.get_concurrency_stats('some-alias'))
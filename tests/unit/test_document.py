@@ -18,7 +18,7 @@
 # along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
 
 from unittest import TestCase
-from unittest.mock import patch, Mock
+from unittest.mock import patch, AsyncMock, MagicMock, Mock
 import mongoengine
 from mongomotor import Document, disconnect
 from mongomotor import document
@@ -190,3 +190,70 @@ class DocumentTest(TestCase):
         await d.reload()
         refs = await d.refs_list
         self.assertEqual(len(refs), 1)
+
+
+class EnsureIndexesTest(TestCase):
+
+    def setUp(self):
+        class IndexedDoc(Document):
+            a = IntField()
+            b = IntField()
+
+            meta = {'indexes': ['a', {'fields': ['-b'], 'unique': True}],
+                    'allow_inheritance': True}
+
+        class IndexedChild(IndexedDoc):
+            pass
+
+        class OtherIndexedDoc(Document):
+            a = IntField()
+
+            meta = {'indexes': ['a']}
+
+        class AbstractIndexedDoc(Document):
+            meta = {'abstract': True}
+
+        self.indexed_doc = IndexedDoc
+        self.child_doc = IndexedChild
+        self.other_doc = OtherIndexedDoc
+        self.abstract_doc = AbstractIndexedDoc
+
+    def _get_collection(self, name):
+        collection = MagicMock()
+        collection.full_name = 'db.' + name
+        collection.create_indexes = AsyncMock()
+        return collection
+
+    @async_test
+    async def test_ensure_indexes_single_command(self):
+        collection = self._get_collection('indexed_doc')
+        with patch.object(self.indexed_doc, '_get_collection',
+                          Mock(return_value=collection)):
+            await self.indexed_doc.ensure_indexes()
+
+        self.assertEqual(collection.create_indexes.await_count, 1)
+        indexes = collection.create_indexes.call_args[0][0]
+        self.assertEqual([i.document['key'] for i in indexes],
+                         [{'_cls': 1, 'a': 1}, {'_cls': 1, 'b': -1}])
+        self.assertTrue(indexes[1].document['unique'])
+
+    @async_test
+    async def test_ensure_all_indexes(self):
+        registry = {'IndexedDoc': self.indexed_doc,
+                    'IndexedDoc.IndexedChild': self.child_doc,
+                    'OtherIndexedDoc': self.other_doc,
+                    'AbstractIndexedDoc': self.abstract_doc}
+        indexed_collection = self._get_collection('indexed_doc')
+        other_collection = self._get_collection('other_indexed_doc')
+
+        with patch.object(document, '_document_registry', registry), \
+                patch.object(self.indexed_doc, '_get_collection',
+                             Mock(return_value=indexed_collection)), \
+                patch.object(self.other_doc, '_get_collection',
+                             Mock(return_value=other_collection)):
+            timings = await document.ensure_all_indexes(concurrency=2)
+
+        self.assertEqual(sorted(timings.keys()),
+                         ['db.indexed_doc', 'db.other_indexed_doc'])
+        self.assertEqual(indexed_collection.create_indexes.await_count, 2)
+        self.assertEqual(other_collection.create_indexes.await_count, 1)
@@ -17,14 +17,22 @@
 # You should have received a copy of the GNU General Public License
 # along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
+import io
+import os
+import tempfile
 from unittest import TestCase
+from unittest.mock import patch
+from bson import ObjectId
 from mongoengine.connection import get_db
+from pymongo.errors import DuplicateKeyError, OperationFailure
 import gridfs
-from mongomotor import Document, disconnect, EmbeddedDocument
+from mongomotor import Document, disconnect, EmbeddedDocument, fields
 from mongomotor.fields import (ReferenceField, ListField,
                                EmbeddedDocumentField, StringField, DictField,
                                BaseList, BaseDict, GridFSProxy, FileField,
                                GridFSError, GenericReferenceField)
+from mongomotor.filecache import FileCache
 from tests import async_test, connect2db
 
 
@@ -310,6 +318,121 @@ class GridFSProxyTest(TestCase):
         contents = await self.proxy.read()
         self.assertEqual(contents, new_contents)
 
+    @async_test
+    async def test_iter_chunks(self):
+        await self.proxy.put(b'0123456789', chunk_size=4)
+        chunks = [c async for c in self.proxy.iter_chunks()]
+        self.assertEqual(chunks, [b'0123', b'4567', b'89'])
+
+        chunks = [c async for c in self.proxy.iter_chunks(chunk_size=3)]
+        self.assertEqual(chunks, [b'012', b'345', b'678', b'9'])
+
+    @async_test
+    async def test_iter_chunks_missing_chunk(self):
+        await self.proxy.put(b'0123456789', chunk_size=4)
+        await get_db().fs.chunks.delete_one({'n': 1})
+        with self.assertRaises(gridfs.errors.CorruptGridFile):
+            [c async for c in self.proxy.iter_chunks()]
+
+    @async_test
+    async def test_iter_chunks_invalid_size(self):
+        for size in (0, -1):
+            with self.assertRaises(ValueError):
+                [c async for c in self.proxy.iter_chunks(chunk_size=size)]
+
+    @async_test
+    async def test_iter_chunks_no_file(self):
+        self.proxy.grid_id = ObjectId()
+        with self.assertRaises(gridfs.errors.NoFile):
+            [c async for c in self.proxy.iter_chunks()]
+
+    @async_test
+    async def test_read_range(self):
+        await self.proxy.put(b'0123456789', chunk_size=4)
+        self.assertEqual(await self.proxy.read_range(3, 9), b'345678')
+        self.assertEqual(await self.proxy.read_range(4, 8), b'4567')
+        self.assertEqual(await self.proxy.read_range(8), b'89')
+        self.assertEqual(await self.proxy.read_range(20, 30), b'')
+
+    @async_test
+    async def test_open_reader(self):
+        await self.proxy.put(b'0123456789', chunk_size=4)
+        reader = await self.proxy.open_reader(cache_chunks=2)
+        reader.seek(2)
+        self.assertEqual(await reader.read(3), b'234')
+        self.assertEqual(reader.tell(), 5)
+        reader.seek(-3, os.SEEK_END)
+        self.assertEqual(await reader.read(), b'789')
+
+    @async_test
+    async def test_open_reader_cache(self):
+        await self.proxy.put(b'0123456789', chunk_size=4)
+        reader = await self.proxy.open_reader(cache_chunks=2)
+        await reader.read(5)
+        with patch.object(self.proxy, '_iter_stored_chunks') as fetch:
+            reader.seek(1)
+            self.assertEqual(await reader.read(6), b'123456')
+        self.assertFalse(fetch.called)
+
+    @async_test
+    async def test_put_concurrency(self):
+        data = bytes(range(256)) * 10
+        await self.proxy.put(memoryview(data), concurrency=3, chunk_size=100,
+                             filename='f.bin')
+        self.assertEqual(await self.proxy.read(), data)
+        gridout = await self.proxy.get()
+        self.assertEqual(gridout.filename, 'f.bin')
+        self.assertEqual(gridout.length, len(data))
+
+    @async_test
+    async def test_put_concurrency_error(self):
+        data = b'x' * 1000
+
+        async def insert_one(doc, **kwargs):
+            raise OperationFailure('boom')
+
+        chunks = self.proxy._chunks
+        with patch.object(type(chunks), 'insert_one',
+                          side_effect=insert_one):
+            with self.assertRaises(OperationFailure):
+                await self.proxy.put(data, concurrency=2, chunk_size=100)
+
+        self.assertIsNone(self.proxy.grid_id)
+        self.assertEqual(await get_db().fs.files.count_documents({}), 0)
+
+    @async_test
+    async def test_write_concurrency(self):
+        self.proxy.new_file(concurrency=2, chunk_size=3)
+        await self.proxy.write(b'ab')
+        await self.proxy.write(b'cdefg')
+        # nothing is visible before closing the file
+        self.assertEqual(await get_db().fs.files.count_documents({}), 0)
+        await self.proxy.close()
+        chunks = [c async for c in self.proxy.iter_chunks()]
+        self.assertEqual(chunks, [b'abc', b'def', b'g'])
+
+    @async_test
+    async def test_stream_to(self):
+
+        class Writer:
+
+            def __init__(self):
+                self.data = b''
+                self.drained = 0
+
+            def write(self, data):
+                self.data += data
+
+            async def drain(self):
+                self.drained += 1
+
+        writer = Writer()
+        await self.proxy.put(b'0123456789', chunk_size=4)
+        written = await self.proxy.stream_to(writer)
+        self.assertEqual(written, 10)
+        self.assertEqual(writer.data, b'0123456789')
+        self.assertEqual(writer.drained, 3)
+
 
 class FileFieldTest(TestCase):
 
@@ -322,14 +445,20 @@ class FileFieldTest(TestCase):
         disconnect()
 
     def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache = FileCache(self.cache_dir.name, max_size=1024 ** 2)
 
         class TestFileDoc(Document):
             ff = FileField()
+            dedupe = FileField(dedupe=True)
+            compressed = FileField(compression='zlib')
+            cached = FileField(cache=self.cache)
 
         self.test_doc = TestFileDoc
 
     @async_test
     async def tearDown(self):
+        self.cache_dir.cleanup()
         await self.test_doc.drop_collection()
         db = self.test_doc._get_db()
         await db.fs.files.drop()
@@ -393,3 +522,155 @@ class FileFieldTest(TestCase):
         await doc.ff.put(fcontents)
         await doc.ff.replace(b'other content')
         self.assertEqual((await doc.ff.read()), b'other content')
+
+    @async_test
+    async def test_dedupe(self):
+        files = self.test_doc._get_db().fs.files
+        docs = [self.test_doc() for i in range(3)]
+        await docs[0].dedupe.put(b'same contents')
+        await docs[1].dedupe.put(io.BytesIO(b'same contents'))
+        docs[2].dedupe.new_file()
+        await docs[2].dedupe.write(b'same ')
+        await docs[2].dedupe.write(b'contents')
+        await docs[2].dedupe.close()
+
+        self.assertEqual(len({d.dedupe.grid_id for d in docs}), 1)
+        self.assertEqual(await files.count_documents({}), 1)
+        file_doc = await files.find_one({})
+        self.assertEqual(file_doc['refcount'], 3)
+
+    @async_test
+    async def test_dedupe_delete(self):
+        files = self.test_doc._get_db().fs.files
+        first, second = self.test_doc(), self.test_doc()
+        await first.dedupe.put(b'same contents')
+        await second.dedupe.put(b'same contents')
+
+        await first.dedupe.delete()
+        self.assertEqual(await second.dedupe.read(), b'same contents')
+
+        await second.dedupe.delete()
+        self.assertEqual(await files.count_documents({}), 0)
+
+    @async_test
+    async def test_dedupe_document_delete(self):
+        db = self.test_doc._get_db()
+        first, second = self.test_doc(), self.test_doc()
+        await first.dedupe.put(b'same contents')
+        await second.dedupe.put(b'same contents')
+        await first.save()
+        await second.save()
+
+        await first.delete()
+        file_doc = await db.fs.files.find_one({})
+        self.assertEqual(file_doc['refcount'], 1)
+
+        await second.delete()
+        self.assertEqual(await db.fs.files.count_documents({}), 0)
+        self.assertEqual(await db.fs.chunks.count_documents({}), 0)
+
+    @async_test
+    async def test_dedupe_file_deleted_while_inserting(self):
+        files = self.test_doc._get_db().fs.files
+        doc = self.test_doc()
+        insert_one = type(files).insert_one
+        calls = []
+
+        async def insert(coll, document, *args, **kwargs):
+            if 'sha256' in document:
+                calls.append(document)
+                if len(calls) == 1:
+                    # the file with the same contents was inserted and
+                    # then deleted by someone else.
+                    raise DuplicateKeyError('E11000 duplicate key')
+            return await insert_one(coll, document, *args, **kwargs)
+
+        with patch.object(type(files), 'insert_one', insert):
+            await doc.dedupe.put(b'same contents')
+
+        self.assertEqual(len(calls), 2)
+        file_doc = await files.find_one({'_id': doc.dedupe.grid_id})
+        self.assertEqual(file_doc['refcount'], 1)
+
+    @async_test
+    async def test_compression(self):
+        files = self.test_doc._get_db().fs.files
+        doc = self.test_doc()
+        contents = b'some compressible contents ' * 1000
+        await doc.compressed.put(contents, chunk_size=1024)
+
+        file_doc = await files.find_one({'_id': doc.compressed.grid_id})
+        self.assertEqual(file_doc['compression'], 'zlib')
+        self.assertEqual(file_doc['originalLength'], len(contents))
+        self.assertLess(file_doc['length'], len(contents))
+
+        self.assertEqual(await doc.compressed.read(), contents)
+        self.assertEqual(await doc.compressed.read_range(10, 20),
+                         contents[10:20])
+        chunks = [c async for c in doc.compressed.iter_chunks(1000)]
+        self.assertEqual(b''.join(chunks), contents)
+
+    @async_test
+    async def test_compression_write(self):
+        doc = self.test_doc()
+        doc.compressed.new_file()
+        await doc.compressed.write(b'some ')
+        await doc.compressed.write(b'contents')
+        await doc.compressed.close()
+        self.assertEqual(await doc.compressed.read_range(0), b'some contents')
+
+    @async_test
+    async def test_compression_read_size(self):
+        doc = self.test_doc()
+        contents = b'some compressible contents ' * 1000
+        await doc.compressed.put(contents, chunk_size=1024)
+
+        self.assertEqual(await doc.compressed.read(10), contents[:10])
+        self.assertEqual(await doc.compressed.read(10), contents[10:20])
+        self.assertEqual(await doc.compressed.read(), contents[20:])
+
+    @async_test
+    async def test_compression_reader_sequential(self):
+        doc = self.test_doc()
+        contents = os.urandom(30000)
+        await doc.compressed.put(contents, chunk_size=1024)
+
+        reader = await doc.compressed.open_reader()
+        with patch.object(type(doc.compressed), '_iter_contents',
+                          wraps=doc.compressed._iter_contents) as contents_:
+            parts = [await reader.read(5000) for i in range(6)]
+            self.assertEqual(b''.join(parts), contents)
+            self.assertEqual(contents_.call_count, 1)
+
+            reader.seek(10)
+            self.assertEqual(await reader.read(10), contents[10:20])
+            self.assertEqual(contents_.call_count, 2)
+        await reader.close()
+
+    @async_test
+    async def test_compression_codec_in_executor(self):
+        doc = self.test_doc()
+        contents = os.urandom(fields.CODEC_EXECUTOR_SIZE)
+        loop = asyncio.get_running_loop()
+        with patch.object(loop, 'run_in_executor',
+                          wraps=loop.run_in_executor) as run:
+            await doc.compressed.put(contents)
+            self.assertEqual(await doc.compressed.read_range(0), contents)
+        self.assertGreaterEqual(run.call_count, 2)
+
+    @async_test
+    async def test_read_buffer_cache(self):
+        doc = self.test_doc()
+        contents = b'some cached contents' * 100
+        await doc.cached.put(contents, concurrency=2, chunk_size=256)
+
+        self.assertEqual(bytes(await doc.cached.read_buffer()), contents)
+        self.assertEqual(self.cache.stats()['files'], 1)
+        with patch.object(type(doc.cached), '_get_file_doc') as get_doc:
+            buf = await doc.cached.read_buffer()
+        self.assertFalse(get_doc.called)
+        self.assertEqual(bytes(buf), contents)
+        self.assertEqual(await doc.cached.read(), contents)
+
+        await doc.cached.delete()
+        self.assertEqual(self.cache.stats()['files'], 0)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import datetime
+import os
+import tempfile
+from unittest import TestCase
+from mongomotor.filecache import FileCache, file_version
+from tests import async_test
+
+
+async def _chunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+class FileCacheTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = FileCache(self.tmpdir.name, max_size=10)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_file_version(self):
+        self.assertEqual(file_version({'md5': 'abc'}), 'abc')
+        date = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        self.assertEqual(file_version({'uploadDate': date}),
+                         '1735689600000000')
+
+    @async_test
+    async def test_put_get(self):
+        buf = await self.cache.put('a', 'v1', _chunks(b'abc', b'de'))
+        self.assertEqual(bytes(buf), b'abcde')
+        self.assertTrue(buf.readonly)
+
+        self.assertEqual(bytes(self.cache.get('a')), b'abcde')
+        self.assertEqual(bytes(self.cache.get('a', 'v1')), b'abcde')
+        self.assertIsNone(self.cache.get('a', 'v2'))
+        self.assertIsNone(self.cache.get('b'))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']),
+                         (2, 2, 5))
+
+    @async_test
+    async def test_put_new_version(self):
+        await self.cache.put('a', 'v1', _chunks(b'abc'))
+        await self.cache.put('a', 'v2', _chunks(b'xy'))
+        self.assertEqual(bytes(self.cache.get('a')), b'xy')
+        self.assertEqual(self.cache.size, 2)
+        [filename] = os.listdir(self.tmpdir.name)
+        self.assertTrue(filename.endswith('_v2'))
+
+    @async_test
+    async def test_evict_least_recently_used(self):
+        await self.cache.put('a', 'v', _chunks(b'aaaa'))
+        await self.cache.put('b', 'v', _chunks(b'bbbb'))
+        self.cache.get('a')
+        await self.cache.put('c', 'v', _chunks(b'cccc'))
+
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(bytes(self.cache.get('a')), b'aaaa')
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    @async_test
+    async def test_put_bigger_than_cache(self):
+        buf = await self.cache.put('a', 'v', _chunks(b'x' * 11))
+        self.assertEqual(bytes(buf), b'x' * 11)
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+    @async_test
+    async def test_put_concurrent(self):
+        fetched = []
+
+        async def chunks():
+            fetched.append(1)
+            await asyncio.sleep(0)
+            yield b'abc'
+
+        bufs = await asyncio.gather(*[self.cache.put('a', 'v', chunks())
+                                      for i in range(3)])
+        self.assertEqual([bytes(b) for b in bufs], [b'abc'] * 3)
+        self.assertEqual(len(fetched), 1)
+        self.assertEqual(self.cache.size, 3)
+        self.cache.remove('a')
+        self.assertEqual(self.cache.size, 0)
+
+    @async_test
+    async def test_unsafe_ids(self):
+        await self.cache.put('../a/b', '../v', _chunks(b'abc'))
+        self.assertEqual(bytes(self.cache.get('../a/b', '../v')), b'abc')
+        self.assertEqual(len(os.listdir(self.tmpdir.name)), 1)
+        self.assertFalse(os.path.exists(
+            os.path.join(os.path.dirname(self.tmpdir.name), 'a')))
+
+    @async_test
+    async def test_put_error(self):
+        async def broken():
+            yield b'abc'
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            await self.cache.put('a', 'v', broken())
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+        self.assertIsNone(self.cache.get('a'))
+
+    @async_test
+    async def test_empty_file(self):
+        await self.cache.put('a', 'v', _chunks())
+        self.assertEqual(bytes(self.cache.get('a')), b'')
+
+    @async_test
+    async def test_file_removed_by_someone_else(self):
+        await self.cache.put('a', 'v', _chunks(b'abc'))
+        [filename] = os.listdir(self.tmpdir.name)
+        os.remove(os.path.join(self.tmpdir.name, filename))
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.size, 0)
+
+    @async_test
+    async def test_load(self):
+        await self.cache.put('a', 'v', _chunks(b'abc'))
+        await self.cache.put('b', 'v', _chunks(b'de'))
+        with open(os.path.join(self.tmpdir.name, 'x.tmp'), 'wb') as fd:
+            fd.write(b'garbage')
+
+        cache = FileCache(self.tmpdir.name, max_size=10)
+        self.assertEqual(cache.size, 5)
+        self.assertEqual(bytes(cache.get('b', 'v')), b'de')
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tmpdir.name, 'x.tmp')))
+
+    @async_test
+    async def test_remove_and_clear(self):
+        await self.cache.put('a', 'v', _chunks(b'abc'))
+        await self.cache.put('b', 'v', _chunks(b'de'))
+        self.cache.remove('a')
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.clear()
+        self.assertEqual(self.cache.size, 0)
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
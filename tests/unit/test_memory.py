@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+import re
+from unittest import TestCase
+from pymongo import IndexModel, ReturnDocument
+from pymongo.errors import (BulkWriteError, DuplicateKeyError,
+                            OperationFailure, WriteError)
+from mongomotor import Document, connect, disconnect
+from mongomotor.fields import IntField, ListField, StringField
+from mongomotor.memory import MemoryClient
+from tests import async_test
+
+
+class MemoryCollectionTest(TestCase):
+
+    @async_test
+    async def setUp(self):
+        self.client = MemoryClient()
+        self.coll = self.client['db']['coll']
+        await self.coll.insert_many([
+            {'_id': 1, 'name': 'a', 'n': 3, 'tags': ['x', 'y']},
+            {'_id': 2, 'name': 'b', 'n': 1, 'tags': ['y'],
+             'sub': {'v': 10}},
+            {'_id': 3, 'name': 'c', 'n': 2, 'tags': [],
+             'items': [{'k': 'a', 'v': 1}, {'k': 'b', 'v': 2}]}])
+
+    async def _ids(self, *args, **kwargs):
+        docs = await self.coll.find(*args, **kwargs).to_list()
+        return [d['_id'] for d in docs]
+
+    @async_test
+    async def test_find_operators(self):
+        self.assertEqual(await self._ids({'n': {'$gte': 2}}), [1, 3])
+        self.assertEqual(await self._ids({'tags': 'y'}), [1, 2])
+        self.assertEqual(await self._ids({'tags': {'$size': 0}}), [3])
+        self.assertEqual(await self._ids({'sub.v': {'$exists': True}}), [2])
+        self.assertEqual(await self._ids({'name': re.compile('^[ab]')}),
+                         [1, 2])
+        self.assertEqual(await self._ids(
+            {'$or': [{'n': 1}, {'name': 'c'}]}), [2, 3])
+        self.assertEqual(await self._ids(
+            {'items': {'$elemMatch': {'k': 'b', 'v': {'$gt': 1}}}}), [3])
+        self.assertEqual(await self._ids({'_id': {'$in': [3, 1, 9]}}),
+                         [3, 1])
+
+    @async_test
+    async def test_find_sort_skip_limit_projection(self):
+        docs = await self.coll.find({}, {'name': 1, '_id': 0}).sort(
+            'n', -1).skip(1).limit(1).to_list()
+        self.assertEqual(docs, [{'name': 'c'}])
+
+    @async_test
+    async def test_find_returns_copies(self):
+        doc = await self.coll.find_one({'_id': 1})
+        doc['tags'].append('z')
+        doc = await self.coll.find_one({'_id': 1})
+        self.assertEqual(doc['tags'], ['x', 'y'])
+
+    @async_test
+    async def test_count_and_distinct(self):
+        self.assertEqual(await self.coll.count_documents({}, skip=1), 2)
+        self.assertEqual(await self.coll.distinct('tags'), ['x', 'y'])
+
+    @async_test
+    async def test_insert_duplicate_key(self):
+        with self.assertRaises(DuplicateKeyError):
+            await self.coll.insert_one({'_id': 1})
+
+        with self.assertRaises(BulkWriteError):
+            await self.coll.insert_many([{'_id': 4}, {'_id': 4}])
+
+    @async_test
+    async def test_unique_index(self):
+        await self.coll.create_indexes([IndexModel('name', unique=True)])
+        with self.assertRaises(DuplicateKeyError):
+            await self.coll.insert_one({'name': 'a'})
+
+    @async_test
+    async def test_update_operators(self):
+        r = await self.coll.update_one(
+            {'_id': 1}, {'$inc': {'n': 2}, '$push': {'tags': 'z'},
+                         '$set': {'sub.v': 1}, '$unset': {'name': 1}})
+        self.assertEqual(r.modified_count, 1)
+        doc = await self.coll.find_one({'_id': 1})
+        self.assertEqual(doc, {'_id': 1, 'n': 5, 'tags': ['x', 'y', 'z'],
+                               'sub': {'v': 1}})
+
+    @async_test
+    async def test_update_positional(self):
+        await self.coll.update_one({'items.k': 'b'},
+                                   {'$set': {'items.$.v': 20}})
+        await self.coll.update_many(
+            {}, {'$inc': {'items.$[i].v': 1}},
+            array_filters=[{'i.k': 'a'}])
+        doc = await self.coll.find_one({'_id': 3})
+        self.assertEqual(doc['items'], [{'k': 'a', 'v': 2},
+                                        {'k': 'b', 'v': 20}])
+
+    @async_test
+    async def test_update_id(self):
+        with self.assertRaises(WriteError):
+            await self.coll.update_one({'_id': 1}, {'$set': {'_id': 5}})
+
+    @async_test
+    async def test_upsert(self):
+        r = await self.coll.update_one(
+            {'name': 'd'}, {'$set': {'n': 4}, '$setOnInsert': {'new': True}},
+            upsert=True)
+        doc = await self.coll.find_one({'_id': r.upserted_id})
+        self.assertEqual(doc['name'], 'd')
+        self.assertTrue(doc['new'])
+
+    @async_test
+    async def test_delete(self):
+        r = await self.coll.delete_many({'n': {'$lt': 3}})
+        self.assertEqual(r.deleted_count, 2)
+        self.assertEqual(await self._ids({}), [1])
+
+    @async_test
+    async def test_find_one_and_update(self):
+        doc = await self.coll.find_one_and_update(
+            {}, {'$inc': {'n': 1}}, sort=[('n', 1)],
+            return_document=ReturnDocument.AFTER)
+        self.assertEqual((doc['_id'], doc['n']), (2, 2))
+
+    @async_test
+    async def test_aggregate(self):
+        cursor = await self.coll.aggregate([
+            {'$unwind': '$tags'},
+            {'$group': {'_id': '$tags', 'total': {'$sum': '$n'}}},
+            {'$sort': {'_id': 1}}])
+        self.assertEqual(await cursor.to_list(None),
+                         [{'_id': 'x', 'total': 3}, {'_id': 'y', 'total': 4}])
+
+    @async_test
+    async def test_aggregate_omits_missing_fields(self):
+        cursor = await self.coll.aggregate([
+            {'$group': {'_id': {'v': '$sub.v'}, 'n': {'$sum': 1}}},
+            {'$project': {'_id': 0, 'v': '$_id.v', 'n': 1}},
+            {'$sort': {'n': 1}}])
+        self.assertEqual(await cursor.to_list(None),
+                         [{'v': 10, 'n': 1}, {'n': 2}])
+
+    @async_test
+    async def test_unsupported(self):
+        with self.assertRaises(OperationFailure):
+            await self.coll.find({'$where': 'true'}).to_list()
+
+    @async_test
+    async def test_explain(self):
+        await self.coll.create_index('name')
+        plan = (await self.coll.find({'name': 'a'}).explain())[
+            'queryPlanner']['winningPlan']
+        self.assertEqual(plan['inputStage']['indexName'], 'name_1')
+
+
+class MemoryBackendTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        connect('mongomotor-test', backend='memory')
+
+    @classmethod
+    def tearDownClass(cls):
+        disconnect()
+
+    def setUp(self):
+        class MemDoc(Document):
+            name = StringField()
+            n = IntField()
+            tags = ListField(StringField())
+
+        self.doc = MemDoc
+
+    @async_test
+    async def tearDown(self):
+        await self.doc.drop_collection()
+
+    @async_test
+    async def test_queryset(self):
+        await self.doc.objects.insert(
+            [self.doc(name='a', n=1, tags=['x']),
+             self.doc(name='b', n=2, tags=['x', 'y'])])
+        await self.doc.objects(name='a').update(push__tags='z', inc__n=1)
+
+        doc = await self.doc.objects.get(name='a')
+        self.assertEqual((doc.n, doc.tags), (2, ['x', 'z']))
+        self.assertEqual(await self.doc.objects(tags='x').count(), 2)
+        self.assertEqual(await self.doc.objects.sum('n'), 4)
+        self.assertEqual(sorted(await self.doc.objects.distinct('tags')),
+                         ['x', 'y', 'z'])
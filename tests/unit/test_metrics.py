@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from mongomotor import metrics
+
+
+class CountersTest(TestCase):
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_incr(self):
+        metrics.incr('some.counter')
+        metrics.incr('some.counter', 2)
+        self.assertEqual(metrics.get_counter('some.counter'), 3)
+
+    def test_get_counter_missing(self):
+        self.assertEqual(metrics.get_counter('missing'), 0)
+
+    def test_get_counters(self):
+        metrics.incr('some.counter')
+        metrics.incr('other.counter')
+        self.assertEqual(metrics.get_counters('some.'), {'some.counter': 1})
+
+    def test_reset(self):
+        metrics.incr('some.counter')
+        metrics.incr('other.counter')
+        metrics.reset('some.')
+        self.assertEqual(metrics.get_counters(), {'other.counter': 1})
+
+
+class HistogramTest(TestCase):
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_observe(self):
+        for v in (1, 3, 7, 100):
+            metrics.observe('some.histogram', v)
+
+        h = metrics.get_histogram('some.histogram').as_dict()
+        self.assertEqual(h['count'], 4)
+        self.assertEqual(h['sum'], 111)
+        self.assertEqual(h['min'], 1)
+        self.assertEqual(h['max'], 100)
+        self.assertEqual(h['p50'], 5)
+        self.assertEqual(h['p99'], 100)
+
+    def test_percentile_empty(self):
+        self.assertIsNone(metrics.Histogram().percentile(50))
+
+    def test_percentile_greater_than_buckets(self):
+        h = metrics.Histogram(buckets=(1, 2))
+        h.observe(10)
+        self.assertEqual(h.percentile(50), 10)
+
+    def test_reset_histograms(self):
+        metrics.observe('some.histogram', 1)
+        metrics.observe('other.histogram', 1)
+        metrics.reset('some.')
+        self.assertEqual(list(metrics.get_histograms()), ['other.histogram'])
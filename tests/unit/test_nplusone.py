@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from unittest.mock import AsyncMock, patch
+from bson import ObjectId
+from mongomotor import Document, nplusone
+from mongomotor.exceptions import NPlusOneError, NPlusOneWarning
+from mongomotor.fields import ReferenceField, StringField
+from tests import async_test
+
+
+class NPlusOneTest(TestCase):
+
+    def setUp(self):
+        class Author(Document):
+            name = StringField()
+
+        class Post(Document):
+            author = ReferenceField(Author, dbref=True)
+
+        self.author_doc = Author
+        self.post_doc = Post
+        self.posts = [Post._from_son({'_id': ObjectId(),
+                                      'author': author.to_dbref()})
+                      for author in [Author(id=ObjectId()) for i in range(3)]]
+        patcher = patch.object(ReferenceField, '_lazy_load_ref',
+                               AsyncMock(side_effect=lambda cls, ref: cls(
+                                   id=ref.id)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def _load_authors(self):
+        for post in self.posts:
+            await post.author
+
+    @async_test
+    async def test_detect_warns(self):
+        with nplusone.detect(threshold=2) as scope:
+            with self.assertWarns(NPlusOneWarning) as cm:
+                await self._load_authors()
+
+        self.assertEqual(scope.counts, {('Post', 'author'): 3})
+        self.assertIn('test_nplusone.py', str(cm.warning))
+
+    @async_test
+    async def test_detect_raises(self):
+        with nplusone.detect(threshold=2, raise_error=True):
+            with self.assertRaises(NPlusOneError):
+                await self._load_authors()
+
+    @async_test
+    async def test_detect_below_threshold(self):
+        with nplusone.detect(threshold=3) as scope:
+            await self._load_authors()
+
+        self.assertEqual(scope.reported, {})
+
+    @async_test
+    async def test_detect_not_sampled(self):
+        with patch.object(nplusone.random, 'random', return_value=0.9):
+            with nplusone.detect(threshold=1, sample_rate=0.5) as scope:
+                await self._load_authors()
+
+        self.assertIsNone(scope)
+
+    @async_test
+    async def test_no_detect(self):
+        await self._load_authors()
+        self.assertIsNone(nplusone._scope.get())
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+from unittest import TestCase
+from unittest.mock import MagicMock, Mock
+import bson
+from mongomotor import Document, profiler
+from mongomotor.fields import StringField
+from mongomotor.queryset import QuerySet
+from tests import async_test
+
+
+class FakeListCursor:
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return self.docs
+
+
+class Profiled:
+
+    @profiler.profiled('slow')
+    async def slow(self):
+        await asyncio.sleep(0.02)
+        profiler.add_docs([{'a': 1}])
+        return 1
+
+    @profiler.profiled('outer')
+    async def outer(self):
+        return await self.slow()
+
+
+class NormalizeQueryTest(TestCase):
+
+    def test_normalize_query(self):
+        query = {'a': 1, 'b': {'$in': [1, 2]},
+                 '$or': [{'c': 'x'}, {'d': {'$gt': 2}}]}
+        self.assertEqual(profiler.normalize_query(query),
+                         {'a': '?', 'b': {'$in': '?'},
+                          '$or': [{'c': '?'}, {'d': {'$gt': '?'}}]})
+
+
+class ProfilerTest(TestCase):
+
+    def setUp(self):
+        profiler.enable(slow_ms=10)
+
+    def tearDown(self):
+        profiler.disable()
+        profiler.reset()
+
+    @async_test
+    async def test_profiled(self):
+        await Profiled().slow()
+        profile = profiler.get_profile('Profiled.slow.')
+        self.assertEqual(profile['Profiled.slow.docs']['sum'], 1)
+        self.assertNotIn('Profiled.slow.bytes', profile)
+        self.assertGreaterEqual(
+            profile['Profiled.slow.duration_ms']['min'], 10)
+
+    @async_test
+    async def test_profiled_disabled(self):
+        profiler.disable()
+        await Profiled().slow()
+        self.assertEqual(profiler.get_profile(), {})
+
+    @async_test
+    async def test_profiled_nested(self):
+        await Profiled().outer()
+        profile = profiler.get_profile()
+        self.assertEqual(profile['Profiled.outer.docs']['sum'], 1)
+        self.assertNotIn('Profiled.slow.docs', profile)
+
+    @async_test
+    async def test_profiled_count_bytes(self):
+        profiler.enable(slow_ms=10, count_bytes=True)
+        await Profiled().slow()
+        profile = profiler.get_profile('Profiled.slow.')
+        self.assertEqual(profile['Profiled.slow.bytes']['sum'],
+                         len(bson.encode({'a': 1})))
+
+    @async_test
+    async def test_slow_query(self):
+        on_slow = Mock()
+        profiler.enable(slow_ms=10, on_slow=on_slow)
+        with self.assertLogs('mongomotor.profiler', 'WARNING'):
+            await Profiled().slow()
+
+        slow = profiler.get_slow_queries()
+        self.assertEqual(len(slow), 1)
+        self.assertEqual(slow[0]['operation'], 'slow')
+        self.assertTrue(on_slow.called)
+
+    @async_test
+    async def test_not_slow_query(self):
+        profiler.enable(slow_ms=1000)
+        await Profiled().slow()
+        self.assertEqual(profiler.get_slow_queries(), [])
+
+    @async_test
+    async def test_queryset_to_list(self):
+        class ProfiledDoc(Document):
+            a = StringField()
+
+        collection = MagicMock()
+        collection.find.return_value = FakeListCursor([{'_id': 1, 'a': 'x'}])
+        qs = QuerySet(ProfiledDoc, collection).filter(a='x')
+        profiler.enable(slow_ms=0)
+        await qs.to_list()
+
+        profile = profiler.get_profile('ProfiledDoc.to_list.')
+        self.assertEqual(profile['ProfiledDoc.to_list.docs']['sum'], 1)
+        self.assertEqual(profiler.get_slow_queries()[0]['shape'],
+                         {'a': '?'})
@@ -18,14 +18,19 @@
 # along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
 
 import asyncio
+from collections import namedtuple
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import patch, AsyncMock, MagicMock, Mock
+from bson import ObjectId
 import mongoengine
-from mongomotor import Document, disconnect
+from mongoengine.errors import OperationError
+from mongomotor import Document, connection, disconnect, metrics
+from mongomotor.connection import get_connection
 from mongomotor.dereference import MongoMotorDeReference
 from mongomotor.fields import StringField, ListField, IntField, ReferenceField
 from mongomotor import queryset
 from mongomotor.queryset import (QuerySet, Code)
+from pymongo.read_preferences import ReadPreference
 from tests import async_test, connect2db
 
 
@@ -235,6 +240,54 @@ class QuerySetTest(TestCase):
             await SomeRef.drop_collection()
             await SomeDoc.drop_collection()
 
+    @patch.object(queryset, 'TEST_ENV', True)
+    @async_test
+    async def test_delete_with_rule_deny(self):
+        try:
+            class SomeRef(Document):
+                pass
+
+            class SomeDoc(Document):
+                ref = ReferenceField(
+                    SomeRef, reverse_delete_rule=mongoengine.DENY)
+
+            r = SomeRef()
+            await r.save()
+            d = SomeDoc(ref=r)
+            await d.save()
+            with self.assertRaises(mongoengine.errors.OperationError):
+                await SomeRef.objects.delete()
+
+            self.assertEqual(await SomeRef.objects.count(), 1)
+        finally:
+            queryset._delete_futures = []
+            await SomeRef.drop_collection()
+            await SomeDoc.drop_collection()
+
+    @patch.object(queryset, 'TEST_ENV', True)
+    @patch.object(queryset, 'DELETE_RULES_BATCH_SIZE', 2)
+    @async_test
+    async def test_delete_with_rule_cascade_batches(self):
+        try:
+            class SomeRef(Document):
+                pass
+
+            class SomeDoc(Document):
+                ref = ReferenceField(
+                    SomeRef, reverse_delete_rule=mongoengine.CASCADE)
+
+            for i in range(5):
+                r = SomeRef()
+                await r.save()
+                await SomeDoc(ref=r).save()
+
+            await SomeRef.objects.delete()
+            self.assertEqual(await SomeDoc.objects.count(), 0)
+        finally:
+            queryset._delete_futures = []
+            await SomeRef.drop_collection()
+            await SomeDoc.drop_collection()
+
     @async_test
     async def test_iterate_over_queryset(self):
         """Ensure that we can iterate over the queryset using
@@ -257,6 +310,43 @@ class QuerySetTest(TestCase):
 
         self.assertEqual(c, 5)
 
+    @async_test
+    async def test_fetch_next(self):
+        await self.test_doc(a='a').save()
+
+        qs = self.test_doc.objects.all()
+        docs = []
+        while await qs.fetch_next:
+            docs.append(qs.next_object())
+
+        self.assertEqual([d.a for d in docs], ['a'])
+        self.assertIsNone(qs.next_object())
+
+    @async_test
+    async def test_iteration_admission(self):
+        for i in range(3):
+            await self.test_doc(a=str(i)).save()
+
+        connection.set_concurrency_limit('default', 1)
+        try:
+            docs = [d async for d in self.test_doc.objects.all()]
+            stats = connection.get_concurrency_stats('default')
+        finally:
+            connection.set_concurrency_limit('default', None)
+
+        self.assertEqual(len(docs), 3)
+        self.assertGreaterEqual(stats['acquired'], 1)
+        self.assertEqual(stats['in_flight'], 0)
+
+    def test_alias_from_collection(self):
+        db = get_connection()['mongomotor-test-other']
+        qs = QuerySet(self.test_doc, db[self.test_doc._get_collection_name()])
+        with patch.dict(mongoengine.connection._dbs, {'other': db}):
+            self.assertEqual(qs._alias, 'other')
+            self.assertEqual(qs.filter(a='a')._alias, 'other')
+
+        self.assertEqual(self.test_doc.objects._alias, 'default')
+
     @async_test
     async def test_count_queryset(self):
         for i in range(5):
@@ -544,6 +634,43 @@ class QuerySetTest(TestCase):
 
         self.assertEqual(returned, expected)
 
+    @async_test
+    async def test_aggregate_as_document(self):
+        await self.test_doc.objects.insert(
+            [self.test_doc(a='a', docint=1), self.test_doc(a='b', docint=2)])
+
+        results = await self.test_doc.objects.order_by('a').aggregate(
+            [{'$set': {'docint': {'$multiply': ['$docint', 10]}}}],
+            as_document=self.test_doc, batch_size=1)
+        docs = [d async for d in results]
+        self.assertTrue(all(isinstance(d, self.test_doc) for d in docs))
+        self.assertEqual([(d.a, d.docint) for d in docs],
+                         [('a', 10), ('b', 20)])
+
+    @async_test
+    async def test_aggregate_as_namedtuple(self):
+        await self.test_doc.objects.insert(
+            [self.test_doc(a='a', docint=1), self.test_doc(a='a', docint=2),
+             self.test_doc(a='b', docint=3)])
+        pipeline = [{'$group': {'_id': '$a', 'total': {'$sum': '$docint'}}},
+                    {'$sort': {'_id': 1}}]
+
+        rows = await (await self.test_doc.objects.aggregate(
+            pipeline, as_namedtuple=True)).to_list()
+        self.assertEqual([(r.id, r.total) for r in rows],
+                         [('a', 3), ('b', 3)])
+
+        Total = namedtuple('Total', ['id', 'total', 'other'])
+        rows = await (await self.test_doc.objects.aggregate(
+            pipeline, as_namedtuple=Total)).to_list()
+        self.assertEqual(rows, [Total('a', 3, None), Total('b', 3, None)])
+
+    @async_test
+    async def test_aggregate_as_document_and_namedtuple(self):
+        with self.assertRaises(TypeError):
+            await self.test_doc.objects.aggregate(
+                [], as_document=self.test_doc, as_namedtuple=True)
+
     @async_test
     async def test_sum(self):
         for i in range(5):
@@ -553,6 +680,62 @@ class QuerySetTest(TestCase):
         soma = await self.test_doc.objects.sum('docint')
         self.assertEqual(soma, 10)
 
+    @async_test
+    async def test_sum_average_frequencies_queryset_state(self):
+        await self.test_doc.objects.insert(
+            [self.test_doc(docint=i, lf=[str(i)]) for i in range(5)])
+        qs = self.test_doc.objects.order_by('-docint')
+
+        self.assertEqual(await qs.skip(1).limit(2).sum('docint'), 5)
+        self.assertEqual(await qs.limit(2).average('docint'), 3.5)
+        self.assertEqual(await qs.limit(2).item_frequencies('lf'),
+                         {'4': 1, '3': 1})
+        self.assertEqual(await qs.none().sum('docint'), 0)
+        self.assertEqual(await qs.none().item_frequencies('lf'), {})
+
+    @async_test
+    async def test_stats(self):
+        await self.test_doc.objects.insert(
+            [self.test_doc(a='a', docint=1, lf=['x', 'y']),
+             self.test_doc(a='b', docint=2, lf=['x']),
+             self.test_doc(a='b', docint=6, lf=[])])
+
+        stats = await self.test_doc.objects.stats(
+            sum='docint', avg=['docint'], min='docint', max='docint',
+            freq=['a', 'lf'])
+        self.assertEqual(stats, queryset.QueryStats(
+            count=3, sum={'docint': 9}, avg={'docint': 3},
+            min={'docint': 1}, max={'docint': 6},
+            freq={'a': {'a': 1, 'b': 2}, 'lf': {'x': 2, 'y': 1}}))
+
+        stats = await self.test_doc.objects.filter(a='b').stats(
+            count=False, sum=['docint'])
+        self.assertIsNone(stats.count)
+        self.assertEqual(stats.sum, {'docint': 8})
+
+    @async_test
+    async def test_stats_empty(self):
+        stats = await self.test_doc.objects.none().stats(
+            sum='docint', avg='docint', max='docint', freq='lf')
+        self.assertEqual(stats, queryset.QueryStats(
+            count=0, sum={'docint': 0}, avg={'docint': 0}, min={},
+            max={'docint': None}, freq={'lf': {}}))
+
+    def test_get_aggregation_args(self):
+        qs = self.test_doc.objects.filter(a='a').order_by('a').hint(
+            [('a', 1)]).collation({'locale': 'en'})
+
+        pipeline, kwargs = qs._get_aggregation_args([], {}, ordered=False)
+        self.assertEqual(pipeline, [{'$match': {'a': 'a'}}])
+        self.assertEqual(kwargs, {'hint': [('a', 1)],
+                                  'collation': {'locale': 'en'}})
+
+        pipeline, kwargs = qs.limit(1)._get_aggregation_args(
+            [], {'hint': 'a_1'}, ordered=False)
+        self.assertEqual(pipeline, [{'$match': {'a': 'a'}},
+                                    {'$sort': {'a': 1}}, {'$limit': 1}])
+        self.assertEqual(kwargs['hint'], 'a_1')
+
     @async_test
     async def test_distinct(self):
         d = self.test_doc(a='a')
@@ -683,3 +866,542 @@ class QuerySetTest(TestCase):
     # async def test_explain(self):
     #     plan = await self.test_doc.objects.explain()
     #     self.assertFalse(isinstance(plan, asyncio.futures.Future))
+
+
+class QuerySetReadPreferenceTest(TestCase):
+
+    def setUp(self):
+        class ReadPrefDoc(Document):
+            a = StringField()
+
+            meta = {'read_preference': {'mode': 'secondaryPreferred',
+                                        'max_staleness': 90}}
+
+        class OtherReadPrefDoc(Document):
+            a = StringField()
+
+        self.test_doc = ReadPrefDoc
+        self.other_doc = OtherReadPrefDoc
+
+    def test_meta_read_preference(self):
+        qs = QuerySet(self.test_doc, Mock())
+        self.assertEqual(qs._read_preference.mongos_mode,
+                         'secondaryPreferred')
+        self.assertEqual(qs._read_preference.max_staleness, 90)
+
+    def test_without_read_preference(self):
+        collection = Mock()
+        qs = QuerySet(self.other_doc, collection)
+        self.assertIsNone(qs._read_preference)
+        self.assertIs(qs._read_collection, collection)
+
+    def test_read_preference_with_tags(self):
+        qs = QuerySet(self.other_doc, Mock())
+        qs = qs.read_preference('secondary', tag_sets=[{'dc': 'ny'}])
+        self.assertEqual(qs._read_preference.tag_sets, [{'dc': 'ny'}])
+        self.assertEqual(qs.clone()._read_preference.tag_sets,
+                         [{'dc': 'ny'}])
+
+    def test_read_collection(self):
+        collection = Mock()
+        qs = QuerySet(self.other_doc, collection)
+        qs = qs.read_preference(ReadPreference.SECONDARY)
+        qs._read_collection
+        kw = collection.with_options.call_args[1]
+        self.assertIs(kw['read_preference'], ReadPreference.SECONDARY)
+
+    @async_test
+    async def test_count_uses_read_preference(self):
+        collection = Mock()
+        read_collection = collection.with_options.return_value
+
+        async def count_documents(*a, **kw):
+            return 3
+
+        read_collection.count_documents = count_documents
+        qs = QuerySet(self.test_doc, collection)
+        self.assertEqual(await qs.count(), 3)
+
+
+class HedgedQuerySet(QuerySet):
+
+    main_delay = 0
+
+    async def slow_read(self, fail_main=False):
+        if self._read_preference is None:
+            await asyncio.sleep(self.main_delay)
+            if fail_main:
+                raise Exception('main failed')
+            return 'main'
+        return 'hedge'
+
+
+class QuerySetHedgedTest(TestCase):
+
+    def setUp(self):
+        class HedgedDoc(Document):
+            a = StringField()
+
+        self.test_doc = HedgedDoc
+        metrics.reset('hedge.')
+
+    def tearDown(self):
+        HedgedQuerySet.main_delay = 0
+
+    def test_hedged(self):
+        qs = QuerySet(self.test_doc, Mock()).hedged(after_ms=10)
+        self.assertEqual(qs._hedge_after_ms, 10)
+        self.assertEqual(qs.clone()._hedge_after_ms, 10)
+
+    def test_hedged_negative(self):
+        with self.assertRaises(ValueError):
+            QuerySet(self.test_doc, Mock()).hedged(after_ms=-1)
+
+    def test_get_hedge_read_preference(self):
+        qs = QuerySet(self.test_doc, Mock())
+        self.assertIs(qs._get_hedge_read_preference(),
+                      ReadPreference.SECONDARY_PREFERRED)
+        qs = qs.read_preference(ReadPreference.SECONDARY)
+        self.assertIs(qs._get_hedge_read_preference(),
+                      ReadPreference.NEAREST)
+
+    @async_test
+    async def test_hedged_read_fast(self):
+        qs = HedgedQuerySet(self.test_doc, Mock()).hedged(after_ms=100)
+        r = await qs._hedged_read('slow_read')
+        self.assertEqual(r, 'main')
+        stats = queryset.get_hedge_stats()
+        self.assertEqual(stats['reads'], 1)
+        self.assertEqual(stats['hedged'], 0)
+
+    @async_test
+    async def test_hedged_read_slow(self):
+        HedgedQuerySet.main_delay = 1
+        qs = HedgedQuerySet(self.test_doc, Mock()).hedged(after_ms=1)
+        r = await qs._hedged_read('slow_read')
+        self.assertEqual(r, 'hedge')
+        stats = queryset.get_hedge_stats()
+        self.assertEqual(stats['hedged'], 1)
+        self.assertEqual(stats['hedge_wins'], 1)
+        self.assertEqual(stats['hedge_rate'], 1.0)
+
+    @async_test
+    async def test_hedged_read_main_fails(self):
+        qs = HedgedQuerySet(self.test_doc, Mock()).hedged(after_ms=100)
+        with self.assertRaises(Exception):
+            await qs._hedged_read('slow_read', fail_main=True)
+
+
+class FakeCursor:
+
+    def __init__(self, docs=None):
+        self.docs = docs or []
+        self._iter = iter(self.docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class QuerySetShardKeyTest(TestCase):
+
+    def setUp(self):
+        class ShardedDoc(Document):
+            a = StringField()
+            region = StringField(db_field='r')
+
+            meta = {'shard_key': ('region',)}
+
+        self.test_doc = ShardedDoc
+        metrics.reset('scatter_gather.')
+
+    def test_get_shard_key_fields(self):
+        qs = QuerySet(self.test_doc, Mock())
+        self.assertEqual(qs._get_shard_key_fields(), ['r'])
+
+    def test_get_shard_key_query(self):
+        qs = QuerySet(self.test_doc, Mock())
+        query = {'$and': [{'r': 'br'}, {'a': 'x'}]}
+        self.assertEqual(qs._get_shard_key_query(query), {'r': 'br'})
+
+    def test_get_shard_key_query_range(self):
+        qs = QuerySet(self.test_doc, Mock())
+        query = {'r': {'$gt': 'br'}}
+        self.assertEqual(qs._get_shard_key_query(query), {})
+
+    def test_check_shard_key_without_key(self):
+        qs = QuerySet(self.test_doc, Mock())
+        with self.assertWarns(queryset.ScatterGatherWarning):
+            qs._check_shard_key({'a': 'x'})
+
+        self.assertEqual(queryset.get_scatter_gather_stats(),
+                         {'ShardedDoc': 1})
+
+    def test_check_shard_key_with_key(self):
+        qs = QuerySet(self.test_doc, Mock())
+        qs._check_shard_key({'r': {'$in': ['br', 'us']}})
+        self.assertEqual(queryset.get_scatter_gather_stats(), {})
+
+    @async_test
+    async def test_in_bulk_with_shard_key(self):
+        collection = Mock()
+        collection.find.return_value = FakeCursor()
+        qs = QuerySet(self.test_doc, collection).filter(region='br')
+        await qs.in_bulk([1, 2])
+
+        query = collection.find.call_args[0][0]
+        self.assertEqual(query, {'_id': {'$in': [1, 2]}, 'r': 'br'})
+
+    @async_test
+    async def test_scatter_gather_warning_call_site(self):
+        collection = Mock()
+        collection.find.return_value = FakeCursor()
+        qs = QuerySet(self.test_doc, collection)
+        with self.assertWarns(queryset.ScatterGatherWarning) as cm:
+            await qs.in_bulk([1, 2])
+
+        self.assertEqual(cm.filename, __file__)
+
+    @async_test
+    async def test_in_bulk_with_id_shard_key(self):
+        class IdShardedDoc(Document):
+            a = StringField()
+
+            meta = {'shard_key': ('id',)}
+
+        ids = [ObjectId() for i in range(3)]
+        collection = Mock()
+        collection.find.return_value = FakeCursor()
+        qs = QuerySet(IdShardedDoc, collection).filter(id__in=ids[:2])
+        await qs.in_bulk(ids[1:])
+
+        query = collection.find.call_args[0][0]
+        self.assertEqual(query, {'$and': [{'_id': {'$in': ids[:2]}},
+                                          {'_id': {'$in': ids[1:]}}]})
+        self.assertEqual(queryset.get_scatter_gather_stats(), {})
+
+
+class FakeIdsCursor:
+
+    def __init__(self, ids):
+        self.ids = list(ids)
+        self.closed = False
+        self._skip = 0
+        self._limit = None
+
+    def batch_size(self, batch_size):
+        return self
+
+    def sort(self, sort):
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def skip(self, skip):
+        self._skip = skip
+        return self
+
+    async def to_list(self, length):
+        if self._skip or self._limit:
+            end = self._skip + self._limit if self._limit else None
+            self.ids = self.ids[self._skip:end]
+            self._skip = self._limit = None
+        batch, self.ids = self.ids[:length], self.ids[length:]
+        return [{'_id': i} for i in batch]
+
+    async def close(self):
+        self.closed = True
+
+
+class QuerySetDeleteRulesTest(TestCase):
+
+    def setUp(self):
+        class RefDoc(Document):
+            pass
+
+        class AbstractRefDoc(Document):
+            meta = {'abstract': True}
+
+        class RefererDoc(Document):
+            ref = ReferenceField(RefDoc, reverse_delete_rule=mongoengine.DENY)
+            refs = ListField(ReferenceField(
+                RefDoc, dbref=True, reverse_delete_rule=mongoengine.PULL),
+                db_field='rs')
+            abstract_ref = ReferenceField(AbstractRefDoc)
+
+        self.ref_doc = RefDoc
+        self.referer_doc = RefererDoc
+
+    @patch.object(queryset, 'DELETE_RULES_BATCH_SIZE', 2)
+    @async_test
+    async def test_iter_ids(self):
+        collection = Mock()
+        cursor = FakeIdsCursor(range(5))
+        collection.find.return_value = cursor
+        qs = QuerySet(self.ref_doc, collection)
+
+        batches = [ids async for ids in qs._iter_ids(qs)]
+
+        self.assertEqual(batches, [[0, 1], [2, 3], [4]])
+        self.assertEqual(collection.find.call_args[1]['projection'],
+                         {'_id': 1})
+        self.assertTrue(cursor.closed)
+
+    def test_get_delete_rules(self):
+        qs = QuerySet(self.ref_doc, Mock())
+        rules = qs._get_delete_rules(self.ref_doc)
+        self.assertEqual(
+            sorted(rules, key=lambda r: r[1]),
+            [(self.referer_doc, 'ref', mongoengine.DENY),
+             (self.referer_doc, 'refs', mongoengine.PULL)])
+
+    def test_get_refs_query(self):
+        qs = QuerySet(self.ref_doc, Mock())
+        query = qs._get_refs_query(self.referer_doc, 'ref', [1])
+        self.assertEqual(query, {'ref': {'$in': [1]}})
+
+    def test_get_refs_query_dbref(self):
+        qs = QuerySet(self.ref_doc, Mock())
+        query = qs._get_refs_query(self.referer_doc, 'refs', [1])
+        self.assertEqual(query, {'rs.$id': {'$in': [1]}})
+
+    def test_get_ref_values_dbref(self):
+        qs = QuerySet(self.ref_doc, Mock())
+        oid = ObjectId()
+        values = qs._get_ref_values(self.referer_doc, 'refs', [oid])
+        self.assertEqual(values[0].id, oid)
+        self.assertEqual(values[0].collection, 'ref_doc')
+
+    def test_get_ref_values_abstract(self):
+        qs = QuerySet(self.ref_doc, Mock())
+        values = qs._get_ref_values(self.referer_doc, 'abstract_ref', [1])
+        self.assertEqual(values[0].as_doc()['cls'], 'RefDoc')
+
+
+class QuerySetDocumentDeleteTest(TestCase):
+
+    def setUp(self):
+        class DeleteDoc(Document):
+            a = StringField()
+
+        self.test_doc = DeleteDoc
+
+    @patch.object(queryset, 'DELETE_BATCH_SIZE', 2)
+    @async_test
+    async def test_delete_with_limit_in_batches(self):
+        collection = Mock()
+        collection.find.return_value = FakeIdsCursor(range(10))
+        collection.delete_many = AsyncMock(
+            side_effect=lambda q: Mock(deleted_count=len(q['_id']['$in'])))
+        qs = QuerySet(self.test_doc, collection).skip(2).limit(5)
+
+        r = await qs.delete()
+
+        self.assertEqual(r, 5)
+        queries = [c[0][0] for c in collection.delete_many.call_args_list]
+        self.assertEqual(queries, [{'_id': {'$in': [2, 3]}},
+                                   {'_id': {'$in': [4, 5]}},
+                                   {'_id': {'$in': [6]}}])
+
+    @async_test
+    async def test_document_delete_concurrency(self):
+        running = []
+        max_running = []
+
+        async def delete(doc, **kw):
+            running.append(doc)
+            max_running.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(doc)
+
+        docs = [{'_id': ObjectId(), 'a': str(i)} for i in range(6)]
+        collection = Mock()
+        collection.find.return_value = FakeCursor(docs)
+        qs = QuerySet(self.test_doc, collection)
+
+        with patch.object(self.test_doc, 'delete', delete):
+            r = await qs._document_delete(qs, {}, concurrency=3)
+
+        self.assertEqual(r, 6)
+        self.assertEqual(max(max_running), 3)
+
+    @async_test
+    async def test_document_delete_concurrency_error(self):
+        async def delete(doc, **kw):
+            raise OperationError('bad')
+
+        docs = [{'_id': ObjectId(), 'a': str(i)} for i in range(6)]
+        collection = Mock()
+        collection.find.return_value = FakeCursor(docs)
+        qs = QuerySet(self.test_doc, collection)
+
+        with patch.object(self.test_doc, 'delete', delete):
+            with self.assertRaises(OperationError):
+                await qs._document_delete(qs, {}, concurrency=2)
+
+    @async_test
+    async def test_document_delete_concurrency_last_error(self):
+        class SlowCursor(FakeCursor):
+
+            async def __anext__(self):
+                # lets the delete of the last document fail before the
+                # end of the cursor.
+                await asyncio.sleep(0.01)
+                return await super().__anext__()
+
+        docs = [{'_id': ObjectId(), 'a': str(i)} for i in range(5)]
+        deleted = []
+
+        async def delete(doc, **kw):
+            if doc.a == '4':
+                raise OperationError('bad')
+            deleted.append(doc)
+
+        collection = Mock()
+        collection.find.return_value = SlowCursor(docs)
+        qs = QuerySet(self.test_doc, collection)
+
+        with patch.object(self.test_doc, 'delete', delete):
+            with self.assertRaises(OperationError):
+                await qs._document_delete(qs, {}, concurrency=2)
+        self.assertEqual(len(deleted), 4)
+
+    @async_test
+    async def test_document_delete_concurrency_count(self):
+        async def delete(doc, **kw):
+            pass
+
+        docs = [{'_id': ObjectId(), 'a': str(i)} for i in range(5)]
+        collection = Mock()
+        collection.find.return_value = FakeCursor(docs)
+        qs = QuerySet(self.test_doc, collection)
+
+        with patch.object(self.test_doc, 'delete', delete):
+            r = await qs._document_delete(qs, {}, concurrency=2)
+        self.assertEqual(r, 5)
+
+
+class QuerySetChunkedWriteTest(TestCase):
+
+    def setUp(self):
+        class ChunkedDoc(Document):
+            a = StringField()
+
+        self.test_doc = ChunkedDoc
+        self.collection = MagicMock()
+        self.ids = sorted(ObjectId() for i in range(5))
+        self.collection.find.side_effect = [
+            FakeIdsCursor(self.ids[:2]), FakeIdsCursor(self.ids[2:4]),
+            FakeIdsCursor(self.ids[4:])]
+        self.update_many = AsyncMock(
+            side_effect=lambda q, u, **kw: Mock(
+                raw_result={'n': len(q['_id']['$in'])}))
+        self.collection.with_options.return_value.update_many = \
+            self.update_many
+
+    @async_test
+    async def test_update_chunk_size(self):
+        qs = QuerySet(self.test_doc, self.collection).filter(a='x')
+        r = await qs.update(chunk_size=2, set__a='y')
+
+        self.assertEqual(r, queryset.ChunkedWriteResult(5, self.ids[-1]))
+        queries = [c[0][0] for c in self.update_many.call_args_list]
+        self.assertEqual(queries[1],
+                         {'a': 'x', '_id': {'$in': self.ids[2:4]}})
+        find_query = self.collection.find.call_args_list[1][0][0]
+        self.assertEqual(find_query, {'a': 'x', '_id': {'$gt': self.ids[1]}})
+
+    @async_test
+    async def test_update_chunk_size_resume_after(self):
+        self.collection.find.side_effect = [FakeIdsCursor(self.ids[4:])]
+        qs = QuerySet(self.test_doc, self.collection)
+        r = await qs.update(chunk_size=2, resume_after=self.ids[3],
+                            set__a='y')
+
+        self.assertEqual(r, queryset.ChunkedWriteResult(1, self.ids[-1]))
+        find_query = self.collection.find.call_args[0][0]
+        self.assertEqual(find_query, {'_id': {'$gt': self.ids[3]}})
+
+    @async_test
+    async def test_update_chunk_size_throttle(self):
+        throttle = AsyncMock()
+        qs = QuerySet(self.test_doc, self.collection)
+        await qs.update(chunk_size=2, throttle=throttle, set__a='y')
+        self.assertEqual(throttle.await_count, 2)
+
+    @async_test
+    async def test_update_chunk_size_max_rate(self):
+        qs = QuerySet(self.test_doc, self.collection)
+        with patch.object(queryset.asyncio, 'sleep', AsyncMock()) as sleep:
+            await qs.update(chunk_size=2, max_rate=100, set__a='y')
+
+        self.assertEqual(sleep.await_count, 2)
+        self.assertLessEqual(sleep.call_args[0][0], 0.02)
+
+    @async_test
+    async def test_update_chunk_size_error(self):
+        self.update_many.side_effect = [
+            Mock(raw_result={'n': 2}), Exception('bad')]
+        qs = QuerySet(self.test_doc, self.collection)
+        with self.assertRaises(queryset.ChunkedWriteError) as cm:
+            await qs.update(chunk_size=2, set__a='y')
+
+        self.assertEqual(cm.exception.n, 2)
+        self.assertEqual(cm.exception.checkpoint, self.ids[1])
+
+    @async_test
+    async def test_update_chunk_size_throttle_error(self):
+        throttle = AsyncMock(side_effect=asyncio.TimeoutError)
+        qs = QuerySet(self.test_doc, self.collection)
+        with self.assertRaises(queryset.ChunkedWriteError) as cm:
+            await qs.update(chunk_size=2, throttle=throttle, set__a='y')
+
+        self.assertEqual(cm.exception.n, 2)
+        self.assertEqual(cm.exception.checkpoint, self.ids[1])
+        self.assertIsInstance(cm.exception.__cause__, asyncio.TimeoutError)
+
+    @async_test
+    async def test_update_chunk_size_upsert(self):
+        qs = QuerySet(self.test_doc, self.collection)
+        with self.assertRaises(OperationError):
+            await qs.update(chunk_size=2, upsert=True, set__a='y')
+
+    @async_test
+    async def test_delete_chunk_size(self):
+        self.collection.delete_many = AsyncMock(
+            side_effect=lambda q: Mock(deleted_count=len(q['_id']['$in'])))
+        qs = QuerySet(self.test_doc, self.collection)
+        r = await qs.delete(chunk_size=2)
+        self.assertEqual(r, queryset.ChunkedWriteResult(5, self.ids[-1]))
+        self.assertEqual(self.collection.delete_many.await_count, 3)
+
+    @async_test
+    async def test_delete_chunk_size_with_limit(self):
+        qs = QuerySet(self.test_doc, self.collection).limit(2)
+        with self.assertRaises(mongoengine.errors.InvalidQueryError):
+            await qs.delete(chunk_size=2)
+
+    @async_test
+    async def test_update_chunk_size_with_skip(self):
+        qs = QuerySet(self.test_doc, self.collection).skip(1)
+        with patch.object(QuerySet, '_iter_ids') as iter_ids:
+            with self.assertRaises(mongoengine.errors.InvalidQueryError):
+                await qs.update(chunk_size=2, set__a='y')
+        self.assertFalse(iter_ids.called)
+
+    @async_test
+    async def test_chunk_size_none(self):
+        qs = QuerySet(self.test_doc, self.collection).none()
+        r = await qs.update(chunk_size=2, set__a='y')
+        self.assertEqual(r, queryset.ChunkedWriteResult(0, None))
+        r = await qs.delete(chunk_size=2, resume_after=self.ids[0])
+        self.assertEqual(r, queryset.ChunkedWriteResult(0, self.ids[0]))
+        self.assertFalse(self.collection.find.called)
+        self.assertFalse(self.update_many.called)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+from unittest import TestCase
+from unittest.mock import patch, AsyncMock, Mock, MagicMock
+from mongomotor import Document, router, tenant, tenancy
+from mongomotor.fields import StringField
+from tests import async_test
+
+
+def resolver(tenant_id):
+    host = 'mongodb://{}.localhost:27017'.format(tenant_id[0])
+    return {'db': 'tenant-{}'.format(tenant_id), 'host': host}
+
+
+class RouterTest(TestCase):
+
+    def setUp(self):
+        self.router = tenancy.Router(resolver, max_clients=2)
+
+    @async_test
+    async def tearDown(self):
+        await self.router.close()
+
+    def test_get_db(self):
+        db = self.router.get_db('acme')
+        self.assertEqual(db.name, 'tenant-acme')
+
+    def test_share_client(self):
+        db = self.router.get_db('acme')
+        other = self.router.get_db('abc')
+        self.assertIs(db.client, other.client)
+        self.assertEqual(self.router.clients_count, 1)
+
+    @async_test
+    async def test_evict_clients(self):
+        self.router.get_db('acme')
+        self.router.get_db('bla')
+        self.router.get_db('cool')
+        self.assertEqual(self.router.clients_count, 2)
+
+    @async_test
+    async def test_evict_client_in_use(self):
+        db = self.router.get_db('acme')
+        client = db.client
+        client.close = AsyncMock()
+        _, _, usage = self.router._clients[next(iter(self.router._clients))]
+        # a command is running in the client.
+        usage.started(Mock())
+
+        self.router.get_db('bla')
+        self.router.get_db('cool')
+        await asyncio.sleep(0)
+        self.assertEqual(self.router.clients_count, 2)
+        self.assertFalse(client.close.called)
+
+        usage.succeeded(Mock())
+        await asyncio.gather(*self.router._closing)
+        self.assertTrue(client.close.called)
+
+    @async_test
+    async def test_evict_idle_clients(self):
+        self.router.idle_timeout = 0
+        self.router.get_db('acme')
+        self.router.get_db('bla')
+        self.assertEqual(self.router.clients_count, 0)
+
+    def test_max_tenants(self):
+        self.router.max_tenants = 1
+        self.router.get_db('acme')
+        self.router.get_db('abc')
+        self.assertEqual(list(self.router._tenants), ['abc'])
+
+    @patch.object(tenancy, 'get_db', Mock())
+    def test_get_db_alias(self):
+        r = tenancy.Router(lambda t: 'alias-{}'.format(t))
+        r.get_db('acme')
+        self.assertEqual(tenancy.get_db.call_args[0][0], 'alias-acme')
+
+    @patch.object(tenancy, 'get_connection', MagicMock())
+    def test_get_db_default_client(self):
+        r = tenancy.Router(lambda t: {'db': t})
+        r.get_db('acme')
+        self.assertTrue(tenancy.get_connection.called)
+        self.assertEqual(r.clients_count, 0)
+
+
+class TenantRoutingTest(TestCase):
+
+    def setUp(self):
+        class TenantDoc(Document):
+            a = StringField()
+
+        class SharedDoc(Document):
+            a = StringField()
+
+            meta = {'tenant_routing': False}
+
+        self.tenant_doc = TenantDoc
+        self.shared_doc = SharedDoc
+        self.router = router(resolver)
+
+    @async_test
+    async def tearDown(self):
+        router(None)
+        await self.router.close()
+
+    def test_tenant(self):
+        with tenant('acme'):
+            self.assertEqual(tenancy.current_tenant.get(), 'acme')
+
+        self.assertIsNone(tenancy.current_tenant.get())
+
+    def test_get_tenant_db_without_tenant(self):
+        self.assertIsNone(tenancy.get_tenant_db(self.tenant_doc))
+
+    def test_get_tenant_db_without_router(self):
+        router(None)
+        with tenant('acme'):
+            self.assertIsNone(tenancy.get_tenant_db(self.tenant_doc))
+
+    def test_get_tenant_db_without_routing(self):
+        with tenant('acme'):
+            self.assertIsNone(tenancy.get_tenant_db(self.shared_doc))
+
+    def test_document_collection(self):
+        with tenant('acme'):
+            collection = self.tenant_doc._get_collection()
+
+        self.assertEqual(collection.database.name, 'tenant-acme')
+        self.assertEqual(collection.name, 'tenant_doc')
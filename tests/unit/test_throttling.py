@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2025 Juca Crispim <juca@poraodojuca.dev>
+
+# This file is part of mongomotor.
+
+# mongomotor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# mongomotor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with mongomotor. If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+from unittest import TestCase
+from unittest.mock import AsyncMock, MagicMock, patch
+from pymongo.errors import OperationFailure
+from mongomotor import throttling
+from tests import async_test
+
+
+def _status(*lags):
+    now = datetime.datetime(2025, 1, 1)
+    members = [{'stateStr': 'PRIMARY', 'optimeDate': now}]
+    members += [{'stateStr': 'SECONDARY',
+                 'optimeDate': now - datetime.timedelta(seconds=lag)}
+                for lag in lags]
+    return {'members': members}
+
+
+class ReplicationLagThrottleTest(TestCase):
+
+    def setUp(self):
+        self.client = MagicMock()
+        patcher = patch.object(throttling, 'get_connection',
+                               return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @async_test
+    async def test_get_lag(self):
+        self.client.admin.command = AsyncMock(return_value=_status(1, 3))
+        throttle = throttling.ReplicationLagThrottle()
+        self.assertEqual(await throttle.get_lag(), 3)
+
+    @async_test
+    async def test_get_lag_no_replica_set(self):
+        self.client.admin.command = AsyncMock(
+            side_effect=OperationFailure('not running with --replSet'))
+        throttle = throttling.ReplicationLagThrottle()
+        self.assertEqual(await throttle.get_lag(), 0)
+
+    @async_test
+    async def test_call_waits_for_lag(self):
+        self.client.admin.command = AsyncMock(
+            side_effect=[_status(20), _status(5)])
+        throttle = throttling.ReplicationLagThrottle(max_lag=10,
+                                                     interval=0.01)
+        await throttle()
+        self.assertEqual(self.client.admin.command.await_count, 2)
+
+    @async_test
+    async def test_call_timeout(self):
+        self.client.admin.command = AsyncMock(return_value=_status(20))
+        throttle = throttling.ReplicationLagThrottle(
+            max_lag=10, interval=0.01, timeout=0.02)
+        with self.assertRaises(TimeoutError):
+            await throttle()
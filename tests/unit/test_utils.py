@@ -22,6 +22,7 @@ from unittest import TestCase
 from unittest.mock import Mock
 from mongoengine import connection
 from mongoengine.connection import disconnect
+from pymongo.read_preferences import ReadPreference, Secondary
 from mongomotor import utils
 
 
@@ -59,3 +60,36 @@ class ThreadingTest(TestCase):
 
     def test_is_main_thread_on_main(self):
         self.assertTrue(utils.is_main_thread())
+
+
+class GetReadPreferenceTest(TestCase):
+
+    def test_get_read_preference_none(self):
+        self.assertIsNone(utils.get_read_preference(None))
+
+    def test_get_read_preference_instance(self):
+        returned = utils.get_read_preference(ReadPreference.SECONDARY)
+        self.assertIs(returned, ReadPreference.SECONDARY)
+
+    def test_get_read_preference_name(self):
+        returned = utils.get_read_preference(
+            'secondaryPreferred', tag_sets=[{'dc': 'ny'}], max_staleness=90)
+        self.assertEqual(returned.mongos_mode, 'secondaryPreferred')
+        self.assertEqual(returned.tag_sets, [{'dc': 'ny'}])
+        self.assertEqual(returned.max_staleness, 90)
+
+    def test_get_read_preference_instance_with_tags(self):
+        returned = utils.get_read_preference(
+            Secondary(), tag_sets=[{'dc': 'ny'}])
+        self.assertEqual(returned.mongos_mode, 'secondary')
+        self.assertEqual(returned.tag_sets, [{'dc': 'ny'}])
+
+    def test_get_read_preference_dict(self):
+        returned = utils.get_read_preference(
+            {'mode': 'nearest', 'max_staleness': 120})
+        self.assertEqual(returned.mongos_mode, 'nearest')
+        self.assertEqual(returned.max_staleness, 120)
+
+    def test_get_read_preference_bad_name(self):
+        with self.assertRaises(ValueError):
+            utils.get_read_preference('bad')